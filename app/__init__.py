@@ -2,6 +2,10 @@ from flask import Flask, jsonify, request
 import os
 
 from app.extensions import db, migrate, jwt, cors, limiter, cache
+from app.admin_auth import init_admin_auth
+from app.instrumentation import init_query_counter
+from app.cli import register_cli
+from app.s3 import init_s3
 from app.routes.auth_routes import auth_bp
 from app.api import bp as api_bp
 from app.routes.demo_routes import bp as demo_bp
@@ -11,6 +15,8 @@ from app.routes.admin_routes import admin_bp
 def create_app():
     app = Flask(__name__)
     app.config.from_object('app.config.Config')
+    # Flask >= 2.3 ignores the JSON_AS_ASCII config key; apply it to the JSON provider
+    app.json.ensure_ascii = app.config.get('JSON_AS_ASCII', True)
 
     # Init extensions
     db.init_app(app)
@@ -34,6 +40,11 @@ def create_app():
     limiter.init_app(app, **limiter_kwargs)
     # Initialize cache (will pick RedisCache if configured)
     cache.init_app(app)
+    # Per-request SQL statement counter (X-Query-Count header when enabled)
+    init_query_counter(app)
+    init_admin_auth(app)
+    # Shared, pooled S3 client (only when S3_BUCKET is set)
+    init_s3(app)
 
     # Blueprints
     # API blueprint (v1 endpoints under /api/v1/... via the route definitions)
@@ -45,6 +56,9 @@ def create_app():
     # Admin login/dashboard
     app.register_blueprint(admin_bp)
 
+    # flask CLI commands (progress queue flusher, ...)
+    register_cli(app)
+
     # If using local sqlite, initialize the DB (create tables) automatically in dev
     try:
         db_uri = app.config.get('SQLALCHEMY_DATABASE_URI', '') or ''
@@ -135,23 +149,13 @@ def create_app():
         except Exception:
             return jsonify({"message": "Flask Learning Backend is running 🚀"})
 
-    # Serve uploaded files from UPLOAD_PATH in development
+    # Serve uploaded files from the storage backend (UPLOAD_PATH in development); Range / conditional GET and
+    # optional X-Accel-Redirect / X-Sendfile offload are handled in app/upload_serving.py
     @app.route('/uploads/<path:filename>')
     def uploaded_file(filename):
-        from flask import send_from_directory
-        up = app.config.get('UPLOAD_PATH', '/tmp/uploads')
-        # resolve relative upload paths relative to the application root
+        from app.upload_serving import serve_upload
         try:
-            if not os.path.isabs(up):
-                resolved_up = os.path.join(app.root_path, up)
-            else:
-                resolved_up = up
-            # safety: ensure the directory exists and file is present
-            fp = os.path.join(resolved_up, filename)
-            if not os.path.exists(fp):
-                app.logger.debug('Uploaded file not found on disk: %s (resolved path: %s)', filename, fp)
-                return jsonify({'success': False, 'error': 'file not found', 'code': 404}), 404
-            return send_from_directory(resolved_up, filename)
+            return serve_upload(filename)
         except Exception as e:
             app.logger.exception('Failed to serve uploaded file')
             return jsonify({'success': False, 'error': 'file not found', 'code': 404}), 404
@@ -172,4 +176,13 @@ def create_app():
             app.logger.exception('Failed to return debug config')
             return jsonify({'error': 'failed to read config'}), 500
 
+    # Debug helper: per-tier hit/miss counters when the two-tier cache is active
+    @app.route('/__debug/cache')
+    def debug_cache():
+        if not app.debug:
+            return jsonify({'error': 'debug only'}), 403
+        backend = cache.cache
+        stats = backend.get_stats() if hasattr(backend, 'get_stats') else None
+        return jsonify({'CACHE_TYPE': app.config.get('CACHE_TYPE'), 'stats': stats})
+
     return app
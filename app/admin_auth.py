@@ -0,0 +1,147 @@
+"""Session-based authentication for the admin UI (``/admin``).
+
+``current_admin()`` resolves ``session['admin_user_id']`` to a principal once per
+request (kept on ``flask.g``, so handlers that call each other share it) and
+caches it across requests for ADMIN_PRINCIPAL_CACHE_TIMEOUT seconds, so admin
+pages do not repeat ``User.query.get`` and the role check on every hit.
+The cached entry is dropped on logout and after any ORM commit that updates or
+deletes the user (role changes included); ``0`` turns the cross-request cache off.
+
+Limits: the invalidation is a cache delete, so it only reaches every worker when
+the cache is shared (Redis, TieredCache, ...). With a per-process cache
+(SimpleCache, the default) the cross-request cache is therefore off unless
+ADMIN_PRINCIPAL_CACHE_TIMEOUT is set explicitly. Role changes made with a bulk
+``Query.update()`` or raw SQL fire no ORM events: they take effect once the
+entry expires.
+
+The ``dev_admin`` session sentinel (admin/admin or DEV_FORCE_ADMIN=1 logins)
+never touches the database or the cache.
+"""
+from functools import wraps
+from types import SimpleNamespace
+
+from cachelib import NullCache, SimpleCache
+from flask import current_app, g, has_app_context, has_request_context, redirect, session, url_for
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .extensions import cache, db
+from .models import User
+
+DEV_ADMIN_ID = 'dev_admin'
+_STALE_KEY = 'admin_principals_stale'
+
+
+def principal_key(uid):
+    return f"admin_principal:{uid}"
+
+
+def _dev_admin():
+    return SimpleNamespace(id=DEV_ADMIN_ID, role='admin', name='Dev Admin', email='dev@local')
+
+
+def principal_cache_timeout():
+    """Seconds a principal is cached across requests; 0 when the cache is not shared by the workers."""
+    timeout = current_app.config.get('ADMIN_PRINCIPAL_CACHE_TIMEOUT')
+    if timeout is not None:
+        return timeout
+    # a per-process cache would keep a demoted admin alive in every worker but the one that committed
+    return 0 if isinstance(cache.cache, (SimpleCache, NullCache)) else 30
+
+
+def _load_principal(uid):
+    timeout = principal_cache_timeout()
+    data = cache.get(principal_key(uid)) if timeout else None
+    if data is None:
+        user = db.session.get(User, uid)
+        if user is None:
+            return None
+        # only what the admin templates and role check need; non-admins are cached too so they are rejected cheaply
+        data = {"id": user.id, "role": user.role, "email": user.email, "name": getattr(user, 'name', None)}
+        if timeout:
+            cache.set(principal_key(uid), data, timeout=timeout)
+    return SimpleNamespace(**data)
+
+
+def current_admin():
+    """The logged-in admin principal, or None (no session, unknown user or not an admin)."""
+    if 'admin_principal' in g:
+        return g.admin_principal
+    uid = session.get('admin_user_id')
+    principal = None
+    if uid == DEV_ADMIN_ID:
+        principal = _dev_admin()
+    elif uid:
+        loaded = _load_principal(uid)
+        if loaded is not None and loaded.role == 'admin':
+            principal = loaded
+    g.admin_principal = principal
+    return principal
+
+
+def invalidate_admin_principal(uid):
+    if uid and uid != DEV_ADMIN_ID:
+        cache.delete(principal_key(uid))
+    if has_request_context():
+        g.pop('admin_principal', None)
+
+
+def init_admin_auth(app):
+    @app.before_request
+    def _reset_admin_principal():
+        # g can outlive a request (e.g. an app context pushed around several test requests)
+        g.pop('admin_principal', None)
+
+
+def _reject():
+    # a stale or non-admin session is cleared, as the admin pages always did
+    had_session = bool(session.pop('admin_user_id', None))
+    g.pop('admin_principal', None)
+    return had_session
+
+
+def admin_required(fn):
+    """Admin pages and form posts: redirect to the login page unless an admin is logged in."""
+    @wraps(fn)
+    def decorated_function(*args, **kwargs):
+        if current_admin() is None:
+            _reject()
+            return redirect(url_for('admin_bp.admin_login_get'))
+        return fn(*args, **kwargs)
+    return decorated_function
+
+
+def admin_api_required(fn):
+    """Admin JSON endpoints: 401 without a session, 403 for a non-admin one."""
+    @wraps(fn)
+    def decorated_function(*args, **kwargs):
+        if current_admin() is None:
+            if _reject():
+                return {"success": False, "error": "forbidden", "code": 403}, 403
+            return {"success": False, "error": "admin login required", "code": 401}, 401
+        return fn(*args, **kwargs)
+    return decorated_function
+
+
+def _mark_stale(mapper, connection, target):
+    sess = object_session(target)
+    if sess is not None and target.id is not None:
+        sess.info.setdefault(_STALE_KEY, set()).add(target.id)
+
+
+event.listen(User, 'after_update', _mark_stale)
+event.listen(User, 'after_delete', _mark_stale)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_stale_principals(sess):
+    # only once the change is committed, so a concurrent request cannot re-cache the old role
+    stale = sess.info.pop(_STALE_KEY, None)
+    if stale and has_app_context():
+        for uid in stale:
+            invalidate_admin_principal(uid)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_stale_principals(sess):
+    sess.info.pop(_STALE_KEY, None)
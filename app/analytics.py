@@ -0,0 +1,210 @@
+"""Course analytics computed with NumPy over progress rows.
+
+Progress for a course is loaded in primary-key chunks straight into column
+arrays (no ORM objects) and every aggregate is computed with array operations:
+
+* per-lesson score percentiles and means,
+* the completion funnel across the course's lessons (in lesson order),
+* time-on-task histograms (course-wide and per lesson),
+* weekly cohort retention (cohort = week of a user's first attempt).
+
+Results are cached per course under a key that includes the newest progress id
+for the course's lessons, so new progress (or a lesson added/removed) makes the
+next request recompute instead of serving stale numbers.
+
+numpy is optional; ``available()`` is False without it.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from .extensions import db, cache
+from .models import Lesson, Progress
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PERCENTILES = (10, 25, 50, 75, 90)
+# time_spent histogram edges in seconds; the last bucket is open-ended
+TIME_BINS = (0, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+WEEK = 7 * 24 * 3600
+# the epoch was a Thursday: shift so cohort weeks start on Monday
+WEEK_OFFSET = 3 * 24 * 3600
+
+
+def available():
+    return np is not None
+
+
+def _course_lessons(course_id):
+    rows = Lesson.query.with_entities(Lesson.id, Lesson.title).filter_by(course_id=course_id).order_by(Lesson.created_at.asc(), Lesson.id.asc()).all()
+    return [r.id for r in rows], [r.title for r in rows]
+
+
+def load_progress_arrays(lesson_ids, chunk_size=None):
+    """Return dict of column arrays (user_id, lesson_id, score, time_spent, ts) for ``lesson_ids``.
+
+    Missing scores / times are NaN; ``ts`` is seconds since the epoch.
+    """
+    chunk_size = chunk_size or current_app.config.get('ANALYTICS_CHUNK_SIZE', 50000)
+    parts = {k: [] for k in ('user_id', 'lesson_id', 'score', 'time_spent', 'ts')}
+    last_id = 0
+    while lesson_ids:
+        stmt = (
+            select(Progress.id, Progress.user_id, Progress.lesson_id, Progress.score, Progress.time_spent, Progress.created_at)
+            .where(Progress.lesson_id.in_(lesson_ids), Progress.id > last_id)
+            .order_by(Progress.id).limit(chunk_size)
+        )
+        rows = db.session.execute(stmt.execution_options(stream_results=True)).all()
+        if not rows:
+            break
+        ids, users, lessons, scores, times, created = zip(*rows)
+        last_id = ids[-1]
+        parts['user_id'].append(np.array(users, dtype=np.int64))
+        parts['lesson_id'].append(np.array(lessons, dtype=np.int64))
+        # None -> NaN
+        parts['score'].append(np.array(scores, dtype=np.float64))
+        parts['time_spent'].append(np.array(times, dtype=np.float64))
+        parts['ts'].append(np.array(created, dtype='datetime64[s]').astype(np.int64))
+        if len(rows) < chunk_size:
+            break
+    empty = {'user_id': np.int64, 'lesson_id': np.int64, 'score': np.float64, 'time_spent': np.float64, 'ts': np.int64}
+    return {k: np.concatenate(v) if v else np.array([], dtype=empty[k]) for k, v in parts.items()}
+
+
+def _nan_to_none(values):
+    return [None if v != v else round(float(v), 4) for v in values]
+
+
+def score_percentiles(lesson_idx, scores, n_lessons, percentiles=PERCENTILES):
+    """(n_lessons, len(percentiles)) linear-interpolated percentiles plus per-lesson mean and count."""
+    valid = ~np.isnan(scores)
+    li, sc = lesson_idx[valid], scores[valid]
+    # two stable sorts (by score, then by lesson) beat np.lexsort on large inputs
+    order = np.argsort(sc, kind='stable')
+    order = order[np.argsort(li[order], kind='stable')]
+    li, sc = li[order], sc[order]
+    counts = np.bincount(li, minlength=n_lessons)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    q = np.asarray(percentiles, dtype=np.float64) / 100.0
+    result = np.full((n_lessons, len(q)), np.nan)
+    has = counts > 0
+    if sc.size:
+        pos = starts[has, None] + (counts[has, None] - 1) * q[None, :]
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        frac = pos - lo
+        result[has] = sc[lo] * (1 - frac) + sc[hi] * frac
+    sums = np.bincount(li, weights=sc, minlength=n_lessons)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(has, sums / np.maximum(counts, 1), np.nan)
+    return result, means, counts
+
+
+def completion_funnel(user_idx, lesson_idx, n_users, n_lessons):
+    """Users who attempted each lesson, and users who attempted it *and every earlier lesson*."""
+    done = np.zeros((n_users, n_lessons), dtype=bool)
+    done[user_idx, lesson_idx] = True
+    reached = np.logical_and.accumulate(done, axis=1)
+    return done.sum(axis=0), reached.sum(axis=0)
+
+
+def time_histograms(lesson_idx, times, n_lessons, edges=TIME_BINS):
+    """Counts per time bucket, course-wide and per lesson (one bincount over lesson x bucket)."""
+    valid = ~np.isnan(times)
+    buckets = np.digitize(times[valid], edges[1:])  # 0 .. len(edges)-1
+    n_bins = len(edges)
+    per_lesson = np.bincount(lesson_idx[valid] * n_bins + buckets, minlength=n_lessons * n_bins).reshape(n_lessons, n_bins)
+    return per_lesson.sum(axis=0), per_lesson
+
+
+def weekly_retention(user_idx, ts, n_users):
+    """Cohorts by week of first attempt: [(cohort_week_start_ts, size, [active users in week +0, +1, ...])]."""
+    if not ts.size:
+        return []
+    week = (ts + WEEK_OFFSET) // WEEK
+    first = np.full(n_users, week.max(), dtype=np.int64)
+    np.minimum.at(first, user_idx, week)
+    offset = week - first[user_idx]
+    span = int(offset.max()) + 1
+    # one count per (user, week offset) however many attempts the user made that week;
+    # a presence mask is far cheaper than np.unique's sort while it stays reasonably small
+    codes = user_idx * span + offset
+    if n_users * span <= 64 * 1024 * 1024:
+        seen = np.zeros(n_users * span, dtype=bool)
+        seen[codes] = True
+        pairs = np.flatnonzero(seen)
+    else:
+        pairs = np.unique(codes)
+    pair_users, pair_offsets = pairs // span, pairs % span
+    cohorts, cohort_of_user = np.unique(first, return_inverse=True)
+    counts = np.bincount(cohort_of_user[pair_users] * span + pair_offsets, minlength=cohorts.size * span).reshape(cohorts.size, span)
+    result = []
+    for c, cohort_week in enumerate(cohorts):
+        # a cohort can only have been observed up to the newest week in the data
+        observed = int(week.max() - cohort_week) + 1
+        result.append((int(cohort_week) * WEEK - WEEK_OFFSET, int(counts[c, 0]), counts[c, :observed].tolist()))
+    return result
+
+
+def compute_course_analytics(course_id, lessons=None):
+    lesson_ids, titles = lessons or _course_lessons(course_id)
+    data = load_progress_arrays(lesson_ids)
+    n_lessons = len(lesson_ids)
+    # map lesson ids to their position in course order
+    order = np.argsort(np.asarray(lesson_ids, dtype=np.int64)) if n_lessons else np.array([], dtype=np.int64)
+    sorted_ids = np.asarray(lesson_ids, dtype=np.int64)[order] if n_lessons else np.array([], dtype=np.int64)
+    lesson_idx = order[np.searchsorted(sorted_ids, data['lesson_id'])] if data['lesson_id'].size else np.array([], dtype=np.int64)
+    users, user_idx = np.unique(data['user_id'], return_inverse=True)
+
+    pct, means, score_counts = score_percentiles(lesson_idx, data['score'], n_lessons)
+    attempted, reached = completion_funnel(user_idx, lesson_idx, users.size, n_lessons)
+    course_hist, lesson_hist = time_histograms(lesson_idx, data['time_spent'], n_lessons)
+    attempts = np.bincount(lesson_idx, minlength=n_lessons)
+
+    bucket_labels = [f"{lo}-{hi}" for lo, hi in zip(TIME_BINS, TIME_BINS[1:])] + [f"{TIME_BINS[-1]}+"]
+    return {
+        "course_id": course_id,
+        "users": int(users.size),
+        "attempts": int(data['user_id'].size),
+        "lessons": [
+            {
+                "lesson_id": lesson_id,
+                "title": titles[i],
+                "attempts": int(attempts[i]),
+                "scored_attempts": int(score_counts[i]),
+                "mean_score": _nan_to_none([means[i]])[0],
+                "score_percentiles": dict(zip((f"p{p}" for p in PERCENTILES), _nan_to_none(pct[i]))),
+                "users_attempted": int(attempted[i]),
+                "users_reached": int(reached[i]),
+                "time_histogram": lesson_hist[i].tolist(),
+            }
+            for i, lesson_id in enumerate(lesson_ids)
+        ],
+        "time_histogram": {"buckets_seconds": bucket_labels, "counts": course_hist.tolist()},
+        "retention": [
+            {"cohort_week": datetime.fromtimestamp(start, tz=timezone.utc).date().isoformat(), "size": size, "active_by_week": active}
+            for start, size, active in weekly_retention(user_idx, data['ts'], users.size)
+        ],
+    }
+
+
+def _cache_key(course_id, lesson_ids):
+    newest = db.session.query(func.max(Progress.id)).filter(Progress.lesson_id.in_(lesson_ids)).scalar() if lesson_ids else 0
+    lessons_digest = hashlib.sha1(','.join(map(str, lesson_ids)).encode('ascii')).hexdigest()[:12]
+    return f"analytics:course:{course_id}:{lessons_digest}:p{newest or 0}"
+
+
+def course_analytics(course_id):
+    """Cached analytics for a course; recomputed once new progress arrives for its lessons."""
+    lessons = _course_lessons(course_id)
+    key = _cache_key(course_id, lessons[0])
+    result = cache.get(key)
+    if result is None:
+        result = compute_course_analytics(course_id, lessons)
+        cache.set(key, result, timeout=current_app.config.get('ANALYTICS_CACHE_TIMEOUT', 3600))
+    return result
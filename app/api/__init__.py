@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint("api", __name__)
 
-from . import courses, lessons, lessons_write, content, uploads, progress  # noqa: E402,F401
+from . import courses, lessons, lessons_write, content, uploads, progress, analytics  # noqa: E402,F401
@@ -0,0 +1,14 @@
+from ..models import Course
+from ..decorators import require_roles
+from .. import analytics
+from . import bp
+
+
+@bp.route("/courses/<int:id>/analytics", methods=["GET"])
+@require_roles("teacher", "admin")
+def get_course_analytics(id):
+    """Score percentiles, completion funnel, time-on-task and weekly retention for a course."""
+    if not analytics.available():
+        return {"success": False, "error": "analytics requires numpy", "code": 501}, 501
+    Course.query.with_entities(Course.id).filter_by(id=id).first_or_404()
+    return {"success": True, "data": analytics.course_analytics(id)}
@@ -1,23 +1,278 @@
-from flask import current_app
+import gzip
+import hashlib
+import json
+import time
+from flask import current_app, request, jsonify
 from ..models import Lesson
 from ..extensions import cache
+from ..singleflight import get_or_build, make_entry, unwrap
 from . import bp
 
+try:
+    # brotli is optional; without it only gzip variants can be stored
+    import brotli
+except ImportError:
+    brotli = None
+
 
 def cache_key(lesson_id, version):
     return f"lesson_content:{lesson_id}:v{version}"
 
 
+def version_key(lesson_id):
+    return f"lesson_version:{lesson_id}"
+
+
+def content_etag(lesson_id, version):
+    # strong validator: the body for a given (lesson, content_version) never changes
+    return f"lesson-{lesson_id}-v{version}"
+
+
+def remember_content_version(lesson_id, version):
+    """Record the current content_version of a lesson in the cache-backed version index.
+
+    Call after committing any write that touches a lesson so warm reads keep skipping the DB.
+    """
+    cache.set(version_key(lesson_id), version or 1)
+
+
+def forget_content_version(lesson_id):
+    cache.delete(version_key(lesson_id))
+
+
+def current_content_version(lesson_id):
+    """Return the lesson's content_version, consulting the DB only when the index is cold.
+
+    Aborts with 404 when the lesson does not exist.
+    """
+    version = cache.get(version_key(lesson_id))
+    if version is None:
+        row = Lesson.query.with_entities(Lesson.content_version).filter_by(id=lesson_id).first_or_404()
+        version = row.content_version or 1
+        remember_content_version(lesson_id, version)
+    return version
+
+
+def content_payload(content_json):
+    return {"content_json": content_json, "schema_version": (content_json or {}).get("schema_version")}
+
+
+def load_content_payload(lesson_id):
+    content_json = Lesson.query.with_entities(Lesson.content_json).filter_by(id=lesson_id).scalar()
+    return content_payload(content_json)
+
+
+# Compressors for pre-encoded response variants (CONTENT_CACHE_ENCODINGS)
+_COMPRESSORS = {'gzip': lambda body: gzip.compress(body, compresslevel=6)}
+if brotli is not None:
+    _COMPRESSORS['br'] = lambda body: brotli.compress(body)
+
+
+def _content_encodings():
+    raw = current_app.config.get('CONTENT_CACHE_ENCODINGS') or ''
+    return [e.strip() for e in raw.split(',') if e.strip() in _COMPRESSORS]
+
+
+def encode_payload(payload):
+    """Serialize a content payload to the UTF-8 bytes that are sent on the wire."""
+    # the app's JSON provider setting (JSON_AS_ASCII is ignored since Flask 2.3), so the bytes match jsonify
+    ensure_ascii = current_app.json.ensure_ascii
+    return json.dumps(payload, ensure_ascii=ensure_ascii, separators=(',', ':')).encode('utf-8')
+
+
+def _encode_with_variants(key, payload, encodings):
+    """Return the encoded body for ``key`` plus its pre-compressed variants (keyed for the cache)."""
+    data_bytes = encode_payload(payload)
+    # the compressed variants are only ever served on hits, so they carry cached=true
+    hit_body = _envelope(data_bytes, True)
+    return data_bytes, {f"{key}:{enc}": _COMPRESSORS[enc](hit_body) for enc in encodings}
+
+
+def _envelope(data_bytes, cached):
+    # splice the cached data bytes into the standard response envelope without re-encoding them
+    tail = b',"cached":true}' if cached else b',"cached":false}'
+    return b'{"success":true,"data":' + data_bytes + tail
+
+
+def _matching_etag(etag, encodings=()):
+    """Return whichever representation's ETag the client already holds, if any."""
+    for candidate in [etag] + [f"{etag}-{enc}" for enc in encodings]:
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def _with_cache_headers(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = current_app.config.get('CONTENT_CACHE_CONTROL', 'no-cache')
+    return response
+
+
+def _previous_key(lesson_id, version, suffix=''):
+    # while version n is being rebuilt, version n-1 (if still cached) can be served instead
+    return [cache_key(lesson_id, version - 1) + suffix] if version > 1 else []
+
+
+def _serve_bytes(lesson_id, version, etag):
+    """CONTENT_CACHE_MODE=bytes: cache the encoded body (and compressed variants) instead of the dict."""
+    key = cache_key(lesson_id, version)
+    encodings = _content_encodings()
+    encoding = request.accept_encodings.best_match(encodings) if encodings else None
+
+    if encoding:
+        body = cache.get(f"{key}:{encoding}")
+        if body is not None:
+            current_app.logger.debug(f"cache hit {key}:{encoding}")
+            resp = current_app.response_class(body, mimetype='application/json')
+            resp.headers['Content-Encoding'] = encoding
+            resp.vary.add('Accept-Encoding')
+            return _with_cache_headers(resp, f"{etag}-{encoding}")
+
+    def build():
+        data_bytes, variants = _encode_with_variants(key, load_content_payload(lesson_id), encodings)
+        current_app.logger.debug(f"cache set {key}:json (+{len(variants)} encoded variants)")
+        return data_bytes, variants
+
+    data_bytes, state, served = get_or_build(f"{key}:json", build, _previous_key(lesson_id, version, ':json'))
+    if state == 'stale':
+        etag = content_etag(lesson_id, version - 1)
+    resp = current_app.response_class(_envelope(data_bytes, state != 'miss'), mimetype='application/json')
+    if encodings:
+        resp.vary.add('Accept-Encoding')
+    return _with_cache_headers(resp, etag)
+
+
 @bp.route("/content/<int:lesson_id>", methods=["GET"])
 def get_content(lesson_id):
-    lesson = Lesson.query.filter_by(id=lesson_id).first_or_404()
-    key = cache_key(lesson_id, lesson.content_version)
-    cached = cache.get(key)
-    if cached:
-        # indicate cache hit (in logs)
-        current_app.logger.debug(f"cache hit {key}")
-        return {"success": True, "data": cached, "cached": True}
-    payload = {"content_json": lesson.content_json, "schema_version": (lesson.content_json or {}).get("schema_version")}
-    cache.set(key, payload)
-    current_app.logger.debug(f"cache set {key}")
-    return {"success": True, "data": payload, "cached": False}
+    version = current_content_version(lesson_id)
+    etag = content_etag(lesson_id, version)
+    bytes_mode = current_app.config.get('CONTENT_CACHE_MODE') == 'bytes'
+    held = _matching_etag(etag, _content_encodings() if bytes_mode else ())
+    if held:
+        # client already holds this version: answer without touching the JSON column
+        return _with_cache_headers(current_app.response_class(status=304), held)
+
+    if bytes_mode:
+        return _serve_bytes(lesson_id, version, etag)
+
+    key = cache_key(lesson_id, version)
+    payload, state, served = get_or_build(key, lambda: (load_content_payload(lesson_id), None), _previous_key(lesson_id, version))
+    # indicate cache hit/miss (in logs)
+    current_app.logger.debug(f"cache {state} {served}")
+    if state == 'stale':
+        # another worker is rebuilding this version; hand out the previous one meanwhile
+        etag = content_etag(lesson_id, version - 1)
+    return _with_cache_headers(jsonify({"success": True, "data": payload, "cached": state != 'miss'}), etag)
+
+
+def _parse_ids(raw):
+    ids = []
+    for part in (raw or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        lesson_id = int(part)  # ValueError handled by the caller
+        if lesson_id not in ids:
+            ids.append(lesson_id)
+    return ids
+
+
+def _batch_versions(ids):
+    """Map each existing lesson id to its content_version: one get_many, plus one query for cold ids."""
+    versions = dict(zip(ids, cache.get_many(*[version_key(i) for i in ids])))
+    cold = [i for i, v in versions.items() if v is None]
+    if cold:
+        rows = Lesson.query.with_entities(Lesson.id, Lesson.content_version).filter(Lesson.id.in_(cold)).all()
+        found = {r.id: r.content_version or 1 for r in rows}
+        if found:
+            cache.set_many({version_key(i): v for i, v in found.items()})
+        versions.update(found)
+    return {i: v for i, v in versions.items() if v is not None}
+
+
+def _batch_response(versions, missing):
+    """Build the batch body for ``versions`` (ordered lesson id -> content_version).
+
+    All cached entries are fetched with one get_many; misses are loaded with a single
+    IN (...) query and written back with one set_many.
+    """
+    bytes_mode = current_app.config.get('CONTENT_CACHE_MODE') == 'bytes'
+    encodings = _content_encodings() if bytes_mode else []
+    suffix = ':json' if bytes_mode else ''
+    keys = {i: cache_key(i, v) for i, v in versions.items()}
+    found = {}
+    for lesson_id, raw in zip(keys, cache.get_many(*[k + suffix for k in keys.values()])):
+        if raw is not None:
+            found[lesson_id] = (unwrap(raw).value, True)
+
+    misses = [i for i in keys if i not in found]
+    if misses:
+        started = time.time()
+        rows = Lesson.query.with_entities(Lesson.id, Lesson.content_json).filter(Lesson.id.in_(misses)).all()
+        delta = (time.time() - started) / len(misses)
+        to_cache = {}
+        for row in rows:
+            payload = content_payload(row.content_json)
+            if bytes_mode:
+                value, variants = _encode_with_variants(keys[row.id], payload, encodings)
+                to_cache.update(variants)
+            else:
+                value = payload
+            to_cache[keys[row.id] + suffix] = make_entry(value, delta)
+            found[row.id] = (value, False)
+        if to_cache:
+            cache.set_many(to_cache, timeout=current_app.config.get('CACHE_DEFAULT_TIMEOUT') or None)
+            current_app.logger.debug(f"cache set_many {len(to_cache)} content keys")
+
+    # ids whose row vanished between the version lookup and the content load
+    missing = list(missing) + [i for i in versions if i not in found]
+    items = [(i, versions[i]) + found[i] for i in versions if i in found]
+    if bytes_mode:
+        parts = [
+            b'{"id":%d,"content_version":%d,"cached":%s,"data":' % (i, v, b'true' if cached else b'false') + value + b'}'
+            for i, v, value, cached in items
+        ]
+        body = b'{"success":true,"data":[' + b','.join(parts) + b'],"missing":' + json.dumps(missing).encode('utf-8') + b'}'
+        return current_app.response_class(body, mimetype='application/json')
+    data = [{"id": i, "content_version": v, "cached": cached, "data": value} for i, v, value, cached in items]
+    return jsonify({"success": True, "data": data, "missing": missing})
+
+
+def _batch_etag(versions):
+    digest = hashlib.sha1(','.join(f"{i}:{v}" for i, v in versions.items()).encode('ascii')).hexdigest()
+    return f"lessons-{digest[:20]}"
+
+
+def _serve_batch(versions, missing):
+    etag = _batch_etag(versions)
+    if request.if_none_match.contains(etag):
+        return _with_cache_headers(current_app.response_class(status=304), etag)
+    return _with_cache_headers(_batch_response(versions, missing), etag)
+
+
+@bp.route("/content", methods=["GET"])
+def get_content_batch():
+    """Content for many lessons in one round-trip: GET /content?ids=1,2,3"""
+    try:
+        ids = _parse_ids(request.args.get("ids"))
+    except ValueError:
+        return {"success": False, "error": "ids must be a comma-separated list of integers", "code": 400}, 400
+    if not ids:
+        return {"success": False, "error": "ids required", "code": 400}, 400
+    max_ids = current_app.config.get('CONTENT_BATCH_MAX', 100)
+    if len(ids) > max_ids:
+        return {"success": False, "error": f"at most {max_ids} ids per request", "code": 400}, 400
+    versions = _batch_versions(ids)
+    ordered = {i: versions[i] for i in ids if i in versions}
+    return _serve_batch(ordered, [i for i in ids if i not in versions])
+
+
+@bp.route("/courses/<int:id>/content", methods=["GET"])
+def get_course_content(id):
+    """Content for every lesson of a course (course preloading / offline download)."""
+    rows = Lesson.query.with_entities(Lesson.id, Lesson.content_version).filter_by(course_id=id).order_by(Lesson.created_at.asc()).all()
+    versions = {r.id: r.content_version or 1 for r in rows}
+    if versions:
+        # the listing already told us every version: refresh the index for single reads too
+        cache.set_many({version_key(i): v for i, v in versions.items()})
+    return _serve_batch(versions, [])
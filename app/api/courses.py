@@ -1,8 +1,242 @@
+import base64
+import json
+import time
+from datetime import datetime
 from flask import request, jsonify, current_app
-from ..models import Course, Lesson
-from ..extensions import db
+from sqlalchemy import and_, or_, func, literal
+from ..models import Asset, Course, Lesson
+from ..extensions import db, cache
+from ..derivatives import pick_variant, srcset
+from ..search import search_course_ids
 from . import bp
 
+CATALOG_GENERATION_KEY = "courses:generation"
+
+
+def catalog_generation():
+    """Token that changes on every course write; cached catalog aggregates are keyed by it."""
+    gen = cache.get(CATALOG_GENERATION_KEY)
+    if gen is None:
+        # unknown (evicted or never set): start a fresh generation so old aggregates are not reused
+        gen = time.time_ns()
+        cache.set(CATALOG_GENERATION_KEY, gen, timeout=0)
+    return gen
+
+
+def invalidate_course_listing():
+    """Retire cached catalog aggregates; call after committing a course write."""
+    cache.set(CATALOG_GENERATION_KEY, time.time_ns(), timeout=0)
+
+
+def encode_cursor(*values):
+    """Opaque cursor for the sort values of the last row of a page (datetimes as ISO strings)."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, types=(datetime, int), nullable=False):
+    """Return the values of an opaque cursor as ``types`` (default (created_at, id)); raises ValueError when malformed.
+
+    With ``nullable`` the first value may be None (a cursor inside the NULL tier of the sort column).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(types):
+            raise ValueError
+        if nullable and values[0] is None:
+            return (None,) + tuple(t(v) for t, v in zip(types[1:], values[1:]))
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v) for t, v in zip(types, values))
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def _approximate_count(q, filter_key=''):
+    """COUNT(*) for the filtered catalog, cached briefly so it is not recomputed on every page."""
+    key = f"courses:count:g{catalog_generation()}:{filter_key}"
+    total = cache.get(key)
+    if total is None:
+        total = q.order_by(None).count()
+        cache.set(key, total, timeout=current_app.config.get('COURSE_COUNT_CACHE_TIMEOUT', 60))
+    return total
+
+
+def _list_courses_cursor(q, limit, filter_key):
+    """Keyset pagination over (created_at, id) descending; no OFFSET and no COUNT by default."""
+    page_q = q
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            created_at, last_id = decode_cursor(cursor)
+        except ValueError:
+            return {"success": False, "error": "invalid cursor", "code": 400}, 400
+        page_q = q.filter(or_(Course.created_at < created_at, and_(Course.created_at == created_at, Course.id < last_id)))
+    # (created_at, id) is served by ix_courses_created_at: InnoDB secondary indexes carry the PK
+    rows = page_q.order_by(Course.created_at.desc(), Course.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    thumb = _thumbnail_request()
+    data = [_course_item(c, thumb) for c in rows]
+    meta = {"limit": limit, "has_more": has_more, "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None}
+    if request.args.get("with_total") in ("1", "true"):
+        meta["total"] = _approximate_count(q, filter_key)
+        meta["total_approximate"] = True
+    return {"success": True, "data": data, "meta": meta}
+
+
+def _course_query():
+    # select only required columns (optimization); the thumbnail's variants come from the same query
+    return Course.query.with_entities(
+        Course.id, Course.title, Course.description, Course.created_at,
+        Course.category, Course.class_name, Course.difficulty, Course.stream, Course.price,
+        Course.thumbnail_url, Asset.variants.label('thumbnail_variants'),
+    ).outerjoin(Asset, Asset.id == Course.thumbnail_asset_id)
+
+
+def _thumbnail_request():
+    """(width, format) of the catalog thumbnail: ?thumb_width= / ?thumb_format=, defaults from config."""
+    try:
+        width = int(request.args.get('thumb_width') or current_app.config.get('CATALOG_THUMBNAIL_WIDTH', 320))
+    except ValueError:
+        width = current_app.config.get('CATALOG_THUMBNAIL_WIDTH', 320)
+    fmt = request.args.get('thumb_format') or current_app.config.get('CATALOG_THUMBNAIL_FORMAT', 'webp')
+    return width, fmt if fmt in ('webp', 'jpeg') else 'webp'
+
+
+def _course_item(c, thumb=None):
+    item = {
+        "id": c.id, "title": c.title, "description": c.description, "created_at": c.created_at.isoformat(),
+        "category": c.category, "class_name": c.class_name, "difficulty": c.difficulty, "stream": c.stream, "price": c.price,
+    }
+    width, fmt = thumb or _thumbnail_request()
+    # the smallest variant covering the requested width; the original until variants exist
+    item["thumbnail_url"] = pick_variant(c.thumbnail_variants, width, fmt) or c.thumbnail_url
+    item["thumbnail_srcset"] = srcset(c.thumbnail_variants, fmt)
+    return item
+
+
+# facet dimensions kept in the cached aggregate (all indexed or low-cardinality columns)
+FACET_DIMENSIONS = ('category', 'class_name', 'difficulty', 'stream', 'published')
+FACETS_RETURNED = ('category', 'difficulty', 'class_name')
+DIFFICULTIES = ('beginner', 'intermediate', 'advanced')
+
+
+def _parse_bool(value):
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(value)
+
+
+def parse_course_filters(args):
+    """Read catalog filters from query args. Raises ValueError with a client-facing message."""
+    filters = {}
+    for name in ('category', 'stream'):
+        if args.get(name):
+            filters[name] = args.get(name)
+    class_name = args.get('class_name') or args.get('class')
+    if class_name:
+        filters['class_name'] = class_name
+    if args.get('difficulty'):
+        if args.get('difficulty') not in DIFFICULTIES:
+            raise ValueError(f"difficulty must be one of {', '.join(DIFFICULTIES)}")
+        filters['difficulty'] = args.get('difficulty')
+    if args.get('published'):
+        try:
+            filters['published'] = _parse_bool(args.get('published'))
+        except ValueError:
+            raise ValueError('published must be true or false')
+    for name in ('min_price', 'max_price'):
+        if args.get(name):
+            try:
+                filters[name] = int(args.get(name))
+            except ValueError:
+                raise ValueError(f'{name} must be an integer')
+    if args.get('tags'):
+        filters['tags'] = [t.strip().lower() for t in args.get('tags').split(',') if t.strip()]
+    return filters
+
+
+def apply_course_filters(q, filters):
+    for name in FACET_DIMENSIONS:
+        if name in filters:
+            q = q.filter(getattr(Course, name) == filters[name])
+    if 'min_price' in filters:
+        q = q.filter(Course.price >= filters['min_price'])
+    if 'max_price' in filters:
+        q = q.filter(Course.price <= filters['max_price'])
+    if filters.get('tags'):
+        # tags are stored as a comma-separated string; match whole tags, ignoring spaces and case
+        normalized = literal(',') + func.lower(func.replace(Course.tags, ' ', '')) + literal(',')
+        for tag in filters['tags']:
+            q = q.filter(normalized.contains(f",{tag.replace(' ', '')},"))
+    return q
+
+
+def _filter_key(filters):
+    return json.dumps(filters, sort_keys=True) if filters else ''
+
+
+def _facet_cube():
+    """Course counts per (category, class_name, difficulty, stream, published) combination.
+
+    Computed with one GROUP BY per catalog generation and cached, so facet counts
+    for any combination of these filters are derived in Python without touching the DB.
+    """
+    key = f"courses:facets:g{catalog_generation()}"
+    cube = cache.get(key)
+    if cube is None:
+        columns = [getattr(Course, name) for name in FACET_DIMENSIONS]
+        rows = db.session.query(*columns, func.count(Course.id)).group_by(*columns).all()
+        cube = [dict(zip(FACET_DIMENSIONS + ('count',), row)) for row in rows]
+        cube = [dict(cell, published=bool(cell['published'])) for cell in cube]
+        cache.set(key, cube, timeout=0)
+    return cube
+
+
+def facet_counts(filters):
+    """Counts per value of each returned facet, honouring the other facet-dimension filters.
+
+    A facet ignores its own filter (so the client can offer the alternatives); price,
+    tag and search filters are not part of the aggregate and do not narrow the counts.
+    """
+    facets = {}
+    for facet in FACETS_RETURNED:
+        counts = {}
+        for cell in _facet_cube():
+            if any(cell[name] != filters[name] for name in FACET_DIMENSIONS if name in filters and name != facet):
+                continue
+            if cell[facet] is None:
+                continue
+            counts[cell[facet]] = counts.get(cell[facet], 0) + cell['count']
+        facets[facet] = [{"value": v, "count": n} for v, n in sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))]
+    return facets
+
+
+def _search_courses(query, page, limit, filters):
+    """Relevance-ranked catalog search (FULLTEXT on MySQL, in-process index elsewhere)."""
+    page = max(page, 1)
+    limit = max(1, min(limit, current_app.config.get('COURSE_PAGE_MAX', 100)))
+    if filters:
+        # narrow the top hits with the SQL filters, then page through what is left
+        hits, _ = search_course_ids(query, limit=current_app.config.get('COURSE_SEARCH_MAX_HITS', 1000))
+        allowed = {r.id for r in apply_course_filters(Course.query.with_entities(Course.id), filters).filter(Course.id.in_(dict(hits))).all()} if hits else set()
+        hits = [hit for hit in hits if hit[0] in allowed]
+        total = len(hits)
+        hits = hits[(page - 1) * limit:page * limit]
+    else:
+        hits, total = search_course_ids(query, limit=limit, offset=(page - 1) * limit)
+    scores = dict(hits)
+    rows = {c.id: c for c in _course_query().filter(Course.id.in_(scores)).all()} if scores else {}
+    thumb = _thumbnail_request()
+    data = [
+        dict(_course_item(c, thumb), score=round(scores[c.id], 4))
+        for c in (rows.get(cid) for cid, _ in hits) if c is not None
+    ]
+    pages = (total + limit - 1) // limit if total else 0
+    return {"success": True, "data": data, "meta": {"page": page, "pages": pages, "total": total}}
+
 
 @bp.route("/courses", methods=["GET"])
 def list_courses():
@@ -12,19 +246,30 @@ def list_courses():
         limit = int(request.args.get("limit", 20))
     except ValueError:
         page, limit = 1, 20
+    try:
+        filters = parse_course_filters(request.args)
+    except ValueError as e:
+        return {"success": False, "error": str(e), "code": 400}, 400
 
-    q = Course.query
-    # filters (title)
-    title = request.args.get("title")
-    if title:
-        q = q.filter(Course.title.ilike(f"%{title}%"))
-
-    # select only required columns (optimization)
-    q = q.with_entities(Course.id, Course.title, Course.description, Course.created_at)
+    # search (title, description, tags, category, class_name); `title` is kept for older clients
+    query = request.args.get("q") or request.args.get("title")
+    if query:
+        resp = _search_courses(query, page, limit, filters)
+    else:
+        q = apply_course_filters(_course_query(), filters)
+        # opt-in keyset mode: ?pagination=cursor for the first page, then ?cursor=<next_cursor>
+        if request.args.get("pagination") == "cursor" or request.args.get("cursor"):
+            limit = max(1, min(limit, current_app.config.get('COURSE_PAGE_MAX', 100)))
+            resp = _list_courses_cursor(q, limit, _filter_key(filters))
+        else:
+            items = q.order_by(Course.created_at.desc()).paginate(page=page, per_page=limit, error_out=False)
+            thumb = _thumbnail_request()
+            data = [_course_item(c, thumb) for c in items.items]
+            resp = {"success": True, "data": data, "meta": {"page": items.page, "pages": items.pages, "total": items.total}}
 
-    items = q.order_by(Course.created_at.desc()).paginate(page=page, per_page=limit, error_out=False)
-    data = [{"id": c.id, "title": c.title, "description": c.description, "created_at": c.created_at.isoformat()} for c in items.items]
-    return {"success": True, "data": data, "meta": {"page": items.page, "pages": items.pages, "total": items.total}}
+    if request.args.get("facets") in ("1", "true") and isinstance(resp, dict):
+        resp["meta"]["facets"] = facet_counts(filters)
+    return resp
 
 @bp.route("/courses/<int:id>", methods=["GET"])
 def get_course(id):
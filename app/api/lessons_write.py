@@ -3,6 +3,7 @@ from jsonschema import validate, ValidationError
 from ..models import Lesson
 from ..extensions import db
 from ..decorators import require_roles
+from .content import remember_content_version
 from flask_jwt_extended import jwt_required
 import json, os
 
@@ -47,4 +48,5 @@ def update_lesson(id):
     lesson.content_json = content_json
     lesson.content_version = (lesson.content_version or 1) + 1
     db.session.commit()
+    remember_content_version(lesson.id, lesson.content_version)
     return {"success": True, "id": lesson.id, "content_version": lesson.content_version}
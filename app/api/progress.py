@@ -1,10 +1,103 @@
 from flask import request, current_app
-from ..models import Progress
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from ..models import Progress, User, Lesson
 from ..extensions import db, limiter
+from ..decorators import require_roles
+from ..progress_queue import enqueue_progress, queue_enabled, queue_metrics
+from ..progress_summary import apply_progress_rows, user_progress
+import uuid
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 from . import bp
 
 
+def parse_progress(data):
+    """Validate one progress submission. Returns (fields, None) or (None, error message)."""
+    if not isinstance(data, dict):
+        return None, "each item must be an object"
+    # Basic validation and type coercion
+    try:
+        user_id = int(data.get("user_id")) if data.get("user_id") is not None else None
+    except Exception:
+        return None, "user_id must be integer"
+    try:
+        lesson_id = int(data.get("lesson_id")) if data.get("lesson_id") is not None else None
+    except Exception:
+        return None, "lesson_id must be integer"
+
+    if not (user_id and lesson_id):
+        return None, "user_id and lesson_id required"
+
+    return {
+        "user_id": user_id,
+        "lesson_id": lesson_id,
+        "attempt_id": data.get("attempt_id"),
+        "score": data.get("score"),
+        "time_spent": data.get("time_spent"),
+        "answers": data.get("answers"),
+    }, None
+
+
+# MySQL ER_DUP_ENTRY: the only error INSERT IGNORE is meant to skip
+ER_DUP_ENTRY = 1062
+
+
+def _insert_ignore_statement():
+    """INSERT into progress that skips rows whose (user_id, lesson_id, attempt_id) key already exists.
+
+    Uses ON CONFLICT DO NOTHING on SQLite/PostgreSQL and INSERT IGNORE on MySQL
+    (pymysql connects with CLIENT_FOUND_ROWS, so ON DUPLICATE KEY UPDATE would
+    report 1 for a no-op update and hide duplicates). INSERT IGNORE also turns
+    FK, NOT NULL and truncation errors into warnings; ``_check_insert_warnings``
+    raises those again.
+    """
+    table = Progress.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql_insert(table).on_conflict_do_nothing()
+    if dialect == 'mysql':
+        return table.insert().prefix_with('IGNORE')
+    return table.insert()
+
+
+def ignored_errors(warnings):
+    """The (level, code, message) rows of SHOW WARNINGS that are not skipped duplicates."""
+    return [w for w in warnings if w[0] in ('Warning', 'Error') and int(w[1]) != ER_DUP_ENTRY]
+
+
+def _check_insert_warnings():
+    """After INSERT IGNORE on MySQL: raise IntegrityError unless every skipped row was a duplicate key."""
+    if db.session.get_bind().dialect.name != 'mysql':
+        return
+    errors = ignored_errors(db.session.execute(text('SHOW WARNINGS')).all())
+    if errors:
+        raise IntegrityError('INSERT IGNORE into progress: ' + '; '.join(str(w[2]) for w in errors), None, None)
+
+
+def insert_progress_ignore_duplicates(fields):
+    """Insert one progress row; returns (inserted, id) from the affected-row count. The caller commits."""
+    values = dict(fields, created_at=datetime.utcnow())
+    result = db.session.execute(_insert_ignore_statement().values(**values))
+    _check_insert_warnings()
+    if result.rowcount == 0:
+        return False, None
+    return True, result.inserted_primary_key[0]
+
+
+def insert_progress_rows(rows):
+    """Multi-row insert-or-ignore (one statement); returns how many rows were new. The caller commits."""
+    now = datetime.utcnow()
+    rows = [dict({"created_at": now}, **row) for row in rows]
+    inserted = db.session.execute(_insert_ignore_statement().values(rows)).rowcount
+    _check_insert_warnings()
+    return inserted
+
+
 @bp.route("/progress", methods=["POST"])
 @limiter.limit("30/minute")
 def submit_progress():
@@ -16,41 +109,146 @@ def submit_progress():
     if not data:
         return {"success": False, "error": "JSON payload required", "code": 400}, 400
 
-    # Basic validation and type coercion
-    try:
-        user_id = int(data.get("user_id")) if data.get("user_id") is not None else None
-    except Exception:
-        return {"success": False, "error": "user_id must be integer", "code": 400}, 400
-    try:
-        lesson_id = int(data.get("lesson_id")) if data.get("lesson_id") is not None else None
-    except Exception:
-        return {"success": False, "error": "lesson_id must be integer", "code": 400}, 400
+    fields, error = parse_progress(data)
+    if error:
+        return {"success": False, "error": error, "code": 400}, 400
+    user_id, lesson_id, attempt_id = fields["user_id"], fields["lesson_id"], fields["attempt_id"]
 
-    if not (user_id and lesson_id):
-        return {"success": False, "error": "user_id and lesson_id required", "code": 400}, 400
-
-    attempt_id = data.get("attempt_id")
-    score = data.get("score")
-    time_spent = data.get("time_spent")
-    answers = data.get("answers")
-
-    # Prevent duplicate submission when attempt_id is provided
-    if attempt_id:
-        exists = Progress.query.filter_by(attempt_id=attempt_id, user_id=user_id, lesson_id=lesson_id).first()
-        if exists:
-            current_app.logger.info('Duplicate progress submission attempt_id=%s user_id=%s lesson_id=%s', attempt_id, user_id, lesson_id)
-            return {"success": False, "error": "duplicate submission", "code": 409}, 409
-
-    # Insert within a transaction
-    p = Progress(user_id=user_id, lesson_id=lesson_id, score=score, time_spent=time_spent, answers=answers, attempt_id=attempt_id)
+    if queue_enabled():
+        # write-behind: the flusher (flask progress-flush) inserts it; retries are ignored there
+        attempt_id = enqueue_progress(fields)
+        return {"success": True, "queued": True, "attempt_id": attempt_id}, 202
+
+    # Single round-trip: the (user_id, lesson_id, attempt_id) unique key rejects retries atomically
     try:
-        with db.session.begin():
-            db.session.add(p)
-        return {"success": True, "id": p.id}
+        inserted, progress_id = insert_progress_ignore_duplicates(fields)
+        if inserted:
+            apply_progress_rows([fields])
+        db.session.commit()
     except IntegrityError as e:
         # likely FK or constraint violation
+        db.session.rollback()
         current_app.logger.exception('Progress insert IntegrityError')
         return {"success": False, "error": "db integrity error", "detail": str(e), "code": 500}, 500
     except Exception as e:
+        db.session.rollback()
         current_app.logger.exception('Progress insert failed')
         return {"success": False, "error": "db error", "detail": str(e), "code": 500}, 500
+
+    if not inserted:
+        current_app.logger.info('Duplicate progress submission attempt_id=%s user_id=%s lesson_id=%s', attempt_id, user_id, lesson_id)
+        return {"success": False, "error": "duplicate submission", "code": 409}, 409
+    return {"success": True, "id": progress_id}
+
+
+@bp.route("/progress/batch", methods=["POST"])
+@limiter.limit("30/minute")
+def submit_progress_batch():
+    """Accept many progress submissions (offline sync) in one request and one transaction.
+
+    Expected JSON: [ {user_id, lesson_id, score?, time_spent?, answers?, attempt_id?}, ... ]
+    (or {"items": [...]}). Returns one status per item, in order: created (with id and
+    attempt_id, generated when the item had none), duplicate (attempt_id already stored or repeated in the batch) or invalid (with error).
+    """
+    data = request.get_json(silent=True)
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return {"success": False, "error": "JSON array of progress items required", "code": 400}, 400
+    max_items = current_app.config.get("PROGRESS_BATCH_MAX", 200)
+    if len(items) > max_items:
+        return {"success": False, "error": f"at most {max_items} items per request", "code": 400}, 400
+
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        fields, error = parse_progress(item)
+        if error:
+            results[i] = {"status": "invalid", "error": error}
+        else:
+            valid.append((i, fields))
+
+    # one query per check instead of one per item; duplicates are keyed like the unique constraint
+    keys = {(f["user_id"], f["lesson_id"], f["attempt_id"]) for _, f in valid if f["attempt_id"]}
+    stored = set()
+    if keys:
+        rows = Progress.query.with_entities(Progress.user_id, Progress.lesson_id, Progress.attempt_id) \
+            .filter(Progress.attempt_id.in_({k[2] for k in keys})).all()
+        stored = {(r.user_id, r.lesson_id, r.attempt_id) for r in rows} & keys
+    lesson_ids = {r.id for r in Lesson.query.with_entities(Lesson.id).filter(Lesson.id.in_({f["lesson_id"] for _, f in valid})).all()} if valid else set()
+    user_ids = {r.id for r in User.query.with_entities(User.id).filter(User.id.in_({f["user_id"] for _, f in valid})).all()} if valid else set()
+
+    pending = []
+    for i, fields in valid:
+        key = (fields["user_id"], fields["lesson_id"], fields["attempt_id"])
+        if fields["attempt_id"] and key in stored:
+            results[i] = {"status": "duplicate"}
+            continue
+        if fields["lesson_id"] not in lesson_ids:
+            results[i] = {"status": "invalid", "error": "unknown lesson_id"}
+            continue
+        if fields["user_id"] not in user_ids:
+            results[i] = {"status": "invalid", "error": "unknown user_id"}
+            continue
+        if fields["attempt_id"]:
+            # a client retrying inside one batch: keep the first copy
+            stored.add(key)
+        pending.append((i, fields))
+
+    if pending:
+        # the lookups above already opened the transaction: one multi-row insert-or-ignore, one SELECT
+        # for the ids, one commit. Items without attempt_id get one (like queued submissions) so every
+        # row can be found by its key.
+        for _, fields in pending:
+            fields["attempt_id"] = fields["attempt_id"] or f"b-{uuid.uuid4().hex}"
+        try:
+            rows = [fields for _, fields in pending]
+            created = pending
+            if insert_progress_rows(rows) != len(rows):
+                # a copy was stored concurrently after the check above: redo this batch row by row so
+                # only that item is reported as a duplicate
+                db.session.rollback()
+                created = []
+                for i, fields in pending:
+                    inserted, progress_id = insert_progress_ignore_duplicates(fields)
+                    if inserted:
+                        created.append((i, fields))
+                        results[i] = {"status": "created", "id": progress_id, "attempt_id": fields["attempt_id"]}
+                    else:
+                        results[i] = {"status": "duplicate"}
+            else:
+                ids = {(r.user_id, r.lesson_id, r.attempt_id): r.id for r in
+                       Progress.query.with_entities(Progress.id, Progress.user_id, Progress.lesson_id, Progress.attempt_id)
+                       .filter(Progress.attempt_id.in_({f["attempt_id"] for f in rows})).all()}
+                for i, fields in pending:
+                    progress_id = ids[(fields["user_id"], fields["lesson_id"], fields["attempt_id"])]
+                    results[i] = {"status": "created", "id": progress_id, "attempt_id": fields["attempt_id"]}
+            if created:
+                apply_progress_rows([fields for _, fields in created])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('Progress batch insert failed')
+            return {"success": False, "error": "db error", "detail": str(e), "code": 500}, 500
+
+    summary = {}
+    for r in results:
+        summary[r["status"]] = summary.get(r["status"], 0) + 1
+    return {"success": True, "data": [dict(r, index=i) for i, r in enumerate(results)], "summary": summary}
+
+
+@bp.route("/progress/queue", methods=["GET"])
+@require_roles("admin")
+def progress_queue_metrics():
+    """Write-behind queue health: depth, lag of the oldest item and the flusher's last batch."""
+    if not queue_enabled():
+        return {"success": True, "data": {"mode": current_app.config.get("PROGRESS_WRITE_MODE", "sync")}}
+    return {"success": True, "data": dict(queue_metrics(), mode="queue")}
+
+
+@bp.route("/users/<int:id>/progress", methods=["GET"])
+@jwt_required()
+def get_user_progress(id):
+    """Per-course progress for a user, served from progress_summaries (students may only read their own)."""
+    if get_jwt_identity() != str(id) and get_jwt().get("role") not in ("teacher", "admin"):
+        return {"success": False, "error": "Forbidden", "code": 403}, 403
+    return {"success": True, "data": {"user_id": id, "courses": user_progress(id)}}
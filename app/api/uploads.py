@@ -1,8 +1,13 @@
 import os
+
 from flask import Blueprint, request, current_app
 from werkzeug.utils import secure_filename
 from ..models import Asset
 from ..extensions import db, limiter
+from ..upload_stream import NullSink, StagingSink, UploadTooLarge, UploadTypeMismatch, ingest
+from ..storage import get_storage
+from ..derivatives import schedule_derivatives
+from .. import upload_sessions
 ALLOWED = {"png", "jpg", "jpeg", "gif", "webp", "mp4", "pdf"}
 
 from . import bp
@@ -13,101 +18,87 @@ def allowed_file(filename):
     return ext in ALLOWED
 
 
-def _save_local(fileobj, upload_path, filename):
-    os.makedirs(upload_path, exist_ok=True)
-    filepath = os.path.join(upload_path, filename)
-    fileobj.save(filepath)
-    return filepath
+def find_duplicate(sha256):
+    """Existing Asset with this content hash whose file is still stored, or None."""
+    storage = get_storage()
+    for asset in Asset.query.filter_by(sha256=sha256).order_by(Asset.id).limit(5):
+        key = storage.key_for_url(asset.url)
+        # URLs of another backend (e.g. assets stored before a switch to S3) are trusted as-is
+        if key is None or storage.exists(key):
+            return asset
+    return None
+
+
+def _keep_unless_duplicate(found):
+    """``keep`` callback for ingest(): drop the new copy when the content is already stored."""
+    def keep(info):
+        found['asset'] = find_duplicate(info['sha256'])
+        return found['asset'] is None
+    return keep
+
+
+def publish_key(storage, filename, sha256):
+    """Key to store new content named ``filename`` under.
+
+    A stored key is never overwritten: deduplicated uploads share its URL, so it must keep
+    serving the same bytes. Other content under a taken name goes to a key prefixed with its hash.
+    """
+    if storage.exists(filename):
+        return f"{sha256[:16]}_{filename}"
+    return filename
+
 
+def store_file(stream, filename, declared_type=None, max_size=None):
+    """Stage a file locally while hashing it; publish it only when identical content is not stored yet.
 
-def _upload_s3(fileobj, bucket, key, extra_args=None):
-    # Lazy import boto3 so it's optional
+    Returns (info, url, existing asset or None); on a duplicate the staged copy is removed, the
+    storage backend is never written to and url is the existing asset's.
+    Raises UploadTooLarge / UploadTypeMismatch.
+    """
+    storage = get_storage()
+    found = {}
+    sink = StagingSink(upload_sessions.staging_dir())
+    info = ingest(stream, filename, sink, max_size=max_size, declared_type=declared_type,
+                  keep=_keep_unless_duplicate(found))
+    existing = found.get('asset')
+    if existing is not None:
+        return info, existing.url, existing
+    key = publish_key(storage, filename, info['sha256'])
     try:
-        import boto3
-    except Exception:
-        raise RuntimeError("boto3 is required for S3 uploads")
-    s3 = boto3.client(
-        's3',
-        aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=current_app.config.get('AWS_SECRET_ACCESS_KEY'),
-        region_name=current_app.config.get('AWS_REGION')
-    )
-    extra_args = extra_args or {}
-    # fileobj may be a FileStorage; seek to start
-    fileobj.stream.seek(0)
-    s3.upload_fileobj(fileobj.stream, bucket, key, ExtraArgs=extra_args)
-    # return public URL (assuming bucket policy/public or presigned URL used)
-    return f"https://{bucket}.s3.amazonaws.com/{key}"
+        # local: a rename; S3: parallel multipart upload of the seekable staged file
+        storage.put_file(sink.path, key, info['mime_type'])
+    except BaseException:
+        if os.path.exists(sink.path):
+            os.remove(sink.path)
+        raise
+    return info, storage.url(key), None
 
 
-@bp.route("/uploads", methods=["POST"])
-@limiter.limit("10/minute")
-def upload():
-    # Basic request size check (Flask may also enforce MAX_CONTENT_LENGTH globally)
-    max_len = current_app.config.get('MAX_CONTENT_LENGTH')
-    if max_len and request.content_length and request.content_length > max_len:
-        return {"success": False, "error": "request too large", "code": 413}, 413
+def _ingest_upload(stream, filename, declared_type, max_len):
+    """Stream an upload to its destination. Returns the API response (new or deduplicated asset)."""
+    try:
+        info, url, existing = store_file(stream, filename, declared_type, max_len)
+    except UploadTooLarge:
+        return {"success": False, "error": "file too large", "code": 413}, 413
+    except UploadTypeMismatch as e:
+        return {"success": False, "error": str(e), "code": 400}, 400
+    except Exception:
+        current_app.logger.exception("upload failed")
+        return {"success": False, "error": "upload failed", "code": 500}, 500
+    return _asset_response(info, url, existing)
 
-    if "file" not in request.files:
-        return {"success": False, "error": "no file part", "code": 400}, 400
-    f = request.files["file"]
-    if f.filename == "":
-        return {"success": False, "error": "no selected file", "code": 400}, 400
-    if not allowed_file(f.filename):
-        return {"success": False, "error": "file type not allowed", "code": 400}, 400
 
-    filename = secure_filename(f.filename)
-    upload_to_s3 = bool(current_app.config.get('S3_BUCKET'))
+def _asset_response(info, url, existing):
+    if existing is not None:
+        return {
+            "success": True, "url": existing.url, "size": existing.size, "mime_type": existing.mime_type,
+            "asset_created": False, "asset_id": existing.id, "deduplicated": True, "sha256": info['sha256'],
+            "width": existing.width, "height": existing.height, "variants": existing.variants,
+        }
+    return _record_asset(url, info['size'], info['mime_type'], info['sha256'])
 
-    if upload_to_s3:
-        key = f"uploads/{filename}"
-        try:
-            # attempt to determine size before upload
-            size = None
-            try:
-                # try request content length first
-                size = int(request.content_length) if request.content_length else None
-            except Exception:
-                size = None
-            try:
-                # try to get filesize by seeking stream (works for small uploads)
-                pos = None
-                if hasattr(f, 'stream') and hasattr(f.stream, 'seek'):
-                    try:
-                        pos = f.stream.tell()
-                    except Exception:
-                        pos = None
-                    try:
-                        f.stream.seek(0, os.SEEK_END)
-                        size = f.stream.tell()
-                        # rewind
-                        if pos is not None:
-                            f.stream.seek(pos)
-                        else:
-                            f.stream.seek(0)
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-            url = _upload_s3(f, current_app.config['S3_BUCKET'], key, extra_args={'ACL': 'public-read', 'ContentType': f.mimetype})
-            mime_type = f.mimetype
-        except Exception as e:
-            current_app.logger.exception("S3 upload failed")
-            return {"success": False, "error": "upload failed", "code": 500}, 500
-    else:
-        UP = current_app.config.get("UPLOAD_PATH", "/tmp/uploads")
-        filepath = _save_local(f, UP, filename)
-        size = os.path.getsize(filepath)
-        # Validate saved size against configured limit
-        if max_len and size and size > max_len:
-            try:
-                os.remove(filepath)
-            except Exception:
-                current_app.logger.exception("failed to remove oversize file")
-            return {"success": False, "error": "file too large", "code": 413}, 413
-        mime_type = f.mimetype
-        url = f"/uploads/{filename}"
 
+def _uploader_id():
     # uploader id - try to get from JWT if present (optional)
     uploader_id = None
     try:
@@ -127,12 +118,21 @@ def upload():
         current_app.logger.debug('upload: resolved uploader_id: %s', repr(uploader_id))
     except Exception:
         uploader_id = None
+    return uploader_id
 
+
+def _record_asset(url, size, mime_type, sha256=None):
+    """Create the Asset row for an upload and build the API response."""
+    uploader_id = _uploader_id()
+    asset = None
     asset_created = False
     db_error = None
     try:
+        if sha256:
+            # stored keys are no longer overwritten (publish_key), but rows from before may still share this URL
+            Asset.query.filter(Asset.url == url, Asset.sha256 != sha256).update({'sha256': None}, synchronize_session=False)
         # Always record the upload in the assets table. uploader_id may be None for anonymous uploads.
-        asset = Asset(url=url, uploader_id=uploader_id, size=size, mime_type=mime_type)
+        asset = Asset(url=url, uploader_id=uploader_id, size=size, mime_type=mime_type, sha256=sha256)
         db.session.add(asset)
         db.session.commit()
         asset_created = True
@@ -143,6 +143,7 @@ def upload():
             # Ensure logging does not break the response
             current_app.logger.debug('Asset created (logging failed) uploader_id=%s url=%s', uploader_id, url)
     except Exception as e:
+        asset = None
         # Rollback the session to keep it clean
         try:
             db.session.rollback()
@@ -173,10 +174,12 @@ def upload():
                 db_error = db_error or str(e2)
 
     # include asset id when available so callers can reference the created Asset row
-    resp = {"success": True, "url": url, "size": size, "mime_type": mime_type, "asset_created": asset_created}
+    resp = {"success": True, "url": url, "size": size, "mime_type": mime_type, "asset_created": asset_created, "sha256": sha256}
     try:
-        if asset_created and hasattr(asset, 'id') and asset.id:
+        if asset_created and asset is not None and asset.id:
             resp['asset_id'] = asset.id
+            # resized WebP/JPEG variants are rendered in the background (Asset.variants)
+            resp['derivatives_scheduled'] = schedule_derivatives(asset.id, mime_type)
     except Exception:
         # ignore if asset id not available
         pass
@@ -185,33 +188,170 @@ def upload():
     return resp
 
 
+@bp.route("/uploads", methods=["POST"])
+@limiter.limit("10/minute")
+def upload():
+    # Basic request size check (Flask may also enforce MAX_CONTENT_LENGTH globally)
+    max_len = current_app.config.get('MAX_CONTENT_LENGTH')
+    if max_len and request.content_length and request.content_length > max_len:
+        return {"success": False, "error": "request too large", "code": 413}, 413
+
+    if "file" not in request.files:
+        return {"success": False, "error": "no file part", "code": 400}, 400
+    f = request.files["file"]
+    if f.filename == "":
+        return {"success": False, "error": "no selected file", "code": 400}, 400
+    if not allowed_file(f.filename):
+        return {"success": False, "error": "file type not allowed", "code": 400}, 400
+
+    filename = secure_filename(f.filename)
+    # copy the (spooled) part to disk or S3 in chunks; size, checksum and type come from the same pass
+    return _ingest_upload(f.stream, filename, f.mimetype, max_len)
+
+
+@bp.route("/uploads/stream", methods=["POST", "PUT"])
+@limiter.limit("10/minute")
+def upload_stream():
+    """Streaming upload: the raw request body is the file, ?filename= names it.
+
+    Nothing is spooled: the body is read UPLOAD_CHUNK_SIZE bytes at a time straight
+    into the destination, so memory per upload is bounded by the chunk size.
+    """
+    filename = secure_filename(request.args.get("filename") or request.headers.get("X-Filename") or "")
+    if not filename:
+        return {"success": False, "error": "filename required", "code": 400}, 400
+    if not allowed_file(filename):
+        return {"success": False, "error": "file type not allowed", "code": 400}, 400
+    max_len = current_app.config.get('UPLOAD_STREAM_MAX_SIZE') or current_app.config.get('MAX_CONTENT_LENGTH')
+    if max_len and request.content_length and request.content_length > max_len:
+        return {"success": False, "error": "request too large", "code": 413}, 413
+    # this route may accept bodies larger than MAX_CONTENT_LENGTH (werkzeug checks it while reading)
+    request.max_content_length = max_len
+
+    declared_type = request.mimetype if request.mimetype not in ('', 'application/octet-stream') else None
+    return _ingest_upload(request.stream, filename, declared_type, max_len)
+
+
+def _session_headers(session):
+    return {"Upload-Offset": str(session.offset), "Upload-Length": str(session.size), "Cache-Control": "no-store"}
+
+
+def _session_not_found():
+    return {"success": False, "error": "upload session not found or expired", "code": 404}, 404
+
+
+@bp.route("/uploads/sessions", methods=["POST"])
+@limiter.limit("30/minute")
+def create_upload_session():
+    """Start a resumable upload: { filename, size, mime_type? } -> session id and offset 0."""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get("filename") or "")
+    if not filename:
+        return {"success": False, "error": "filename required", "code": 400}, 400
+    if not allowed_file(filename):
+        return {"success": False, "error": "file type not allowed", "code": 400}, 400
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        return {"success": False, "error": "size must be an integer", "code": 400}, 400
+    max_size = current_app.config.get('UPLOAD_SESSION_MAX_SIZE')
+    if size <= 0 or (max_size and size > max_size):
+        return {"success": False, "error": f"size must be between 1 and {max_size} bytes", "code": 413}, 413
+    session = upload_sessions.create_session(filename, size, data.get("mime_type"), _uploader_id())
+    headers = dict(_session_headers(session), Location=f"{request.path}/{session.id}")
+    return {"success": True, "data": session.to_dict()}, 201, headers
+
+
+@bp.route("/uploads/sessions/<session_id>", methods=["GET"])
+def get_upload_session(session_id):
+    """Upload progress (HEAD returns just the Upload-Offset / Upload-Length headers)."""
+    session = upload_sessions.get_session(session_id)
+    if session is None:
+        return _session_not_found()
+    return {"success": True, "data": session.to_dict()}, 200, _session_headers(session)
+
+
+@bp.route("/uploads/sessions/<session_id>", methods=["PATCH"])
+def patch_upload_session(session_id):
+    """Append the raw request body at the offset given in the Upload-Offset header."""
+    session = upload_sessions.get_session(session_id)
+    if session is None:
+        return _session_not_found()
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        return {"success": False, "error": "Upload-Offset header required", "code": 400}, 400
+    # a chunk may be as large as what is left of the file, regardless of MAX_CONTENT_LENGTH
+    request.max_content_length = session.size - session.offset
+    try:
+        upload_sessions.append_chunk(session, offset, request.stream)
+    except upload_sessions.OffsetMismatch as e:
+        return {"success": False, "error": str(e), "offset": e.expected, "code": 409}, 409, _session_headers(session)
+    except upload_sessions.SessionBusy:
+        return {"success": False, "error": "another chunk is being written to this session", "code": 409}, 409
+    except ValueError as e:
+        return {"success": False, "error": str(e), "code": 400}, 400, _session_headers(session)
+    except Exception:
+        # e.g. client disconnected mid-chunk: what arrived is committed, the client resumes from HEAD
+        current_app.logger.warning('upload session %s: chunk interrupted at offset %s', session_id, session.offset)
+        return {"success": False, "error": "chunk interrupted", "offset": session.offset, "code": 400}, 400, _session_headers(session)
+    return {"success": True, "data": session.to_dict()}, 200, _session_headers(session)
+
+
+@bp.route("/uploads/sessions/<session_id>/finalize", methods=["POST"])
+def finalize_upload_session(session_id):
+    """Move a fully received upload to its destination and create the Asset row."""
+    session = upload_sessions.get_session(session_id)
+    if session is None:
+        return _session_not_found()
+    if not session.complete:
+        return {"success": False, "error": "upload incomplete", "offset": session.offset, "code": 409}, 409, _session_headers(session)
+    filename = session.data['filename']
+    found = {}
+    url = None
+    try:
+        with open(session.part_path, 'rb') as fh:
+            # hash/sniff the staged file in place; it is only published when its content is new
+            info = ingest(fh, filename, NullSink(), declared_type=session.data.get('mime_type'),
+                          keep=_keep_unless_duplicate(found))
+        if info['stored']:
+            # local: a rename; S3: parallel multipart upload of the seekable staged file
+            storage = get_storage()
+            key = publish_key(storage, filename, info['sha256'])
+            storage.put_file(session.part_path, key, info['mime_type'])
+            url = storage.url(key)
+    except UploadTypeMismatch as e:
+        upload_sessions.delete_session(session)
+        return {"success": False, "error": str(e), "code": 400}, 400
+    except Exception:
+        current_app.logger.exception("finalizing upload session %s failed", session_id)
+        return {"success": False, "error": "upload failed", "code": 500}, 500
+    upload_sessions.delete_session(session)
+    return _asset_response(info, url, found.get('asset'))
+
+
+@bp.route("/uploads/sessions/<session_id>", methods=["DELETE"])
+def delete_upload_session(session_id):
+    session = upload_sessions.get_session(session_id)
+    if session is None:
+        return _session_not_found()
+    upload_sessions.delete_session(session)
+    return ('', 204)
+
+
 @bp.route('/uploads/presign', methods=['POST'])
 def presign():
-    """Return a presigned upload URL for S3. Requires S3 enabled."""
-    if not current_app.config.get('S3_BUCKET'):
-        return {"success": False, "error": "S3 not configured", "code": 400}, 400
+    """Return a presigned upload URL for S3. Requires a storage backend that can sign uploads (S3)."""
     data = request.get_json() or {}
     filename = data.get('filename')
     content_type = data.get('content_type', 'application/octet-stream')
     if not filename:
         return {"success": False, "error": "filename required", "code": 400}, 400
     try:
-        import boto3
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=current_app.config.get('AWS_SECRET_ACCESS_KEY'),
-            region_name=current_app.config.get('AWS_REGION')
-        )
-        key = f"uploads/{secure_filename(filename)}"
-        presigned = s3.generate_presigned_post(
-            Bucket=current_app.config['S3_BUCKET'],
-            Key=key,
-            Fields={"Content-Type": content_type},
-            Conditions=[["starts-with", "$Content-Type", ""]],
-            ExpiresIn=3600
-        )
+        presigned = get_storage().presigned_upload(secure_filename(filename), content_type, expires_in=3600)
         return {"success": True, "data": presigned}
+    except NotImplementedError:
+        return {"success": False, "error": "S3 not configured", "code": 400}, 400
     except Exception as e:
         current_app.logger.exception("presign failed")
         return {"success": False, "error": "presign failed", "code": 500}, 500
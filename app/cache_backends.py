@@ -0,0 +1,289 @@
+"""Custom Flask-Caching backends.
+
+TieredCache puts a bounded, per-process LRU in front of a shared cache (Redis in
+production). Select it with ``CACHE_TYPE=TieredCache`` (or the full import path
+``app.cache_backends.TieredCache``).
+
+Only keys under ``CACHE_LOCAL_PREFIXES`` (the versioned ``lesson_content:`` keys by
+default) are kept in the local tier: a versioned key never changes meaning, so a
+worker can answer it from memory without a Redis round-trip. Deletes and
+overwrites of those keys are broadcast on a Redis pub/sub channel so every
+worker drops its local copy; other keys always go straight to the shared tier.
+"""
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from cachelib import SimpleCache
+from flask_caching.backends.base import BaseCache
+from flask_caching.backends.rediscache import RedisCache
+
+
+class LocalLRU:
+    """Thread-safe LRU bounded by entry count and by the approximate pickled size of its values."""
+
+    def __init__(self, max_items=1024, max_bytes=64 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()  # key -> (value, nbytes, expires_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        try:
+            return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return None
+
+    def get(self, key):
+        """Return (found, value)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            value, nbytes, expires_at = entry
+            if expires_at and expires_at <= time.time():
+                self._pop(key)
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        nbytes = self._sizeof(value)
+        with self._lock:
+            self._pop(key)
+            if nbytes is None or nbytes > self.max_bytes:
+                # unpicklable or larger than the whole tier: leave it to the shared cache
+                return
+            expires_at = time.time() + ttl if ttl else 0
+            self._data[key] = (value, nbytes, expires_at)
+            self.size += nbytes
+            while self._data and (len(self._data) > self.max_items or self.size > self.max_bytes):
+                _, (_, evicted, _) = self._data.popitem(last=False)
+                self.size -= evicted
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache(BaseCache):
+    """Per-worker LRU (tier 1) in front of a shared cache (tier 2)."""
+
+    def __init__(self, remote, default_timeout=300, local_max_items=1024, local_max_bytes=64 * 1024 * 1024,
+                 local_timeout=300, local_prefixes=('lesson_content:',), channel='cache-invalidate'):
+        super().__init__(default_timeout=default_timeout)
+        self.remote = remote
+        self.local = LocalLRU(max_items=local_max_items, max_bytes=local_max_bytes)
+        self.local_timeout = local_timeout
+        self.local_prefixes = tuple(local_prefixes)
+        self.channel = channel
+        self.stats = {'local_hits': 0, 'local_misses': 0, 'remote_hits': 0, 'remote_misses': 0}
+        # pub/sub only makes sense when the shared tier is Redis
+        self._redis = getattr(remote, '_write_client', None) if isinstance(remote, RedisCache) else None
+        self._pid = None
+        self._node_id = None
+        self._listener = None
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        if config.get('CACHE_REDIS_URL') or config.get('CACHE_REDIS_HOST'):
+            remote = RedisCache.factory(app, config, list(args), dict(kwargs))
+        else:
+            # no Redis configured (dev/test): the shared tier is just another in-process cache
+            remote = SimpleCache(default_timeout=kwargs.get('default_timeout', 300))
+        prefixes = config.get('CACHE_LOCAL_PREFIXES', 'lesson_content:')
+        if isinstance(prefixes, str):
+            prefixes = [p.strip() for p in prefixes.split(',') if p.strip()]
+        return cls(
+            remote,
+            default_timeout=kwargs.get('default_timeout', 300),
+            local_max_items=int(config.get('CACHE_LOCAL_MAX_ITEMS', 1024)),
+            local_max_bytes=int(config.get('CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024)),
+            local_timeout=int(config.get('CACHE_LOCAL_TIMEOUT', 300)),
+            local_prefixes=prefixes,
+            channel=config.get('CACHE_INVALIDATION_CHANNEL', 'cache-invalidate'),
+        )
+
+    # -- helpers -----------------------------------------------------------
+
+    def _is_local(self, key):
+        return key.startswith(self.local_prefixes)
+
+    def _local_ttl(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        if timeout and self.local_timeout:
+            return min(timeout, self.local_timeout)
+        return timeout or self.local_timeout
+
+    def _ensure_listener(self):
+        # (re)start per process: a listener thread does not survive a gunicorn fork
+        if self._redis is None or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._node_id = uuid.uuid4().hex
+        self.local.clear()
+        self._listener = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self._handle_invalidation(message.get('data'))
+            except Exception:
+                # connection dropped: we may have missed invalidations, so start cold
+                self.local.clear()
+                time.sleep(1)
+
+    def _handle_invalidation(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        if not data:
+            return
+        sender, _, keys = data.partition(':')
+        if sender == self._node_id:
+            return
+        for key in keys.split('\n'):
+            if key == '*':
+                self.local.clear()
+            elif key:
+                self.local.delete(key)
+
+    def _publish(self, keys):
+        keys = [k for k in keys if k == '*' or self._is_local(k)]
+        if self._redis is None or not keys:
+            return
+        try:
+            self._redis.publish(self.channel, f"{self._node_id}:" + '\n'.join(keys))
+        except Exception:
+            # other workers fall back to CACHE_LOCAL_TIMEOUT for staleness
+            pass
+
+    # -- cache API ---------------------------------------------------------
+
+    def get(self, key):
+        self._ensure_listener()
+        local = self._is_local(key)
+        if local:
+            found, value = self.local.get(key)
+            if found:
+                self.stats['local_hits'] += 1
+                return value
+            self.stats['local_misses'] += 1
+        value = self.remote.get(key)
+        if value is None:
+            self.stats['remote_misses'] += 1
+        else:
+            self.stats['remote_hits'] += 1
+            if local:
+                self.local.set(key, value, self.local_timeout)
+        return value
+
+    def get_many(self, *keys):
+        self._ensure_listener()
+        results = {}
+        missing = []
+        for key in keys:
+            if self._is_local(key):
+                found, value = self.local.get(key)
+                if found:
+                    self.stats['local_hits'] += 1
+                    results[key] = value
+                    continue
+                self.stats['local_misses'] += 1
+            missing.append(key)
+        if missing:
+            for key, value in zip(missing, self.remote.get_many(*missing)):
+                if value is None:
+                    self.stats['remote_misses'] += 1
+                    continue
+                self.stats['remote_hits'] += 1
+                results[key] = value
+                if self._is_local(key):
+                    self.local.set(key, value, self.local_timeout)
+        return [results.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        self._ensure_listener()
+        result = self.remote.set(key, value, timeout=timeout)
+        if self._is_local(key):
+            self.local.set(key, value, self._local_ttl(timeout))
+            self._publish([key])
+        return result
+
+    def add(self, key, value, timeout=None):
+        self._ensure_listener()
+        added = self.remote.add(key, value, timeout=timeout)
+        if added and self._is_local(key):
+            self.local.set(key, value, self._local_ttl(timeout))
+        return added
+
+    def set_many(self, mapping, timeout=None):
+        self._ensure_listener()
+        result = self.remote.set_many(mapping, timeout=timeout)
+        ttl = self._local_ttl(timeout)
+        for key, value in mapping.items():
+            if self._is_local(key):
+                self.local.set(key, value, ttl)
+        self._publish(list(mapping))
+        return result
+
+    def delete(self, key):
+        self._ensure_listener()
+        self.local.delete(key)
+        self._publish([key])
+        return self.remote.delete(key)
+
+    def delete_many(self, *keys):
+        self._ensure_listener()
+        for key in keys:
+            self.local.delete(key)
+        self._publish(keys)
+        return self.remote.delete_many(*keys)
+
+    def has(self, key):
+        if self._is_local(key) and self.local.get(key)[0]:
+            return True
+        return self.remote.has(key)
+
+    def clear(self):
+        self._ensure_listener()
+        self.local.clear()
+        self._publish(['*'])
+        return self.remote.clear()
+
+    def inc(self, key, delta=1):
+        self.local.delete(key)
+        return self.remote.inc(key, delta=delta)
+
+    def dec(self, key, delta=1):
+        self.local.delete(key)
+        return self.remote.dec(key, delta=delta)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({'local_items': len(self.local), 'local_bytes': self.local.size})
+        return stats
@@ -0,0 +1,80 @@
+"""Custom ``flask`` commands. Registered on the app in create_app()."""
+import click
+from flask import current_app
+
+
+def register_cli(app):
+
+    @app.cli.command('progress-flush')
+    @click.option('--batch-size', type=int, default=None, help='Rows per multi-row insert (PROGRESS_FLUSH_BATCH_SIZE).')
+    @click.option('--interval', type=float, default=None, help='Seconds to sleep when the queue is idle (PROGRESS_FLUSH_INTERVAL).')
+    @click.option('--once', is_flag=True, help='Drain the queue and exit instead of running forever.')
+    def progress_flush(batch_size, interval, once):
+        """Drain the write-behind progress queue into the database."""
+        from app.progress_queue import run_flusher, queue_metrics
+        current_app.logger.info('progress flusher started: %s', queue_metrics())
+        run_flusher(batch_size=batch_size, interval=interval, once=once)
+        if once:
+            click.echo(f"progress queue drained: {queue_metrics()}")
+
+    @app.cli.command('progress-queue-stats')
+    def progress_queue_stats():
+        """Print queue depth, lag and the flusher's last batch."""
+        from app.progress_queue import queue_metrics
+        for name, value in sorted(queue_metrics().items()):
+            click.echo(f"{name}: {value}")
+
+    @app.cli.command('progress-summary-rebuild')
+    @click.option('--user-id', type=int, default=None, help='Only rebuild this user (default: everyone).')
+    def progress_summary_rebuild(user_id):
+        """Recompute progress_summaries from the progress table (backfill / repair)."""
+        from app.progress_summary import rebuild_summaries
+        count = rebuild_summaries(user_id)
+        click.echo(f"progress_summaries rebuilt: {count} rows")
+
+    @app.cli.command('progress-export')
+    @click.option('--output', 'output_dir', default=None, help='Directory for export files (default: <instance>/exports).')
+    @click.option('--format', 'fmt', type=click.Choice(['auto', 'parquet', 'arrow', 'csv']), default='auto',
+                  help='auto = parquet when pyarrow is installed, else gzip CSV.')
+    @click.option('--chunk-size', type=int, default=10000, help='Rows per primary-key chunk.')
+    @click.option('--checkpoint', default=None, help='Checkpoint file (default: <output>/progress_export.checkpoint.json).')
+    @click.option('--full', is_flag=True, help='Ignore the checkpoint and export every row.')
+    @click.option('--no-answers', is_flag=True, help='Leave out the answers JSON column.')
+    def progress_export(output_dir, fmt, chunk_size, checkpoint, full, no_answers):
+        """Export progress rows added since the last run (incremental by id)."""
+        import os
+        from app.progress_export import export_progress
+        output_dir = output_dir or os.path.join(current_app.instance_path, 'exports')
+        try:
+            result = export_progress(output_dir, fmt=fmt, chunk_size=chunk_size, checkpoint=checkpoint,
+                                     full=full, with_answers=not no_answers)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        if result['file'] is None:
+            click.echo(f"nothing to export after id {result['last_exported_id']}")
+        else:
+            click.echo(f"exported {result['rows']} rows to {result['file']} (last id {result['last_exported_id']})")
+
+    @app.cli.command('uploads-gc')
+    @click.option('--max-age', type=int, default=None, help='Seconds of inactivity (default: UPLOAD_SESSION_TTL).')
+    def uploads_gc(max_age):
+        """Remove abandoned resumable upload sessions from the staging directory."""
+        from app.upload_sessions import gc_sessions
+        click.echo(f"removed {gc_sessions(max_age)} abandoned upload sessions")
+
+    @app.cli.command('assets-derivatives')
+    @click.option('--asset-id', type=int, multiple=True, help='Only these assets (repeatable).')
+    @click.option('--all', 'redo', is_flag=True, help='Re-render images that already have variants.')
+    def assets_derivatives(asset_id, redo):
+        """Render resized WebP/JPEG variants for stored images (e.g. uploads from before the pipeline existed)."""
+        from app.derivatives import SOURCE_TYPES, available, generate_many
+        from app.models import Asset
+        if not available():
+            raise click.ClickException('Pillow is required (pip install Pillow)')
+        q = Asset.query.with_entities(Asset.id).filter(Asset.mime_type.in_(SOURCE_TYPES))
+        if asset_id:
+            q = q.filter(Asset.id.in_(asset_id))
+        elif not redo:
+            q = q.filter(Asset.variants.is_(None))
+        ids = [row.id for row in q.order_by(Asset.id).all()]
+        click.echo(f"rendered variants for {generate_many(ids)} of {len(ids)} images")
@@ -64,10 +64,98 @@ class Config:
     UPLOAD_PATH = os.getenv("UPLOAD_PATH", "/tmp/uploads")
     # Allow larger uploads by default (64 MB). Can be overridden with env var MAX_CONTENT_LENGTH.
     MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 64 * 1024 * 1024))  # 64 MB
+    # Uploads are copied to disk/S3 in chunks of this size (bounds memory per upload)
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+    # size limit for the raw-body POST /api/v1/uploads/stream route (defaults to MAX_CONTENT_LENGTH)
+    UPLOAD_STREAM_MAX_SIZE = int(os.getenv("UPLOAD_STREAM_MAX_SIZE", 0)) or None
+    # Resumable upload sessions (/api/v1/uploads/sessions): staging directory (default
+    # instance/upload_staging), largest accepted file, and idle time before `flask uploads-gc` removes a session
+    UPLOAD_STAGING_PATH = os.getenv("UPLOAD_STAGING_PATH", None)
+    UPLOAD_SESSION_MAX_SIZE = int(os.getenv("UPLOAD_SESSION_MAX_SIZE", 1024 * 1024 * 1024))
+    UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))
+    # Resized variants of uploaded images / course thumbnails (needs Pillow): async renders them in a process pool
+    # off the request path, sync inline (tests), off disables; widths are never upscaled
+    DERIVATIVES_MODE = os.getenv("DERIVATIVES_MODE", "async")
+    DERIVATIVE_WIDTHS = os.getenv("DERIVATIVE_WIDTHS", "160,320,640,1280")
+    DERIVATIVE_FORMATS = os.getenv("DERIVATIVE_FORMATS", "webp,jpeg")
+    DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", 80))
+    DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", 2))
+    DERIVATIVE_MAX_PIXELS = int(os.getenv("DERIVATIVE_MAX_PIXELS", 64_000_000))
+    # list_courses returns the smallest thumbnail variant at least this wide (?thumb_width= / ?thumb_format= override)
+    CATALOG_THUMBNAIL_WIDTH = int(os.getenv("CATALOG_THUMBNAIL_WIDTH", 320))
+    CATALOG_THUMBNAIL_FORMAT = os.getenv("CATALOG_THUMBNAIL_FORMAT", "webp")
+    # /uploads/<key> responses: Cache-Control max-age, and offloading the body to the front-end server:
+    # off, x-accel (nginx: X-Accel-Redirect to UPLOADS_ACCEL_PREFIX/<key>, an `internal` location) or x-sendfile
+    UPLOADS_CACHE_MAX_AGE = int(os.getenv("UPLOADS_CACHE_MAX_AGE", 3600))
+    UPLOADS_SENDFILE = os.getenv("UPLOADS_SENDFILE", "off")
+    UPLOADS_ACCEL_PREFIX = os.getenv("UPLOADS_ACCEL_PREFIX", "/protected-uploads")
+    # Where uploads are stored: auto (S3 when S3_BUCKET is set, else UPLOAD_PATH), local, s3 or memory (tests/benchmarks)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "auto")
+    # S3 uploads are enabled by S3_BUCKET; S3_ENDPOINT_URL targets MinIO / a moto server instead of AWS and
+    # S3_PUBLIC_URL overrides the base of returned asset URLs (e.g. a CDN)
+    S3_BUCKET = os.getenv("S3_BUCKET", None)
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", None)
+    S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", None)
+    AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID", None)
+    AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", None)
+    AWS_REGION = os.getenv("AWS_REGION", None)
+    # The app shares one S3 client: its connection pool size (>= concurrent uploads), timeouts and retry attempts
+    S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 50))
+    S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", 5))
+    S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", 60))
+    S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", 5))
+    # S3 multipart part size for streamed uploads (S3 minimum is 5 MB)
+    S3_MULTIPART_PART_SIZE = int(os.getenv("S3_MULTIPART_PART_SIZE", 8 * 1024 * 1024))
+    # Whole-file uploads (finalized resumable sessions) switch to parallel multipart above this size
+    S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+    S3_TRANSFER_CONCURRENCY = int(os.getenv("S3_TRANSFER_CONCURRENCY", 8))
 
     # Caching
     CACHE_TYPE = os.getenv("CACHE_TYPE", "SimpleCache")  # "RedisCache" if using redis
     CACHE_DEFAULT_TIMEOUT = int(os.getenv("CACHE_DEFAULT_TIMEOUT", 300))
+    # Cache-Control sent with lesson content. Responses carry a strong ETag per
+    # (lesson, content_version), so clients revalidate and get a cheap 304.
+    CONTENT_CACHE_CONTROL = os.getenv("CONTENT_CACHE_CONTROL", "public, no-cache")
+    # "object" caches the content dict; "bytes" caches the encoded UTF-8 body and
+    # splices it into the response on a hit (no pickle round-trip of the dict, no re-encode)
+    CONTENT_CACHE_MODE = os.getenv("CONTENT_CACHE_MODE", "object")
+    # bytes mode only: pre-compressed variants to store, e.g. "gzip" or "br,gzip" (br needs brotli)
+    CONTENT_CACHE_ENCODINGS = os.getenv("CONTENT_CACHE_ENCODINGS", "")
+    # Maximum number of lesson ids accepted by GET /api/v1/content?ids=
+    CONTENT_BATCH_MAX = int(os.getenv("CONTENT_BATCH_MAX", 100))
+    # GET /api/v1/courses cursor mode: page size cap and TTL of the cached with_total count
+    COURSE_PAGE_MAX = int(os.getenv("COURSE_PAGE_MAX", 100))
+    COURSE_COUNT_CACHE_TIMEOUT = int(os.getenv("COURSE_COUNT_CACHE_TIMEOUT", 60))
+    # /admin/api/{courses,lessons,topics}: default page size and cap for ?limit=
+    ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", 50))
+    ADMIN_PAGE_MAX = int(os.getenv("ADMIN_PAGE_MAX", 200))
+    # Admin UI session principal (app/admin_auth.py): seconds it is cached across requests; 0 = per request only.
+    # Unset: 30 with a shared cache (Redis, TieredCache), 0 with a per-process one (SimpleCache)
+    ADMIN_PRINCIPAL_CACHE_TIMEOUT = int(os.environ["ADMIN_PRINCIPAL_CACHE_TIMEOUT"]) if os.getenv("ADMIN_PRINCIPAL_CACHE_TIMEOUT") else None
+    # Course search backend: "auto" (MySQL FULLTEXT when on MySQL, else in-process index) or "memory"
+    COURSE_SEARCH_BACKEND = os.getenv("COURSE_SEARCH_BACKEND", "auto")
+    # how many top search hits are considered when search is combined with catalog filters
+    COURSE_SEARCH_MAX_HITS = int(os.getenv("COURSE_SEARCH_MAX_HITS", 1000))
+    # Maximum number of items accepted by POST /api/v1/progress/batch
+    PROGRESS_BATCH_MAX = int(os.getenv("PROGRESS_BATCH_MAX", 200))
+    # POST /api/v1/progress: "sync" commits each submission, "queue" appends it to a durable
+    # queue and answers 202 (drained by `flask progress-flush`, see app/progress_queue.py)
+    PROGRESS_WRITE_MODE = os.getenv("PROGRESS_WRITE_MODE", "sync")
+    # queue backend: a Redis URL, else a SQLite WAL file (default instance/progress_queue.sqlite)
+    PROGRESS_QUEUE_URL = os.getenv("PROGRESS_QUEUE_URL", os.getenv("REDIS_URL", None))
+    PROGRESS_QUEUE_PATH = os.getenv("PROGRESS_QUEUE_PATH", None)
+    PROGRESS_FLUSH_BATCH_SIZE = int(os.getenv("PROGRESS_FLUSH_BATCH_SIZE", 500))
+    PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", 1.0))
+    # flushers take a queue-wide lock per batch (must outlive the slowest batch) and back off
+    # exponentially, up to PROGRESS_FLUSH_MAX_BACKOFF seconds, while flushes keep failing
+    PROGRESS_FLUSH_LOCK_TTL = float(os.getenv("PROGRESS_FLUSH_LOCK_TTL", 60))
+    PROGRESS_FLUSH_MAX_BACKOFF = float(os.getenv("PROGRESS_FLUSH_MAX_BACKOFF", 30))
+    # Course analytics (app/analytics.py): rows per progress chunk and result cache TTL (results are
+    # also keyed by the newest progress id, so new attempts invalidate them before the TTL)
+    ANALYTICS_CHUNK_SIZE = int(os.getenv("ANALYTICS_CHUNK_SIZE", 50000))
+    ANALYTICS_CACHE_TIMEOUT = int(os.getenv("ANALYTICS_CACHE_TIMEOUT", 3600))
+    # Emit X-Query-Count (SQL statements per request) on every response
+    QUERY_COUNT_HEADER = os.getenv("QUERY_COUNT_HEADER", "0") == "1"
 
     # Redis / cache settings (used when CACHE_TYPE=RedisCache)
     REDIS_URL = os.getenv("REDIS_URL", os.getenv("CACHE_REDIS_URL", None))
@@ -75,6 +163,23 @@ class Config:
         CACHE_TYPE = os.getenv("CACHE_TYPE", "RedisCache")
         CACHE_REDIS_URL = REDIS_URL
 
+    # Stampede protection for cache rebuilds (app/singleflight.py): how long the rebuild
+    # lock is held at most, how long other callers wait for it, and the XFetch early
+    # refresh factor (0 disables probabilistic refresh before expiry)
+    CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", 10))
+    CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 2.0))
+    CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", 1.0))
+
+    # Two-tier cache: per-worker LRU in front of Redis (see app/cache_backends.py)
+    if CACHE_TYPE == "TieredCache":
+        CACHE_TYPE = "app.cache_backends.TieredCache"
+    CACHE_LOCAL_MAX_ITEMS = int(os.getenv("CACHE_LOCAL_MAX_ITEMS", 1024))
+    CACHE_LOCAL_MAX_BYTES = int(os.getenv("CACHE_LOCAL_MAX_BYTES", 64 * 1024 * 1024))
+    # upper bound on how long a worker may serve a key from memory, even without an invalidation
+    CACHE_LOCAL_TIMEOUT = int(os.getenv("CACHE_LOCAL_TIMEOUT", 300))
+    CACHE_LOCAL_PREFIXES = os.getenv("CACHE_LOCAL_PREFIXES", "lesson_content:")
+    CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache-invalidate")
+
     # Rate limiter storage (Flask-Limiter)
     RATELIMIT_STORAGE_URL = os.getenv("RATELIMIT_STORAGE_URL", REDIS_URL)
 
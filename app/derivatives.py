@@ -0,0 +1,197 @@
+"""Resized image variants (derivatives) for uploaded images and course thumbnails.
+
+After an image Asset is created, ``schedule_derivatives`` hands it to a small
+dispatcher thread, so the request returns immediately. The dispatcher reads the
+original from the storage backend, sends the bytes (or, for local storage, the
+path) to a ``ProcessPoolExecutor`` where Pillow decodes and resizes off the web
+worker's GIL, then stores the variants next to the original and records them
+on the Asset:
+
+* widths from DERIVATIVE_WIDTHS (never upscaled), formats from DERIVATIVE_FORMATS
+  (WebP and JPEG by default), stored as ``_<key>.w<width>.<ext>`` (the full original key, so
+  ``logo.png`` and ``logo.jpg`` do not collide; uploaded names never start with ``_``);
+* EXIF orientation is applied, then all metadata (EXIF, GPS, XMP) is dropped;
+* ``Asset.width`` / ``Asset.height`` and ``Asset.variants`` =
+  [{"width", "height", "format", "url", "size"}, ...] sorted by width.
+
+``DERIVATIVES_MODE``: ``async`` (default), ``sync`` (inline, for tests and the
+CLI) or ``off``. Pillow is optional; without it nothing is scheduled.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app
+
+from .extensions import db
+from .models import Asset
+from .storage import get_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+SOURCE_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+MIME_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def available():
+    return Image is not None
+
+
+def _config_list(value, cast=str):
+    if isinstance(value, str):
+        value = [v for v in value.replace(';', ',').split(',') if v.strip()]
+    return [cast(str(v).strip()) for v in value]
+
+
+def settings(config):
+    return {
+        'widths': sorted(_config_list(config.get('DERIVATIVE_WIDTHS', '160,320,640,1280'), int)),
+        'formats': _config_list(config.get('DERIVATIVE_FORMATS', 'webp,jpeg')),
+        'quality': int(config.get('DERIVATIVE_QUALITY', 80)),
+        'max_pixels': int(config.get('DERIVATIVE_MAX_PIXELS', 64_000_000)),
+    }
+
+
+def render_variants(source, widths, formats, quality=80, max_pixels=64_000_000):
+    """Decode ``source`` (bytes or a path) and encode it at each width narrower than the original.
+
+    Runs in a worker process. Returns {"width", "height", "variants": [(width, height, fmt, bytes)]}.
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    width, height = img.size
+    if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+        # EXIF orientation rotates by 90 degrees
+        width, height = height, width
+    if img.format == 'JPEG':
+        # let libjpeg decode at 1/2, 1/4 or 1/8 scale while both sides stay >= the largest variant
+        img.draft('RGB', (max(widths), max(widths)))
+    # rotate per the EXIF orientation; the re-encoded variants carry no EXIF at all
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+    variants = []
+    for w in widths:
+        if w >= width:
+            continue
+        h = max(1, round(height * w / width))
+        resized = img.resize((w, h), Image.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            out = io.BytesIO()
+            if fmt == 'jpeg':
+                frame = resized
+                if has_alpha:
+                    # JPEG has no alpha: flatten onto white
+                    frame = Image.new('RGB', resized.size, (255, 255, 255))
+                    frame.paste(resized, mask=resized.getchannel('A'))
+                frame.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                resized.save(out, 'WEBP', quality=quality, method=4)
+            variants.append((w, h, fmt, out.getvalue()))
+    return {"width": width, "height": height, "variants": variants}
+
+
+def variant_key(key, width, fmt):
+    # secure_filename() strips leading underscores, so no upload can overwrite a variant
+    return f"_{key}.w{width}.{EXTENSIONS[fmt]}"
+
+
+def generate_for_asset(asset_id, pool=None):
+    """Render and store the variants of one Asset (inside an app context). Returns the Asset or None."""
+    asset = db.session.get(Asset, asset_id)
+    if asset is None or asset.mime_type not in SOURCE_TYPES:
+        return None
+    storage = get_storage()
+    key = storage.key_for_url(asset.url)
+    if key is None or not storage.exists(key):
+        return None
+    opts = settings(current_app.config)
+    path = storage.local_path(key)
+    source = path if path is not None else b''.join(storage.open(key))
+    args = (source, opts['widths'], opts['formats'], opts['quality'], opts['max_pixels'])
+    result = pool.submit(render_variants, *args).result() if pool is not None else render_variants(*args)
+    variants = []
+    for w, h, fmt, data in result['variants']:
+        vkey = variant_key(key, w, fmt)
+        storage.put(io.BytesIO(data), vkey, MIME_TYPES[fmt])
+        variants.append({"width": w, "height": h, "format": fmt, "url": storage.url(vkey), "size": len(data)})
+    asset.width, asset.height = result['width'], result['height']
+    asset.variants = variants
+    db.session.commit()
+    return asset
+
+
+def _process_pool(app):
+    with _executors_lock:
+        # per process: gunicorn workers fork after import, so pools are created lazily on first use
+        pid = os.getpid()
+        if _executors.get('pid') != pid:
+            workers = int(app.config.get('DERIVATIVE_WORKERS') or 2)
+            _executors.clear()
+            # never fork: the dispatcher (and the web server's) threads may hold locks at that moment
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _executors.update(pid=pid, pool=ProcessPoolExecutor(max_workers=workers, mp_context=context),
+                              dispatcher=ThreadPoolExecutor(max_workers=workers, thread_name_prefix='derivatives'))
+        return _executors['pool'], _executors['dispatcher']
+
+
+def _run(app, asset_id, pool):
+    with app.app_context():
+        try:
+            return generate_for_asset(asset_id, pool) is not None
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('image derivatives failed for asset %s', asset_id)
+            return False
+        finally:
+            db.session.remove()
+
+
+def schedule_derivatives(asset_id, mime_type):
+    """Queue variant generation for a freshly created image Asset; never blocks on the work."""
+    mode = current_app.config.get('DERIVATIVES_MODE', 'async')
+    if mode == 'off' or Image is None or mime_type not in SOURCE_TYPES or not asset_id:
+        return False
+    app = current_app._get_current_object()
+    if mode == 'sync':
+        try:
+            generate_for_asset(asset_id)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('image derivatives failed for asset %s', asset_id)
+        return True
+    pool, dispatcher = _process_pool(app)
+    dispatcher.submit(_run, app, asset_id, pool)
+    return True
+
+
+def generate_many(asset_ids):
+    """Render variants for many assets in parallel (CLI backfill). Returns the number processed."""
+    app = current_app._get_current_object()
+    pool, dispatcher = _process_pool(app)
+    futures = [dispatcher.submit(_run, app, asset_id, pool) for asset_id in asset_ids]
+    return sum(1 for f in futures if f.result())
+
+
+def pick_variant(variants, width, fmt=None):
+    """URL of the smallest variant at least ``width`` wide (the widest one otherwise), or None."""
+    candidates = [v for v in variants or () if fmt is None or v['format'] == fmt]
+    if not candidates:
+        return None
+    wide_enough = [v for v in candidates if v['width'] >= width]
+    best = min(wide_enough, key=lambda v: v['width']) if wide_enough else max(candidates, key=lambda v: v['width'])
+    return best['url']
+
+
+def srcset(variants, fmt):
+    return ', '.join(f"{v['url']} {v['width']}w" for v in sorted(variants or (), key=lambda v: v['width']) if v['format'] == fmt) or None
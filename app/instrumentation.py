@@ -0,0 +1,39 @@
+"""Lightweight request instrumentation.
+
+Counts SQL statements executed while handling a request and, when
+QUERY_COUNT_HEADER is enabled, reports the total in an ``X-Query-Count``
+response header. Handy for checking that cache-warm endpoints stay off the DB.
+"""
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_listener_installed = False
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def query_count():
+    """Number of SQL statements executed so far in the current request."""
+    return g.get('query_count', 0)
+
+
+def init_query_counter(app):
+    global _listener_installed
+    if not _listener_installed:
+        # listen on the Engine class so engines created later (per app) are covered too
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+        _listener_installed = True
+
+    @app.before_request
+    def _reset_query_count():
+        g.query_count = 0
+
+    @app.after_request
+    def _emit_query_count(response):
+        if app.config.get('QUERY_COUNT_HEADER'):
+            response.headers['X-Query-Count'] = str(query_count())
+        return response
@@ -49,8 +49,9 @@ class Lesson(db.Model):  # type: ignore[name-defined]
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, db.ForeignKey("courses.id"), index=True, nullable=False)
     title = db.Column(db.String(255), nullable=False, index=True)
-    # store optional rich/structured content; legacy clients may still use this
-    content_json = db.Column(JSON_COL, nullable=True)
+    # store optional rich/structured content; legacy clients may still use this.
+    # Deferred: loading a Lesson entity does not fetch it (read it with with_entities() or undefer()).
+    content_json = db.deferred(db.Column(JSON_COL, nullable=True))
     # convenience columns derived from admin UI fields in lesson.html
     description = db.Column(db.Text, nullable=True)
     duration = db.Column(db.Integer, nullable=True)
@@ -66,7 +67,8 @@ class Topic(db.Model):  # type: ignore[name-defined]
     id = db.Column(db.Integer, primary_key=True)
     lesson_id = db.Column(db.Integer, db.ForeignKey("lessons.id"), index=True, nullable=False)
     title = db.Column(db.String(255))
-    data_json = db.Column(JSON_COL)
+    # deferred like Lesson.content_json: only loaded when accessed or explicitly undeferred
+    data_json = db.deferred(db.Column(JSON_COL))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class Asset(db.Model):  # type: ignore[name-defined]
@@ -77,18 +79,30 @@ class Asset(db.Model):  # type: ignore[name-defined]
     uploader_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True, nullable=True)
     size = db.Column(db.Integer)
     mime_type = db.Column(db.String(255))
+    # hex SHA-256 of the content; uploads with a known hash reuse the existing asset
+    sha256 = db.Column(db.String(64), index=True, nullable=True)
+    # image dimensions and resized variants ([{width, height, format, url, size}]) from app/derivatives.py
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    variants = db.Column(JSON_COL, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     uploader = db.relationship("User")
 
 class Progress(db.Model):  # type: ignore[name-defined]
     __tablename__ = "progress"
+    # one row per (user, lesson, attempt); submissions rely on it to ignore retries atomically.
+    # NULL attempt_ids never collide, so anonymous attempts are not deduplicated.
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "lesson_id", "attempt_id", name="uq_progress_user_lesson_attempt"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True, nullable=False)
     lesson_id = db.Column(db.Integer, db.ForeignKey("lessons.id"), index=True, nullable=False)
     score = db.Column(db.Float)
     time_spent = db.Column(db.Integer)  # seconds
-    answers = db.Column(JSON_COL)
+    # deferred: progress listings and the Progress.user / .lesson relationships never need it
+    answers = db.deferred(db.Column(JSON_COL))
     attempt_id = db.Column(db.String(255), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
@@ -97,3 +111,19 @@ class Progress(db.Model):  # type: ignore[name-defined]
 
 # Index examples (if you want explicit composite indexes)
 Index("ix_progress_user_lesson", Progress.user_id, Progress.lesson_id)
+
+
+class ProgressSummary(db.Model):  # type: ignore[name-defined]
+    """Per (user, lesson) rollup of Progress, updated in the same transaction as each insert.
+
+    Serves GET /api/v1/users/<id>/progress without scanning progress; rebuild with
+    `flask progress-summary-rebuild` after bulk imports or manual edits.
+    """
+    __tablename__ = "progress_summaries"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    lesson_id = db.Column(db.Integer, db.ForeignKey("lessons.id"), primary_key=True, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    best_score = db.Column(db.Float, nullable=True)
+    total_time_spent = db.Column(db.Integer, nullable=False, default=0)  # seconds
+    first_attempt_at = db.Column(db.DateTime, nullable=True)
+    last_attempt_at = db.Column(db.DateTime, nullable=True)
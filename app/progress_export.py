@@ -0,0 +1,154 @@
+"""Incremental, chunked export of the progress table for offline analytics.
+
+Rows are read in primary-key order, ``chunk_size`` at a time (``WHERE id > :last
+ORDER BY id LIMIT n``), each chunk through a server-side cursor and in its own
+short transaction, so the export never holds a long snapshot or buffers the
+table. Output is Parquet or Arrow IPC when pyarrow is installed, gzip CSV
+otherwise. A JSON checkpoint records the last exported id; the next run only
+exports newer rows.
+"""
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+
+from .extensions import db
+from .models import Progress
+
+try:
+    # pyarrow is optional; without it exports fall back to gzip CSV
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+COLUMNS = ('id', 'user_id', 'lesson_id', 'score', 'time_spent', 'attempt_id', 'created_at', 'answers')
+EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow', 'csv': 'csv.gz'}
+
+
+def resolve_format(fmt):
+    if fmt in (None, 'auto'):
+        return 'parquet' if pa is not None else 'csv'
+    if fmt in ('parquet', 'arrow') and pa is None:
+        raise RuntimeError(f'{fmt} export needs pyarrow (pip install pyarrow) - use --format csv')
+    return fmt
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, encoding='utf8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def write_checkpoint(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf8') as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def iter_chunks(after_id=0, chunk_size=10000, with_answers=True):
+    """Yield lists of row dicts with id > ``after_id`` in id order, one PK range per query."""
+    columns = [getattr(Progress, c) for c in COLUMNS if with_answers or c != 'answers']
+    last_id = after_id
+    while True:
+        stmt = select(*columns).where(Progress.id > last_id).order_by(Progress.id).limit(chunk_size)
+        # stream_results: server-side cursor (SSCursor on MySQL) instead of buffering the chunk client-side
+        result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+        rows = [dict(r._mapping) for r in result]
+        # end the transaction after every chunk so the primary never keeps an old snapshot around
+        db.session.rollback()
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield rows
+
+
+def _serialize(row):
+    row = dict(row)
+    if 'answers' in row and row['answers'] is not None and not isinstance(row['answers'], str):
+        row['answers'] = json.dumps(row['answers'], ensure_ascii=False)
+    if isinstance(row.get('created_at'), datetime):
+        row['created_at'] = row['created_at'].isoformat()
+    return row
+
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self._fh = gzip.open(path, 'wt', encoding='utf8', newline='')
+        self._writer = csv.DictWriter(self._fh, fieldnames=columns)
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(_serialize(r) for r in rows)
+
+    def close(self):
+        self._fh.close()
+
+
+class _ArrowWriter:
+    def __init__(self, path, columns, fmt):
+        fields = {
+            'id': pa.int64(), 'user_id': pa.int64(), 'lesson_id': pa.int64(), 'score': pa.float64(),
+            'time_spent': pa.int64(), 'attempt_id': pa.string(), 'created_at': pa.timestamp('us'), 'answers': pa.string(),
+        }
+        self.schema = pa.schema([(c, fields[c]) for c in columns])
+        if fmt == 'parquet':
+            self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, self.schema)
+
+    def write(self, rows):
+        # answers (JSON) is stored as a string column; everything else keeps its native type
+        rows = [dict(r, answers=_serialize(r)['answers']) if 'answers' in r else r for r in rows]
+        self._writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+        if hasattr(self, '_sink'):
+            self._sink.close()
+
+
+def export_progress(output_dir, fmt='auto', chunk_size=10000, checkpoint=None, full=False, with_answers=True):
+    """Export progress rows newer than the checkpoint to one file in ``output_dir``.
+
+    Returns {"rows", "file", "last_exported_id"}; ``file`` is None when there was nothing new.
+    """
+    fmt = resolve_format(fmt)
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = checkpoint or os.path.join(output_dir, 'progress_export.checkpoint.json')
+    after_id = 0 if full else int(read_checkpoint(checkpoint).get('last_exported_id', 0))
+    columns = [c for c in COLUMNS if with_answers or c != 'answers']
+
+    writer, tmp_path, first_id, last_id, count = None, None, None, after_id, 0
+    try:
+        for rows in iter_chunks(after_id, chunk_size, with_answers):
+            if writer is None:
+                first_id = rows[0]['id']
+                tmp_path = os.path.join(output_dir, f".progress_{first_id}.{EXTENSIONS[fmt]}.partial")
+                writer = _CsvWriter(tmp_path, columns) if fmt == 'csv' else _ArrowWriter(tmp_path, columns, fmt)
+            writer.write(rows)
+            count += len(rows)
+            last_id = rows[-1]['id']
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+    if writer is None:
+        return {"rows": 0, "file": None, "last_exported_id": after_id}
+
+    writer.close()
+    # publish the file and only then advance the checkpoint: a crash re-exports the same range
+    path = os.path.join(output_dir, f"progress_{first_id}-{last_id}.{EXTENSIONS[fmt]}")
+    os.replace(tmp_path, path)
+    write_checkpoint(checkpoint, {"last_exported_id": last_id, "file": os.path.basename(path), "rows": count, "exported_at": time.time()})
+    return {"rows": count, "file": path, "last_exported_id": last_id}
@@ -0,0 +1,317 @@
+"""Write-behind queue for progress submissions.
+
+With ``PROGRESS_WRITE_MODE=queue`` POST /api/v1/progress validates the payload,
+appends it to a durable queue and answers 202 without touching MySQL. A
+separate worker (``flask progress-flush``) drains the queue in batches with
+multi-row insert-or-ignore statements, so a burst of quiz submissions costs a
+handful of commits instead of one pooled connection per request.
+
+Two queue backends are provided:
+
+* Redis list (``PROGRESS_QUEUE_URL``, defaults to ``REDIS_URL``) for multi-node setups.
+* SQLite file in WAL mode (``PROGRESS_QUEUE_PATH``) for a single node without Redis.
+
+Items are only removed after their batch is committed. A worker that dies
+between the commit and the ack re-delivers the batch on restart; every queued
+item carries an ``attempt_id`` and the (user_id, lesson_id, attempt_id) unique
+key turns the replay into no-ops.
+
+Several flushers may run against the same queue (e.g. one per node): each batch
+is taken under a queue-wide lock (Redis ``SET NX`` with a TTL, a row in the
+SQLite file otherwise), so two workers never peek and trim the same head.
+PROGRESS_FLUSH_LOCK_TTL must exceed the slowest batch; a crashed holder only
+blocks the others until it expires. A flush that raises (database down, queue
+unreachable) is logged and retried with exponential backoff up to
+PROGRESS_FLUSH_MAX_BACKOFF seconds.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import Progress
+from .progress_summary import apply_progress_rows
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is in requirements.txt
+    redis = None
+
+
+class RedisProgressQueue:
+    """FIFO on a Redis list; the flusher holding the lock peeks a batch and trims it once committed."""
+
+    # delete the lock only if it is still ours (it may have expired and been taken over)
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url, key='progress:queue'):
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        self.stats_key = f"{key}:stats"
+        self.lock_key = f"{key}:lock"
+
+    def acquire_lock(self, token, ttl):
+        return bool(self.client.set(self.lock_key, token, nx=True, px=int(ttl * 1000)))
+
+    def release_lock(self, token):
+        self.client.eval(self._RELEASE, 1, self.lock_key, token)
+
+    def push(self, item):
+        self.client.rpush(self.key, json.dumps(item))
+
+    def peek(self, limit):
+        raw = self.client.lrange(self.key, 0, limit - 1)
+        return [json.loads(r) for r in raw], len(raw)
+
+    def ack(self, token):
+        # token is the number of items taken from the head by peek()
+        self.client.ltrim(self.key, token, -1)
+
+    def depth(self):
+        return self.client.llen(self.key)
+
+    def oldest_enqueued_at(self):
+        raw = self.client.lindex(self.key, 0)
+        return json.loads(raw)['enqueued_at'] if raw else None
+
+    def record_flush(self, stats):
+        self.client.hset(self.stats_key, mapping={k: json.dumps(v) for k, v in stats.items()})
+
+    def flush_stats(self):
+        return {k.decode(): json.loads(v) for k, v in self.client.hgetall(self.stats_key).items()}
+
+
+class SQLiteProgressQueue:
+    """FIFO in a local SQLite file (WAL mode: appends do not block the flusher's reads)."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, enqueued_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL: durable against process crashes, one fsync per checkpoint
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire_lock(self, token, ttl):
+        now = time.time()
+        with self._conn() as conn:
+            # one write transaction: expiring a dead holder and taking the lock cannot interleave
+            conn.execute("DELETE FROM locks WHERE name = 'flush' AND expires_at < ?", (now,))
+            cur = conn.execute("INSERT OR IGNORE INTO locks (name, token, expires_at) VALUES ('flush', ?, ?)", (token, now + ttl))
+            return cur.rowcount == 1
+
+    def release_lock(self, token):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM locks WHERE name = 'flush' AND token = ?", (token,))
+
+    def push(self, item):
+        with self._conn() as conn:
+            conn.execute("INSERT INTO queue (payload, enqueued_at) VALUES (?, ?)", (json.dumps(item), item['enqueued_at']))
+
+    def peek(self, limit):
+        rows = self._conn().execute("SELECT id, payload FROM queue ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [json.loads(p) for _, p in rows], (rows[-1][0] if rows else None)
+
+    def ack(self, token):
+        # token is the highest queue id returned by peek()
+        if token is not None:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM queue WHERE id <= ?", (token,))
+
+    def depth(self):
+        return self._conn().execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def oldest_enqueued_at(self):
+        row = self._conn().execute("SELECT enqueued_at FROM queue ORDER BY id LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def record_flush(self, stats):
+        with self._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)", [(k, json.dumps(v)) for k, v in stats.items()])
+
+    def flush_stats(self):
+        return {k: json.loads(v) for k, v in self._conn().execute("SELECT name, value FROM stats").fetchall()}
+
+
+def get_progress_queue(app=None):
+    """Return the app's progress queue, created on first use."""
+    app = app or current_app._get_current_object()
+    queue = app.extensions.get('progress_queue')
+    if queue is None:
+        url = app.config.get('PROGRESS_QUEUE_URL')
+        if url and redis is not None:
+            queue = RedisProgressQueue(url)
+        else:
+            queue = SQLiteProgressQueue(app.config.get('PROGRESS_QUEUE_PATH') or os.path.join(app.instance_path, 'progress_queue.sqlite'))
+        app.extensions['progress_queue'] = queue
+    return queue
+
+
+def queue_enabled():
+    return current_app.config.get('PROGRESS_WRITE_MODE') == 'queue'
+
+
+def enqueue_progress(fields):
+    """Append a validated submission; returns the attempt_id the row will be stored under."""
+    item = dict(fields)
+    # every queued item needs a key so a re-delivered batch is ignored instead of duplicated
+    item['attempt_id'] = item.get('attempt_id') or f"q-{uuid.uuid4().hex}"
+    item['enqueued_at'] = time.time()
+    get_progress_queue().push(item)
+    return item['attempt_id']
+
+
+def queue_metrics():
+    queue = get_progress_queue()
+    oldest = queue.oldest_enqueued_at()
+    metrics = {
+        "depth": queue.depth(),
+        # age of the oldest unflushed submission: how far the DB is behind the API
+        "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+    }
+    metrics.update(queue.flush_stats())
+    return metrics
+
+
+def _unstored(rows):
+    """Drop rows whose (user_id, lesson_id, attempt_id) is already stored or repeated in the batch.
+
+    The flusher is the only writer of queued attempt ids, so this single lookup is
+    exact and the per-user summaries are only fed rows that are really new.
+    """
+    stored = set(
+        Progress.query.with_entities(Progress.user_id, Progress.lesson_id, Progress.attempt_id)
+        .filter(Progress.attempt_id.in_({r['attempt_id'] for r in rows})).all()
+    )
+    new_rows = []
+    for row in rows:
+        key = (row['user_id'], row['lesson_id'], row['attempt_id'])
+        if key not in stored:
+            stored.add(key)
+            new_rows.append(row)
+    return new_rows
+
+
+def _insert_rows(rows):
+    # imported lazily: app.api.progress imports this module
+    from .api.progress import insert_progress_rows
+    return insert_progress_rows(rows)
+
+
+def flush_once(batch_size=None):
+    """Move up to ``batch_size`` queued submissions into the progress table.
+
+    Returns {"flushed", "duplicates", "failed"} for the batch, or None when another
+    flusher holds the queue lock.
+    """
+    queue = get_progress_queue()
+    batch_size = batch_size or current_app.config.get('PROGRESS_FLUSH_BATCH_SIZE', 500)
+    lock = uuid.uuid4().hex
+    if not queue.acquire_lock(lock, current_app.config.get('PROGRESS_FLUSH_LOCK_TTL', 60)):
+        return None
+    try:
+        return _flush_batch(queue, batch_size)
+    finally:
+        queue.release_lock(lock)
+
+
+def _flush_batch(queue, batch_size):
+    items, token = queue.peek(batch_size)
+    result = {"flushed": 0, "duplicates": 0, "failed": 0}
+    if not items:
+        return result
+    rows = [
+        dict({k: item.get(k) for k in ('user_id', 'lesson_id', 'attempt_id', 'score', 'time_spent', 'answers')},
+             created_at=datetime.utcfromtimestamp(item['enqueued_at']))
+        for item in items
+    ]
+    new_rows = _unstored(rows)
+    try:
+        inserted = _insert_rows(new_rows) if new_rows else 0
+        if inserted != len(new_rows):
+            # a row was stored meanwhile (or the insert failed): sort the batch out row by row below
+            raise IntegrityError('multi-row insert skipped rows', None, None)
+        apply_progress_rows(new_rows)
+        db.session.commit()
+    except IntegrityError:
+        # one bad row (e.g. a lesson deleted meanwhile) must not block the queue: retry row by row
+        db.session.rollback()
+        inserted = 0
+        for row in new_rows:
+            try:
+                if not _insert_rows([row]):
+                    raise IntegrityError('row skipped', None, None)
+                apply_progress_rows([row])
+                db.session.commit()
+                inserted += 1
+            except IntegrityError:
+                db.session.rollback()
+                result["failed"] += 1
+                current_app.logger.warning('progress queue: dropping row that violates a constraint: %s', row)
+    result["flushed"] = inserted
+    result["duplicates"] = len(rows) - inserted - result["failed"]
+    queue.ack(token)
+    lag = time.time() - items[0]['enqueued_at']
+    previous = queue.flush_stats()
+    queue.record_flush({
+        "last_flush_at": time.time(),
+        "last_batch_size": len(rows),
+        "last_batch_lag_seconds": round(lag, 3),
+        "total_flushed": previous.get('total_flushed', 0) + inserted,
+        "total_failed": previous.get('total_failed', 0) + result["failed"],
+    })
+    return result
+
+
+def run_flusher(batch_size=None, interval=None, once=False):
+    """Drain the queue forever: full batches back to back, otherwise sleep ``interval`` seconds.
+
+    A failing flush is logged and retried after an exponential backoff; with ``once``
+    the error is raised so the command exits non-zero.
+    """
+    batch_size = batch_size or current_app.config.get('PROGRESS_FLUSH_BATCH_SIZE', 500)
+    interval = interval if interval is not None else current_app.config.get('PROGRESS_FLUSH_INTERVAL', 1.0)
+    max_backoff = current_app.config.get('PROGRESS_FLUSH_MAX_BACKOFF', 30.0)
+    failures = 0
+    while True:
+        try:
+            result = flush_once(batch_size)
+        except Exception:
+            # drop the broken transaction/connection; the batch was not acked and is retried
+            db.session.remove()
+            if once:
+                raise
+            failures += 1
+            delay = min(max(interval, 1.0) * 2 ** (failures - 1), max_backoff)
+            current_app.logger.exception('progress queue flush failed (%d in a row), retrying in %.1fs', failures, delay)
+            time.sleep(delay)
+            continue
+        failures = 0
+        if result is None:
+            # another flusher is draining the queue
+            time.sleep(interval)
+            continue
+        if result["flushed"] or result["failed"]:
+            current_app.logger.info('progress queue flush: %s', result)
+        if once and not any(result.values()):
+            return
+        if sum(result.values()) < batch_size and not once:
+            time.sleep(interval)
@@ -0,0 +1,147 @@
+"""Incrementally maintained per-(user, lesson) progress aggregates.
+
+Every path that inserts Progress rows (single submit, batch submit, the
+write-behind flusher) calls ``apply_progress_rows`` in the same transaction,
+which folds the new attempts into ``progress_summaries`` with one upsert:
+
+* attempts and total_time_spent are added,
+* best_score keeps the maximum non-NULL score,
+* first/last_attempt_at widen to cover the new attempts.
+
+``rebuild_summaries`` recomputes the table from ``progress`` (backfill, or
+after rows were changed outside the API).
+"""
+from datetime import datetime
+
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .extensions import db
+from .models import Course, Lesson, Progress, ProgressSummary
+
+
+def _fold(rows):
+    """Collapse new progress rows into one summary delta per (user_id, lesson_id)."""
+    deltas = {}
+    now = datetime.utcnow()
+    for row in rows:
+        key = (row["user_id"], row["lesson_id"])
+        created_at = row.get("created_at") or now
+        score = row.get("score")
+        d = deltas.get(key)
+        if d is None:
+            d = deltas[key] = {
+                "user_id": key[0], "lesson_id": key[1], "attempts": 0, "best_score": None,
+                "total_time_spent": 0, "first_attempt_at": created_at, "last_attempt_at": created_at,
+            }
+        d["attempts"] += 1
+        d["total_time_spent"] += int(row.get("time_spent") or 0)
+        if score is not None and (d["best_score"] is None or score > d["best_score"]):
+            d["best_score"] = score
+        d["first_attempt_at"] = min(d["first_attempt_at"], created_at)
+        d["last_attempt_at"] = max(d["last_attempt_at"], created_at)
+    return list(deltas.values())
+
+
+def _merge_columns(new):
+    """SET clause combining the stored summary with the incoming delta ``new``."""
+    c = ProgressSummary.__table__.c
+    return {
+        "attempts": c.attempts + new.attempts,
+        "total_time_spent": c.total_time_spent + new.total_time_spent,
+        "best_score": case(
+            (new.best_score.is_(None), c.best_score),
+            (or_(c.best_score.is_(None), new.best_score > c.best_score), new.best_score),
+            else_=c.best_score,
+        ),
+        "first_attempt_at": case((new.first_attempt_at < c.first_attempt_at, new.first_attempt_at), else_=c.first_attempt_at),
+        "last_attempt_at": case((new.last_attempt_at > c.last_attempt_at, new.last_attempt_at), else_=c.last_attempt_at),
+    }
+
+
+def apply_progress_rows(rows):
+    """Fold freshly inserted progress rows into progress_summaries. The caller commits."""
+    deltas = _fold(rows)
+    if not deltas:
+        return
+    table = ProgressSummary.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = insert(table).values(deltas)
+        stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'lesson_id'], set_=_merge_columns(stmt.excluded))
+        db.session.execute(stmt)
+    elif dialect == 'mysql':
+        stmt = mysql_insert(table).values(deltas)
+        db.session.execute(stmt.on_duplicate_key_update(**_merge_columns(stmt.inserted)))
+    else:
+        # no upsert available: read-modify-write under the caller's transaction
+        for d in deltas:
+            summary = db.session.get(ProgressSummary, (d["user_id"], d["lesson_id"]))
+            if summary is None:
+                db.session.add(ProgressSummary(**d))
+                continue
+            summary.attempts += d["attempts"]
+            summary.total_time_spent += d["total_time_spent"]
+            if d["best_score"] is not None and (summary.best_score is None or d["best_score"] > summary.best_score):
+                summary.best_score = d["best_score"]
+            summary.first_attempt_at = min(summary.first_attempt_at or d["first_attempt_at"], d["first_attempt_at"])
+            summary.last_attempt_at = max(summary.last_attempt_at or d["last_attempt_at"], d["last_attempt_at"])
+
+
+def rebuild_summaries(user_id=None):
+    """Recompute progress_summaries from progress (all users, or one). Returns the number of summary rows."""
+    summaries = ProgressSummary.query
+    source = db.session.query(
+        Progress.user_id, Progress.lesson_id, func.count(Progress.id), func.max(Progress.score),
+        func.coalesce(func.sum(Progress.time_spent), 0), func.min(Progress.created_at), func.max(Progress.created_at),
+    )
+    if user_id is not None:
+        summaries = summaries.filter_by(user_id=user_id)
+        source = source.filter(Progress.user_id == user_id)
+    source = source.group_by(Progress.user_id, Progress.lesson_id)
+    summaries.delete(synchronize_session=False)
+    columns = ['user_id', 'lesson_id', 'attempts', 'best_score', 'total_time_spent', 'first_attempt_at', 'last_attempt_at']
+    db.session.execute(ProgressSummary.__table__.insert().from_select(columns, source))
+    db.session.commit()
+    return summaries.count()
+
+
+def user_progress(user_id):
+    """Per-course progress of one user: lesson rollups plus completion (attempted / total lessons)."""
+    rows = (
+        db.session.query(ProgressSummary, Lesson.course_id, Lesson.title, Course.title.label('course_title'))
+        .join(Lesson, Lesson.id == ProgressSummary.lesson_id)
+        .join(Course, Course.id == Lesson.course_id)
+        .filter(ProgressSummary.user_id == user_id)
+        .order_by(Lesson.course_id, ProgressSummary.lesson_id)
+        .all()
+    )
+    courses = {}
+    for summary, course_id, lesson_title, course_title in rows:
+        course = courses.setdefault(course_id, {"course_id": course_id, "title": course_title, "lessons": []})
+        course["lessons"].append({
+            "lesson_id": summary.lesson_id,
+            "title": lesson_title,
+            "attempts": summary.attempts,
+            "best_score": summary.best_score,
+            "total_time_spent": summary.total_time_spent,
+            "last_attempt_at": summary.last_attempt_at.isoformat() if summary.last_attempt_at else None,
+        })
+    if courses:
+        totals = dict(
+            Lesson.query.with_entities(Lesson.course_id, func.count(Lesson.id))
+            .filter(Lesson.course_id.in_(courses)).group_by(Lesson.course_id).all()
+        )
+        for course_id, course in courses.items():
+            attempted = len(course["lessons"])
+            total = totals.get(course_id, 0)
+            course.update({
+                "lessons_attempted": attempted,
+                "lessons_total": total,
+                "completion": round(attempted / total, 4) if total else 0.0,
+                "time_spent": sum(l["total_time_spent"] for l in course["lessons"]),
+            })
+    return list(courses.values())
@@ -1,12 +1,19 @@
 from flask import Blueprint, render_template, render_template_string, request, redirect, url_for, session, flash, current_app, send_from_directory
 from app.extensions import db
 from app.models import User
-from app.models import Course, Lesson, Topic, Asset
+from app.admin_auth import admin_api_required, admin_required, current_admin, invalidate_admin_principal
+from app.models import Course, Lesson, Topic, Asset, ProgressSummary
+from app.api.content import remember_content_version, forget_content_version
+from app.api.courses import decode_cursor, encode_cursor, invalidate_course_listing
+from app.api.uploads import store_file
+from app.derivatives import schedule_derivatives
+from app.search import index_course
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import load_only
 from werkzeug.utils import secure_filename
 import uuid
 import json
 import os
-from types import SimpleNamespace
 from datetime import datetime
 import traceback
 
@@ -111,6 +118,7 @@ def admin_login_post():
 
         session.permanent = bool(remember)
         session['admin_user_id'] = user.id
+        invalidate_admin_principal(user.id)
         if is_xhr:
             expires = None
             try:
@@ -135,19 +143,9 @@ def admin_login_post():
 
 
 @admin_bp.route('/dashboard')
+@admin_required
 def admin_dashboard():
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-
-    # Support dev admin sentinel value — create a lightweight user-like object for templates
-    if uid == 'dev_admin':
-        user = SimpleNamespace(id='dev_admin', role='admin', name='Dev Admin', email='dev@local')
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
+    user = current_admin()
 
     # Prefer the packaged `dashboard.html`. If rendering fails (missing or broken),
     # try the project-level `templates/dashboard.html` and finally show the
@@ -169,60 +167,33 @@ def admin_dashboard():
 
 
 @admin_bp.route('/create_course', methods=['GET'])
+@admin_required
 def create_course_page():
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-    # simple access allowed for dev_admin sentinel as well
-    if uid == 'dev_admin':
-        user = SimpleNamespace(id='dev_admin', role='admin', name='Dev Admin', email='dev@local')
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
+    user = current_admin()
     return render_template('create_course.html', user=user, active='create_course')
 
 
 @admin_bp.route('/create_topic', methods=['GET'])
+@admin_required
 def create_topic_page():
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-    if uid == 'dev_admin':
-        user = SimpleNamespace(id='dev_admin', role='admin', name='Dev Admin', email='dev@local')
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
+    user = current_admin()
     # Provide an optional lesson selector so the admin can attach the topic to a lesson.
     selected_lesson = request.args.get('lesson_id')
     try:
-        lessons = Lesson.query.order_by(Lesson.created_at.desc()).all()
+        # the selector only shows id / title / course; content_json is deferred anyway, this skips the rest too
+        lessons = Lesson.query.options(load_only(Lesson.id, Lesson.title, Lesson.course_id)).order_by(Lesson.created_at.desc()).all()
     except Exception:
         lessons = []
     return render_template('create_topic.html', user=user, active='create_topic', lessons=lessons, selected_lesson=selected_lesson)
 
 
 @admin_bp.route('/create_topic', methods=['POST'])
+@admin_required
 def create_topic_post():
     """Create a topic from the admin UI. Accepts JSON or form data.
     Expected fields: title, lesson_id (required), data_json (optional as JSON string) or objectives/cards parsed from form.
     Returns JSON for XHR or redirects back to lesson page.
     """
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-
-    if uid == 'dev_admin':
-        user = None
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
-
     data = request.get_json(silent=True) or request.form or {}
     title = data.get('title') or data.get('topicTitle')
     lesson_id = data.get('lesson_id') or data.get('lessonId') or request.args.get('lesson_id')
@@ -326,23 +297,11 @@ def serve_topic_editor(filename='index.html'):
 
 
 @admin_bp.route('/create_course', methods=['POST'])
+@admin_required
 def create_course_post():
     """Accept form submission to create a Course (admin UI).
     Returns JSON when called via fetch, or redirects back to dashboard on plain form submit.
     """
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-
-    # admin check / dev_admin allowed
-    if uid == 'dev_admin':
-        user = None
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
-
     # Read form fields
     title = request.form.get('title') or request.form.get('courseTitle')
     description = request.form.get('description') or request.form.get('courseDescription')
@@ -402,40 +361,42 @@ def create_course_post():
                 f = request.files['thumbnail']
                 orig_name = secure_filename(f.filename)
                 unique_name = f"{uuid.uuid4().hex}_{orig_name}"
-                UP = current_app.config.get('UPLOAD_PATH', '/tmp/uploads')
-                if not os.path.isabs(UP):
-                    UP = os.path.join(current_app.root_path, UP)
-                os.makedirs(UP, exist_ok=True)
-                filepath = os.path.join(UP, unique_name)
-                f.save(filepath)
-                url = f"/uploads/{unique_name}"
+                # streamed to storage with size and SHA-256 computed in the same pass; an image that
+                # is already stored is not written again and its existing Asset row is reused
+                info, url, asset = store_file(f.stream, unique_name, f.mimetype)
+                is_new = asset is None
 
                 # create Asset in its own transaction
-                try:
-                    asset = Asset(url=url, uploader_id=None, size=os.path.getsize(filepath), mime_type=f.mimetype)
-                    db.session.add(asset)
-                    db.session.commit()
-                except Exception:
-                    # Attempt robust fallback: rollback and try a raw INSERT then lookup the inserted row by URL
-                    try:
-                        db.session.rollback()
-                    except Exception:
-                        current_app.logger.exception('rollback failed after asset create failure')
-                    current_app.logger.exception('Failed to create Asset row for course thumbnail, attempting fallback insert')
+                if asset is None:
                     try:
-                        from sqlalchemy import text
-                        engine = db.get_engine(current_app)
-                        dialect = engine.dialect.name
-                        tsfn = 'NOW()' if dialect not in ('sqlite',) else "CURRENT_TIMESTAMP"
-                        sql = text(f'INSERT INTO assets (url, size, mime_type, created_at) VALUES (:url, :size, :mime_type, {tsfn})')
-                        with engine.begin() as conn:
-                            conn.execute(sql, {'url': url, 'size': os.path.getsize(filepath), 'mime_type': f.mimetype})
-                        # attempt to load the new asset by URL
-                        asset = Asset.query.filter_by(url=url).order_by(Asset.created_at.desc()).first()
-                        if not asset:
-                            current_app.logger.warning('Fallback insert succeeded but asset not found via query')
+                        asset = Asset(url=url, uploader_id=None, size=info['size'], mime_type=info['mime_type'], sha256=info['sha256'])
+                        db.session.add(asset)
+                        db.session.commit()
                     except Exception:
-                        current_app.logger.exception('Fallback asset insert also failed')
+                        # Attempt robust fallback: rollback and try a raw INSERT then lookup the inserted row by URL
+                        try:
+                            db.session.rollback()
+                        except Exception:
+                            current_app.logger.exception('rollback failed after asset create failure')
+                        current_app.logger.exception('Failed to create Asset row for course thumbnail, attempting fallback insert')
+                        try:
+                            from sqlalchemy import text
+                            engine = db.get_engine(current_app)
+                            dialect = engine.dialect.name
+                            tsfn = 'NOW()' if dialect not in ('sqlite',) else "CURRENT_TIMESTAMP"
+                            sql = text(f'INSERT INTO assets (url, size, mime_type, created_at) VALUES (:url, :size, :mime_type, {tsfn})')
+                            with engine.begin() as conn:
+                                conn.execute(sql, {'url': url, 'size': info['size'], 'mime_type': info['mime_type']})
+                            # attempt to load the new asset by URL
+                            asset = Asset.query.filter_by(url=url).order_by(Asset.created_at.desc()).first()
+                            if not asset:
+                                current_app.logger.warning('Fallback insert succeeded but asset not found via query')
+                        except Exception:
+                            current_app.logger.exception('Fallback asset insert also failed')
+
+                if is_new and asset is not None and getattr(asset, 'id', None):
+                    # grid-sized WebP/JPEG variants are rendered in the background; list_courses picks them up
+                    schedule_derivatives(asset.id, info['mime_type'])
 
                 # If an asset object exists (either created normally or via fallback), attach it to the course
                 if 'asset' in locals() and asset is not None:
@@ -482,6 +443,13 @@ def create_course_post():
                     current_app.logger.exception('Failed to attach provided thumbnail fields to course')
         except Exception:
             current_app.logger.exception('Error processing thumbnail_asset_id/thumbnail_url from form')
+
+        # the new course changes catalog aggregates (cached counts) and the search index
+        invalidate_course_listing()
+        try:
+            index_course(course)
+        except Exception:
+            current_app.logger.exception('Failed to update course search index')
     except Exception as e:
         # Log full exception stack for server logs
         current_app.logger.exception('Failed to create course')
@@ -516,99 +484,181 @@ def create_course_post():
 
 
 @admin_bp.route('/lesson', methods=['GET'])
+@admin_required
 def lesson_page():
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-    if uid == 'dev_admin':
-        user = SimpleNamespace(id='dev_admin', role='admin', name='Dev Admin', email='dev@local')
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
-    # Provide courses and categories to the lesson template so the client
-    # can populate the course selector without hard-coded sample data.
+    user = current_admin()
+    # Only the category list is rendered; courses, lessons and topics are fetched page by page
+    # from the /admin/api/* endpoints below, so the page stays the same size as content grows.
     try:
-        # Courses
-        courses_q = Course.query.order_by(Course.title).all()
-        courses = [
-            {
-                'id': c.id,
-                'name': c.title,
-                'category': c.category or '',
-                'class_name': c.class_name or ''
-            }
-            for c in courses_q
-        ]
-
-        # extract distinct categories (preserve ordering)
-        seen = set()
-        categories = []
-        for c in courses:
-            cat = c.get('category') or ''
-            if cat and cat not in seen:
-                seen.add(cat)
-                categories.append({'name': cat})
-
-        # Lessons
-        lessons_q = Lesson.query.order_by(Lesson.created_at.desc()).all()
-        lessons = [
-            {
-                'id': l.id,
-                'courseId': l.course_id,
-                'title': l.title,
-                'description': l.description,
-                'duration': l.duration,
-                'level': l.level,
-                'objectives': l.objectives
-            }
-            for l in lessons_q
-        ]
-
-        # Topics
-        topics_q = Topic.query.order_by(Topic.created_at.asc()).all()
-        topics = []
-        for t in topics_q:
-            data = t.data_json or {}
-            topic_obj = {
-                'id': t.id,
-                'lessonId': t.lesson_id,
-                'title': t.title,
-                'type': None,
-                'content': None
-            }
-            if isinstance(data, dict):
-                topic_obj['type'] = data.get('type')
-                topic_obj['content'] = data.get('content')
-            topics.append(topic_obj)
-
+        rows = db.session.query(Course.category).filter(Course.category.isnot(None), Course.category != '') \
+            .distinct().order_by(Course.category).all()
+        categories = [{'name': r.category} for r in rows]
     except Exception:
-        courses = []
         categories = []
-        lessons = []
-        topics = []
 
-    return render_template('lesson.html', user=user, active='lesson', courses=courses, categories=categories, lessons=lessons, topics=topics)
+    return render_template('lesson.html', user=user, active='lesson', categories=categories,
+                           course_id=request.args.get('course_id', type=int),
+                           page_size=current_app.config.get('ADMIN_PAGE_SIZE', 50))
+
+
+# --- admin data API (JSON) used by lesson.html -----------------------------------------
+
+# fields a client may request with ?fields=a,b,c; anything else is a 400
+ADMIN_COURSE_FIELDS = ('id', 'title', 'category', 'class_name', 'created_at')
+ADMIN_LESSON_FIELDS = ('id', 'course_id', 'title', 'description', 'duration', 'level', 'objectives', 'created_at',
+                       'course_title', 'course_category', 'topic_count')
+ADMIN_TOPIC_FIELDS = ('id', 'lesson_id', 'title', 'type', 'content', 'created_at')
+
+
+def _requested_fields(allowed, default):
+    raw = request.args.get('fields')
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def _page_limit():
+    limit = request.args.get('limit', current_app.config.get('ADMIN_PAGE_SIZE', 50), type=int)
+    return max(1, min(limit or 1, current_app.config.get('ADMIN_PAGE_MAX', 200)))
+
+
+def _keyset_page(q, keys, limit, descending=False):
+    """One page of ``q`` ordered by ``keys`` (sort column, then primary key) after ?cursor=; no OFFSET, no COUNT.
+
+    Both queries filter and sort on the raw columns, so they stay on the column's index. Rows whose
+    sort column is NULL form a second tier after all others, ordered by primary key; the cursor
+    carries None once it is inside that tier.
+    """
+    col, pk = keys
+    cursor = request.args.get('cursor')
+    value = last_id = None
+    if cursor:
+        value, last_id = decode_cursor(cursor, (col.type.python_type, pk.type.python_type), nullable=col.nullable)
+
+    def ordered(tier, columns, count):
+        return tier.order_by(*[c.desc() if descending else c.asc() for c in columns]).limit(count).all()
+
+    rows = []
+    if not cursor or value is not None:
+        tier = q.filter(col.isnot(None))
+        if cursor:
+            if descending:
+                tier = tier.filter(or_(col < value, and_(col == value, pk < last_id)))
+            else:
+                tier = tier.filter(or_(col > value, and_(col == value, pk > last_id)))
+        rows = ordered(tier, (col, pk), limit + 1)
+    if len(rows) <= limit and col.nullable:
+        # dated rows are exhausted: continue with the NULL tier
+        tier = q.filter(col.is_(None))
+        if cursor and value is None:
+            tier = tier.filter(pk < last_id if descending else pk > last_id)
+        rows += ordered(tier, (pk,), limit + 1 - len(rows))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(getattr(rows[-1], col.key), getattr(rows[-1], pk.key)) if has_more else None
+    return rows, {"limit": limit, "has_more": has_more, "next_cursor": next_cursor}
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+@admin_bp.route('/api/courses', methods=['GET'])
+@admin_api_required
+def admin_api_courses():
+    """Courses for the lesson page selectors: ?category=, ?fields=, ?limit=, ?cursor= (ordered by title)."""
+    try:
+        fields = _requested_fields(ADMIN_COURSE_FIELDS, ('id', 'title', 'category'))
+        q = Course.query.with_entities(*{getattr(Course, f) for f in fields} | {Course.title})
+        if request.args.get('category'):
+            q = q.filter(Course.category == request.args['category'])
+        rows, meta = _keyset_page(q, (Course.title, Course.id), _page_limit())
+    except ValueError as e:
+        return {"success": False, "error": str(e), "code": 400}, 400
+    data = [{f: _json_value(getattr(r, f)) for f in fields} for r in rows]
+    return {"success": True, "data": data, "meta": meta}
+
+
+@admin_bp.route('/api/lessons', methods=['GET'])
+@admin_api_required
+def admin_api_lessons():
+    """Lessons, newest first: ?course_id=, ?lesson_id=, ?fields=, ?limit=, ?cursor=."""
+    try:
+        fields = _requested_fields(ADMIN_LESSON_FIELDS, ('id', 'course_id', 'title', 'description', 'duration',
+                                                         'level', 'objectives', 'course_title', 'topic_count'))
+        columns = {Lesson.id, Lesson.created_at}
+        for f in fields:
+            if f == 'course_title':
+                columns.add(Course.title.label('course_title'))
+            elif f == 'course_category':
+                columns.add(Course.category.label('course_category'))
+            elif f == 'topic_count':
+                # correlated COUNT over ix_topics_lesson_id, only for the lessons on this page
+                columns.add(db.select(func.count(Topic.id)).where(Topic.lesson_id == Lesson.id)
+                            .correlate(Lesson).scalar_subquery().label('topic_count'))
+            else:
+                columns.add(getattr(Lesson, f))
+        q = db.session.query(*columns).select_from(Lesson)
+        if 'course_title' in fields or 'course_category' in fields:
+            q = q.outerjoin(Course, Course.id == Lesson.course_id)
+        course_id = request.args.get('course_id')
+        if course_id:
+            q = q.filter(Lesson.course_id == int(course_id))
+        lesson_id = request.args.get('lesson_id')
+        if lesson_id:
+            q = q.filter(Lesson.id == int(lesson_id))
+        rows, meta = _keyset_page(q, (Lesson.created_at, Lesson.id), _page_limit(), descending=True)
+    except ValueError as e:
+        return {"success": False, "error": str(e), "code": 400}, 400
+    data = [{f: _json_value(getattr(r, f)) for f in fields} for r in rows]
+    return {"success": True, "data": data, "meta": meta}
+
+
+@admin_bp.route('/api/topics', methods=['GET'])
+@admin_api_required
+def admin_api_topics():
+    """Topics in creation order: ?lesson_id=, ?fields=, ?limit=, ?cursor=.
+
+    ``type`` and ``content`` live in ``data_json``; the column is only selected (and decoded) when one of them is requested.
+    """
+    try:
+        fields = _requested_fields(ADMIN_TOPIC_FIELDS, ('id', 'lesson_id', 'title'))
+        columns = {Topic.id, Topic.created_at}
+        columns.update(getattr(Topic, f) for f in fields if f not in ('type', 'content'))
+        needs_data = 'type' in fields or 'content' in fields
+        if needs_data:
+            columns.add(Topic.data_json)
+        q = db.session.query(*columns).select_from(Topic)
+        lesson_id = request.args.get('lesson_id')
+        if lesson_id:
+            q = q.filter(Topic.lesson_id == int(lesson_id))
+        rows, meta = _keyset_page(q, (Topic.created_at, Topic.id), _page_limit())
+    except ValueError as e:
+        return {"success": False, "error": str(e), "code": 400}, 400
+    data = []
+    for r in rows:
+        item = {f: _json_value(getattr(r, f)) for f in fields if f not in ('type', 'content')}
+        if needs_data:
+            payload = r.data_json if isinstance(r.data_json, dict) else {}
+            for f in ('type', 'content'):
+                if f in fields:
+                    item[f] = payload.get(f)
+        data.append(item)
+    return {"success": True, "data": data, "meta": meta}
 
 
 @admin_bp.route('/create_lesson', methods=['POST'])
+@admin_required
 def create_lesson_post():
     """Create a lesson from the admin UI. Accepts form or JSON with title and course_id.
     Returns JSON for XHR or redirects back to lesson page.
     """
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-
-    if uid == 'dev_admin':
-        user = None
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
-
     # support both JSON and form submission
     data = request.get_json(silent=True) or request.form or {}
     title = data.get('title') or data.get('lessonTitle')
@@ -668,23 +718,12 @@ def create_lesson_post():
 
 
 @admin_bp.route('/update_lesson', methods=['POST'])
+@admin_required
 def update_lesson_post():
     """Update an existing lesson from admin UI. Accepts JSON or form data.
     Expected fields: id (or lesson_id), title, course_id, description, duration, level, objectives.
     Returns JSON for XHR or redirects back to lesson page.
     """
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-
-    if uid == 'dev_admin':
-        user = None
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
-
     data = request.get_json(silent=True) or request.form or {}
     lid = data.get('id') or data.get('lesson_id')
     if not lid:
@@ -723,6 +762,8 @@ def update_lesson_post():
             lesson.objectives = objectives
 
         db.session.commit()
+        # keep the content version index in sync for /api/v1/content readers
+        remember_content_version(lesson.id, lesson.content_version)
     except Exception:
         current_app.logger.exception('Failed to update lesson')
         if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -736,20 +777,9 @@ def update_lesson_post():
 
 
 @admin_bp.route('/delete_lesson', methods=['POST'])
+@admin_required
 def delete_lesson_post():
     """Delete a lesson and its topics from admin UI. Accepts JSON or form with id/lesson_id."""
-    uid = session.get('admin_user_id')
-    if not uid:
-        return redirect(url_for('admin_bp.admin_login_get'))
-
-    if uid == 'dev_admin':
-        user = None
-    else:
-        user = User.query.get(uid)
-        if not user or user.role != 'admin':
-            session.pop('admin_user_id', None)
-            return redirect(url_for('admin_bp.admin_login_get'))
-
     data = request.get_json(silent=True) or request.form or {}
     lid = data.get('id') or data.get('lesson_id')
     if not lid:
@@ -761,8 +791,10 @@ def delete_lesson_post():
     try:
         # delete topics first
         Topic.query.filter_by(lesson_id=lid).delete()
+        ProgressSummary.query.filter_by(lesson_id=lid).delete()
         Lesson.query.filter_by(id=lid).delete()
         db.session.commit()
+        forget_content_version(lid)
     except Exception:
         current_app.logger.exception('Failed to delete lesson')
         db.session.rollback()
@@ -778,7 +810,7 @@ def delete_lesson_post():
 
 @admin_bp.route('/logout')
 def admin_logout():
-    session.pop('admin_user_id', None)
+    invalidate_admin_principal(session.pop('admin_user_id', None))
     flash('Logged out', 'info')
     # redirect to the site root (home endpoint)
     return redirect(url_for('home'))
@@ -0,0 +1,116 @@
+"""App-scoped S3 storage service.
+
+One boto3 client per app, built in ``create_app`` (or on first use when S3 is
+configured later), instead of ``boto3.client('s3')`` per request: credentials
+and the endpoint are resolved once and the client's urllib3 pool keeps TLS
+connections alive between uploads. boto3 clients are thread-safe once created,
+so every request/thread shares it; creation itself goes through a private
+``boto3.session.Session`` under a lock because the default session is not.
+
+The pool size, timeouts and retries come from ``S3_*`` config (botocore
+``Config``); ``S3TransferConfig`` (multipart threshold / part size / concurrency)
+is used for whole-file uploads. ``S3_ENDPOINT_URL`` points the client at a
+MinIO / moto server for local development and tests.
+
+boto3 is optional; ``get_s3()`` raises RuntimeError when S3 is configured without it.
+"""
+import threading
+
+from flask import current_app
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+except ImportError:
+    boto3 = None
+
+from .upload_stream import S3MultipartSink
+
+_lock = threading.Lock()
+
+
+class S3Storage:
+    def __init__(self, client, bucket, transfer_config=None, part_size=8 * 1024 * 1024, public_url=None):
+        self.client = client
+        self.bucket = bucket
+        self.transfer_config = transfer_config
+        self.part_size = part_size
+        self._public_url = public_url
+
+    @classmethod
+    def from_config(cls, config):
+        if boto3 is None:
+            raise RuntimeError("boto3 is required for S3 uploads")
+        client_config = BotoConfig(
+            max_pool_connections=config.get('S3_MAX_POOL_CONNECTIONS', 50),
+            connect_timeout=config.get('S3_CONNECT_TIMEOUT', 5),
+            read_timeout=config.get('S3_READ_TIMEOUT', 60),
+            retries={'max_attempts': config.get('S3_MAX_ATTEMPTS', 5), 'mode': 'adaptive'},
+            tcp_keepalive=True,
+        )
+        session = boto3.session.Session(
+            aws_access_key_id=config.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=config.get('AWS_SECRET_ACCESS_KEY'),
+            region_name=config.get('AWS_REGION'),
+        )
+        client = session.client('s3', endpoint_url=config.get('S3_ENDPOINT_URL') or None, config=client_config)
+        part_size = config.get('S3_MULTIPART_PART_SIZE', 8 * 1024 * 1024)
+        transfer_config = TransferConfig(
+            multipart_threshold=config.get('S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024),
+            multipart_chunksize=part_size,
+            max_concurrency=config.get('S3_TRANSFER_CONCURRENCY', 8),
+            use_threads=True,
+        )
+        return cls(client, config['S3_BUCKET'], transfer_config, part_size, config.get('S3_PUBLIC_URL'))
+
+    def public_url(self, key):
+        if self._public_url:
+            return f"{self._public_url.rstrip('/')}/{key}"
+        endpoint = self.client.meta.endpoint_url
+        if 'amazonaws.com' not in endpoint:
+            # MinIO and friends: path-style URLs
+            return f"{endpoint.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+    def multipart_sink(self, key, extra_args=None):
+        """Sink for ingest(): streams an upload of unknown length as multipart parts."""
+        return S3MultipartSink(self.client, self.bucket, key, self.part_size, extra_args=extra_args)
+
+    def upload_file(self, fileobj, key, extra_args=None):
+        """Upload a seekable file; large files go up as parallel parts per the transfer config."""
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args or None, Config=self.transfer_config)
+
+    def presigned_post(self, key, content_type, expires_in=3600):
+        return self.client.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[["starts-with", "$Content-Type", ""]],
+            ExpiresIn=expires_in,
+        )
+
+
+def init_s3(app):
+    """Build the app's S3 service up front when S3_BUCKET is configured."""
+    app.extensions.pop('s3', None)
+    if app.config.get('S3_BUCKET'):
+        try:
+            get_s3(app)
+        except RuntimeError:
+            app.logger.warning('S3_BUCKET is set but boto3 is not installed; S3 uploads will fail')
+
+
+def get_s3(app=None):
+    """The app's S3Storage, or None when S3 is not configured."""
+    app = app or current_app._get_current_object()
+    storage = app.extensions.get('s3')
+    if storage is not None and storage.bucket == app.config.get('S3_BUCKET'):
+        return storage
+    if not app.config.get('S3_BUCKET'):
+        return None
+    with _lock:
+        storage = app.extensions.get('s3')
+        if storage is None or storage.bucket != app.config.get('S3_BUCKET'):
+            storage = app.extensions['s3'] = S3Storage.from_config(app.config)
+    return storage
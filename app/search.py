@@ -0,0 +1,178 @@
+"""Course catalog search.
+
+On MySQL the ``ft_courses_search`` FULLTEXT index (title, description, tags,
+category, class_name) is queried in boolean mode with prefix terms and ordered
+by relevance. Everywhere else (SQLite dev DB, tests), or when that index is
+missing, a per-process inverted index with the same semantics is used:
+every query term must match a word prefix, and hits are ranked by a weighted
+term score (title and tags count more than description).
+
+The in-process index is kept up to date incrementally by ``index_course``
+(called from the admin course routes) and is rebuilt lazily whenever another
+process has bumped the catalog generation.
+"""
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import text
+
+from .extensions import db
+from .models import Course
+
+SEARCH_FIELDS = ('title', 'description', 'tags', 'category', 'class_name')
+FIELD_WEIGHTS = {'title': 3.0, 'tags': 2.0, 'category': 2.0, 'class_name': 1.5, 'description': 1.0}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(value):
+    return [t.lower() for t in _TOKEN_RE.findall(value or '')]
+
+
+class InvertedIndex:
+    """Word -> {course_id: weighted term frequency}, with prefix lookup over a sorted vocabulary."""
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._vocab = []
+        self._lock = threading.RLock()
+        self.generation = None
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, course_id, fields):
+        weights = defaultdict(float)
+        for name in SEARCH_FIELDS:
+            for token in tokenize(fields.get(name)):
+                weights[token] += FIELD_WEIGHTS[name]
+        with self._lock:
+            self._remove(course_id)
+            for token, weight in weights.items():
+                if token not in self._postings:
+                    bisect.insort(self._vocab, token)
+                self._postings[token][course_id] = weight
+            self._doc_terms[course_id] = list(weights)
+
+    def remove(self, course_id):
+        with self._lock:
+            self._remove(course_id)
+
+    def _remove(self, course_id):
+        for token in self._doc_terms.pop(course_id, ()):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(course_id, None)
+            if not posting:
+                del self._postings[token]
+                i = bisect.bisect_left(self._vocab, token)
+                if i < len(self._vocab) and self._vocab[i] == token:
+                    del self._vocab[i]
+
+    def _expand(self, prefix):
+        i = bisect.bisect_left(self._vocab, prefix)
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            yield self._vocab[i]
+            i += 1
+
+    def search(self, query):
+        """Return [(course_id, score)] best first; every query term must prefix-match a word."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            n_docs = max(len(self._doc_terms), 1)
+            scores = None
+            for term in terms:
+                term_scores = defaultdict(float)
+                for word in self._expand(term):
+                    posting = self._postings[word]
+                    idf = math.log(1 + n_docs / len(posting))
+                    # exact word matches rank above longer words that merely share the prefix
+                    boost = 1.0 if word == term else 0.5
+                    for course_id, weight in posting.items():
+                        term_scores[course_id] += weight * idf * boost
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {cid: s + term_scores[cid] for cid, s in scores.items() if cid in term_scores}
+                if not scores:
+                    return []
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+
+_index = InvertedIndex()
+
+
+def _course_fields(course):
+    return {name: getattr(course, name, None) for name in SEARCH_FIELDS}
+
+
+def _rebuild(generation):
+    index = InvertedIndex()
+    rows = Course.query.with_entities(Course.id, *[getattr(Course, f) for f in SEARCH_FIELDS]).all()
+    for row in rows:
+        index.add(row.id, _course_fields(row))
+    index.generation = generation
+    return index
+
+
+def _local_index():
+    global _index
+    # imported lazily: app.api.courses imports this module
+    from .api.courses import catalog_generation
+    generation = catalog_generation()
+    if _index.generation != generation:
+        _index = _rebuild(generation)
+    return _index
+
+
+def index_course(course):
+    """Incremental index update after a course insert/update has been committed."""
+    from .api.courses import catalog_generation
+    if _index.generation is None:
+        # nothing built yet in this process; the first search builds from the DB
+        return
+    _index.add(course.id, _course_fields(course))
+    # this process is now current with the write that bumped the generation
+    _index.generation = catalog_generation()
+
+
+def _use_mysql():
+    backend = current_app.config.get('COURSE_SEARCH_BACKEND', 'auto')
+    if backend == 'memory':
+        return False
+    return db.engine.dialect.name == 'mysql'
+
+
+def _mysql_search(query, limit, offset):
+    terms = tokenize(query)
+    if not terms:
+        return [], 0
+    boolean_query = ' '.join(f"+{t}*" for t in terms)
+    match = "MATCH(title, description, tags, category, class_name) AGAINST (:q IN BOOLEAN MODE)"
+    rows = db.session.execute(
+        text(f"SELECT id, {match} AS score FROM courses WHERE {match} ORDER BY score DESC, id DESC LIMIT :limit OFFSET :offset"),
+        {'q': boolean_query, 'limit': limit, 'offset': offset},
+    ).all()
+    total = db.session.execute(text(f"SELECT COUNT(*) FROM courses WHERE {match}"), {'q': boolean_query}).scalar()
+    return [(r.id, float(r.score)) for r in rows], int(total or 0)
+
+
+def search_course_ids(query, limit=20, offset=0):
+    """Return ([(course_id, score)], total_matches) ranked by relevance."""
+    if _use_mysql():
+        try:
+            return _mysql_search(query, limit, offset)
+        except Exception:
+            # FULLTEXT index missing (schema created without migrations): fall back to the local index
+            db.session.rollback()
+            current_app.logger.warning('MySQL FULLTEXT search failed; using in-process course index', exc_info=True)
+    hits = _local_index().search(query)
+    return hits[offset:offset + limit], len(hits)
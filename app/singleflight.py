@@ -0,0 +1,172 @@
+"""Stampede protection for expensive cache fills.
+
+``get_or_build`` coalesces concurrent misses on the same key: one caller rebuilds
+while the rest briefly wait for the result or, when the caller allows it, are
+served an older cached value (e.g. the previous content_version). The rebuild
+lock lives in Redis when the cache is Redis-backed (so it spans gunicorn
+workers) and always in-process as well (threads of one worker, SimpleCache).
+
+Entries also record how long they took to build so hot keys can be refreshed
+probabilistically shortly before they expire ("XFetch"), instead of every
+reader missing at the same instant.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from flask import current_app
+from flask_caching.backends.rediscache import RedisCache
+
+from .extensions import cache
+
+# value plus the metadata needed for probabilistic early refresh
+Entry = namedtuple('Entry', ['value', 'delta', 'expires'])
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+def _redis_client():
+    backend = cache.cache
+    client = getattr(backend, '_redis', None)  # TieredCache
+    if client is None and isinstance(backend, RedisCache):
+        client = backend._write_client
+    return client
+
+
+class _RebuildLock:
+    """Non-blocking lock held by the single caller allowed to rebuild ``key``."""
+
+    def __init__(self, key, ttl):
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self._local = None
+        self._redis = None
+
+    def acquire(self):
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(self.key, threading.Lock())
+        if not lock.acquire(blocking=False):
+            return False
+        self._local = lock
+        client = _redis_client()
+        if client is not None:
+            try:
+                if not client.set(f"lock:{self.key}", self.token, nx=True, px=int(self.ttl * 1000)):
+                    self._release_local()
+                    return False
+                self._redis = client
+            except Exception:
+                # Redis unavailable: fall back to coalescing within this worker only
+                current_app.logger.warning('rebuild lock: redis unavailable for %s', self.key)
+        return True
+
+    def _release_local(self):
+        if self._local is not None:
+            with _local_locks_guard:
+                # drop the per-key lock so the registry does not grow with every version ever built
+                if _local_locks.get(self.key) is self._local:
+                    del _local_locks[self.key]
+            self._local.release()
+            self._local = None
+
+    def release(self):
+        if self._redis is not None:
+            try:
+                self._redis.eval(_RELEASE_SCRIPT, 1, f"lock:{self.key}", self.token)
+            except Exception:
+                current_app.logger.warning('rebuild lock: failed to release %s', self.key)
+            self._redis = None
+        self._release_local()
+
+
+def _timeout():
+    return current_app.config.get('CACHE_DEFAULT_TIMEOUT') or 0
+
+
+def _should_refresh_early(entry):
+    beta = float(current_app.config.get('CACHE_EARLY_REFRESH_BETA', 1.0))
+    if not entry.expires or beta <= 0:
+        return False
+    # XFetch: the closer to expiry and the slower the rebuild, the likelier an early refresh
+    return time.time() - entry.delta * beta * math.log(1.0 - random.random()) >= entry.expires
+
+
+def make_entry(value, delta=0):
+    """Wrap ``value`` for storage under a key that ``get_or_build`` also reads.
+
+    ``delta`` is how long the value took to build, in seconds.
+    """
+    timeout = _timeout()
+    return Entry(value, delta, time.time() + timeout if timeout else 0)
+
+
+def unwrap(raw):
+    if isinstance(raw, Entry):
+        return raw
+    # plain value written without metadata (e.g. before this module existed)
+    return Entry(raw, 0, 0)
+
+
+def _store(key, build):
+    started = time.time()
+    value, extras = build()
+    mapping = dict(extras or {})
+    mapping[key] = make_entry(value, time.time() - started)
+    cache.set_many(mapping, timeout=_timeout() or None)
+    return value
+
+
+def get_or_build(key, build, fallback_keys=()):
+    """Return ``(value, state, served_key)`` for ``key``.
+
+    ``build()`` returns ``(value, extras)`` where ``extras`` is a mapping of additional
+    keys to store alongside (may be empty). ``state`` is ``'hit'``, ``'miss'`` (built by
+    this caller) or ``'stale'`` (``value`` came from one of ``fallback_keys`` while another
+    caller rebuilds ``key``); ``served_key`` says which key the value belongs to.
+    """
+    raw = cache.get(key)
+    if raw is not None:
+        entry = unwrap(raw)
+        if _should_refresh_early(entry):
+            lock = _RebuildLock(key, current_app.config.get('CACHE_LOCK_TIMEOUT', 10))
+            if lock.acquire():
+                try:
+                    return _store(key, build), 'miss', key
+                finally:
+                    lock.release()
+        return entry.value, 'hit', key
+
+    lock = _RebuildLock(key, current_app.config.get('CACHE_LOCK_TIMEOUT', 10))
+    if lock.acquire():
+        try:
+            # the previous holder may have filled the key between our miss and the acquire
+            raw = cache.get(key)
+            if raw is not None:
+                return unwrap(raw).value, 'hit', key
+            return _store(key, build), 'miss', key
+        finally:
+            lock.release()
+
+    # someone else is rebuilding: prefer an older value over waiting
+    for fallback in fallback_keys:
+        raw = cache.get(fallback)
+        if raw is not None:
+            return unwrap(raw).value, 'stale', fallback
+
+    deadline = time.time() + float(current_app.config.get('CACHE_LOCK_WAIT', 2.0))
+    while time.time() < deadline:
+        time.sleep(0.05)
+        raw = cache.get(key)
+        if raw is not None:
+            return unwrap(raw).value, 'hit', key
+
+    # the rebuilding caller is too slow (or died holding the lock): build without it
+    current_app.logger.warning('rebuild lock wait timed out for %s', key)
+    return _store(key, build), 'miss', key
@@ -0,0 +1,304 @@
+"""Storage backends for uploaded files.
+
+Handlers never touch the filesystem or S3 directly; they go through the app's
+backend (``get_storage()``), addressed by a *key* (the stored file name, e.g.
+``3f2a..._logo.png``):
+
+* ``LocalStorage``  - files under UPLOAD_PATH, served by ``/uploads/<key>``
+* ``S3Backend``     - objects under ``uploads/<key>`` in S3_BUCKET (shared client from app/s3.py)
+* ``MemoryStorage`` - a dict, for tests and benchmarks
+
+``STORAGE_BACKEND`` picks one (``auto``: S3 when S3_BUCKET is set, else local).
+Every backend offers the same operations: a streaming writer (``sink``) for
+``upload_stream.ingest``, ``put_file`` to publish a staged local file, streaming
+ranged reads (``open``), ``stat`` / ``exists`` / ``delete``, public URLs and,
+where the backend supports them, presigned URLs.
+"""
+import errno
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+from urllib.parse import quote, unquote
+
+from flask import current_app
+
+from .s3 import get_s3
+from .upload_stream import LocalSink
+
+URL_PREFIX = '/uploads/'
+_lock = threading.Lock()
+
+
+class StorageBackend:
+    name = None
+
+    def sink(self, key):
+        """Writer for ``ingest``: open(mime_type) / write(chunk) / close() publishes / abort()."""
+        raise NotImplementedError
+
+    def put_file(self, path, key, mime_type=None):
+        """Publish the local file at ``path`` under ``key``; the file is consumed."""
+        raise NotImplementedError
+
+    def put(self, stream, key, mime_type=None, chunk_size=1024 * 1024):
+        """Streaming put from a file-like object."""
+        sink = self.sink(key)
+        sink.open(mime_type or mimetypes.guess_type(key)[0] or 'application/octet-stream')
+        try:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                sink.write(chunk)
+            sink.close()
+        except BaseException:
+            sink.abort()
+            raise
+
+    def open(self, key, start=0, end=None, chunk_size=1024 * 1024):
+        """Iterate over bytes ``start`` .. ``end`` (inclusive; None = to the end) of ``key``."""
+        raise NotImplementedError
+
+    def stat(self, key):
+        """{"size", "mtime", "mime_type"} or None when missing."""
+        raise NotImplementedError
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def url(self, key):
+        return URL_PREFIX + quote(key)
+
+    def key_for_url(self, url):
+        """Key of a URL this backend produced, or None."""
+        if url and url.startswith(URL_PREFIX):
+            return unquote(url[len(URL_PREFIX):])
+        return None
+
+    def local_path(self, key):
+        """Filesystem path when the backend is a local directory (lets the web server send it), else None."""
+        return None
+
+    def presigned_url(self, key, expires_in=3600):
+        """Time-limited download URL; backends without signing return the public URL."""
+        return self.url(key)
+
+    def presigned_upload(self, key, content_type, expires_in=3600):
+        """{"url", "fields"} for a direct browser upload; only S3 supports it."""
+        raise NotImplementedError(f"presigned uploads are not supported by the {self.name} backend")
+
+
+def _ranged_file_reader(fh, start, end, chunk_size):
+    with fh:
+        fh.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = fh.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+class LocalStorage(StorageBackend):
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"invalid storage key {key!r}")
+        return path
+
+    def sink(self, key):
+        return LocalSink(self.root, key)
+
+    def put_file(self, path, key, mime_type=None):
+        os.makedirs(self.root, exist_ok=True)
+        target = self._path(key)
+        try:
+            os.replace(path, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # staging lives on another filesystem (e.g. instance/ vs an UPLOAD_PATH volume):
+            # copy next to the target first so readers never see a partial file
+            tmp = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.{uuid.uuid4().hex}.part")
+            try:
+                shutil.copyfile(path, tmp)
+                os.replace(tmp, target)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            os.remove(path)
+
+    def open(self, key, start=0, end=None, chunk_size=1024 * 1024):
+        return _ranged_file_reader(open(self._path(key), 'rb'), start, end, chunk_size)
+
+    def stat(self, key):
+        try:
+            st = os.stat(self._path(key))
+        except (FileNotFoundError, ValueError):
+            return None
+        return {"size": st.st_size, "mtime": st.st_mtime, "mime_type": mimetypes.guess_type(key)[0]}
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key):
+        return self._path(key)
+
+
+class _MemorySink:
+    def __init__(self, storage, key):
+        self.storage = storage
+        self.key = key
+        self._parts = []
+        self._mime_type = None
+
+    def open(self, mime_type):
+        self._mime_type = mime_type
+
+    def write(self, chunk):
+        self._parts.append(bytes(chunk))
+
+    def close(self):
+        self.storage.objects[self.key] = (b''.join(self._parts), self._mime_type, time.time())
+
+    def abort(self):
+        self._parts = []
+
+
+class MemoryStorage(StorageBackend):
+    name = 'memory'
+
+    def __init__(self):
+        self.objects = {}
+
+    def sink(self, key):
+        return _MemorySink(self, key)
+
+    def put_file(self, path, key, mime_type=None):
+        with open(path, 'rb') as fh:
+            self.objects[key] = (fh.read(), mime_type or mimetypes.guess_type(key)[0], time.time())
+        os.remove(path)
+
+    def open(self, key, start=0, end=None, chunk_size=1024 * 1024):
+        data = self.objects[key][0]
+        stop = len(data) if end is None else min(end + 1, len(data))
+        return (data[i:min(i + chunk_size, stop)] for i in range(start, stop, chunk_size))
+
+    def stat(self, key):
+        if key not in self.objects:
+            return None
+        data, mime_type, mtime = self.objects[key]
+        return {"size": len(data), "mtime": mtime, "mime_type": mime_type}
+
+    def delete(self, key):
+        self.objects.pop(key, None)
+
+
+class S3Backend(StorageBackend):
+    name = 's3'
+
+    def __init__(self, s3, prefix='uploads/', extra_args=None):
+        self.s3 = s3
+        self.prefix = prefix
+        # objects are public-read: asset URLs point straight at the bucket (or S3_PUBLIC_URL / a CDN in front of it)
+        self.extra_args = {'ACL': 'public-read'} if extra_args is None else extra_args
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def sink(self, key):
+        return self.s3.multipart_sink(self._key(key), extra_args=self.extra_args)
+
+    def put_file(self, path, key, mime_type=None):
+        with open(path, 'rb') as fh:
+            self.s3.upload_file(fh, self._key(key), extra_args=dict(self.extra_args, ContentType=mime_type or 'application/octet-stream'))
+        os.remove(path)
+
+    def open(self, key, start=0, end=None, chunk_size=1024 * 1024):
+        args = {'Bucket': self.s3.bucket, 'Key': self._key(key)}
+        if start or end is not None:
+            args['Range'] = f"bytes={start}-{'' if end is None else end}"
+        body = self.s3.client.get_object(**args)['Body']
+        return body.iter_chunks(chunk_size)
+
+    def stat(self, key):
+        try:
+            head = self.s3.client.head_object(Bucket=self.s3.bucket, Key=self._key(key))
+        except self.s3.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return {"size": head['ContentLength'], "mtime": head['LastModified'].timestamp(), "mime_type": head.get('ContentType')}
+
+    def delete(self, key):
+        self.s3.client.delete_object(Bucket=self.s3.bucket, Key=self._key(key))
+
+    def url(self, key):
+        return self.s3.public_url(self._key(key))
+
+    def key_for_url(self, url):
+        base = self.s3.public_url(self.prefix)
+        if url and url.startswith(base):
+            return unquote(url[len(base):])
+        return None
+
+    def presigned_url(self, key, expires_in=3600):
+        return self.s3.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.s3.bucket, 'Key': self._key(key)}, ExpiresIn=expires_in)
+
+    def presigned_upload(self, key, content_type, expires_in=3600):
+        return self.s3.presigned_post(self._key(key), content_type, expires_in=expires_in)
+
+
+def upload_root(app=None):
+    """UPLOAD_PATH, resolved against the application root when relative."""
+    app = app or current_app
+    up = app.config.get('UPLOAD_PATH', '/tmp/uploads')
+    return up if os.path.isabs(up) else os.path.join(app.root_path, up)
+
+
+def _backend_name(app):
+    name = (app.config.get('STORAGE_BACKEND') or 'auto').lower()
+    if name == 'auto':
+        return 's3' if app.config.get('S3_BUCKET') else 'local'
+    if name not in ('local', 's3', 'memory'):
+        raise RuntimeError(f"unknown STORAGE_BACKEND {name!r}")
+    return name
+
+
+def get_storage(app=None):
+    """The app's storage backend; rebuilt when the backend settings change (e.g. in tests)."""
+    app = app or current_app._get_current_object()
+    name = _backend_name(app)
+    signature = (name, upload_root(app) if name == 'local' else app.config.get('S3_BUCKET'))
+    cached = app.extensions.get('storage')
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _lock:
+        cached = app.extensions.get('storage')
+        if cached is None or cached[0] != signature:
+            if name == 's3':
+                s3 = get_s3(app)
+                if s3 is None:
+                    raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+                backend = S3Backend(s3)
+            elif name == 'memory':
+                backend = MemoryStorage()
+            else:
+                backend = LocalStorage(signature[1])
+            cached = app.extensions['storage'] = (signature, backend)
+    return cached[1]
@@ -0,0 +1,132 @@
+"""Serving stored uploads for ``/uploads/<key>``.
+
+Responses support conditional GET (ETag / If-None-Match, Last-Modified /
+If-Modified-Since -> 304) and single byte ranges (Range / If-Range -> 206, or
+416 when unsatisfiable), which video seeking and resumed PDF downloads rely on.
+Local files go through ``send_file`` (one stat, ``wsgi.file_wrapper`` /
+sendfile for the body); other backends stream only the requested range.
+
+With ``UPLOADS_SENDFILE`` the bytes do not pass through the worker at all:
+
+* ``x-accel`` - an empty response with ``X-Accel-Redirect: UPLOADS_ACCEL_PREFIX/<key>``;
+  nginx serves the file from an ``internal`` location (ranges and conditionals included);
+* ``x-sendfile`` - ``X-Sendfile: <absolute path>`` for Apache mod_xsendfile / lighttpd
+  (local storage only; other backends fall back to serving from Flask).
+
+Flask only decides whether the file may be served.
+"""
+import mimetypes
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response, current_app, jsonify, request, send_file, stream_with_context
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import is_resource_modified
+
+from .storage import get_storage
+
+
+def _not_found():
+    return jsonify({'success': False, 'error': 'file not found', 'code': 404}), 404
+
+
+def _mime_type(key, stat=None):
+    return (stat or {}).get('mime_type') or mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+def _cache_control(resp):
+    resp.cache_control.public = True
+    resp.cache_control.max_age = current_app.config.get('UPLOADS_CACHE_MAX_AGE', 3600)
+    return resp
+
+
+def _offload(storage, key):
+    """X-Accel-Redirect / X-Sendfile response, or None to serve from Flask.
+
+    Only files the front-end server can read are offloaded: keys of non-local
+    backends (S3, memory) are always streamed (or redirected) by Flask.
+    """
+    mode = (current_app.config.get('UPLOADS_SENDFILE') or 'off').lower()
+    if mode not in ('x-accel', 'x-sendfile'):
+        return None
+    try:
+        path = storage.local_path(key)
+    except ValueError:
+        # invalid key: serve_upload answers 404
+        return None
+    if path is None:
+        return None
+    resp = Response(mimetype=_mime_type(key))
+    if mode == 'x-accel':
+        prefix = current_app.config.get('UPLOADS_ACCEL_PREFIX', '/protected-uploads').rstrip('/')
+        resp.headers['X-Accel-Redirect'] = f"{prefix}/{quote(key)}"
+    else:
+        resp.headers['X-Sendfile'] = path
+    return _cache_control(resp)
+
+
+def _if_range_matches(etag, last_modified):
+    """True when there is no If-Range header or it still names the current representation."""
+    if 'If-Range' not in request.headers:
+        return True
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    return if_range.date is not None and if_range.date == last_modified.replace(microsecond=0)
+
+
+def _stream_range(storage, key, stat):
+    """Conditional / ranged response for backends without a local file."""
+    size = stat['size']
+    etag = stat.get('etag') or f"{size:x}-{int(stat['mtime'] * 1000):x}"
+    last_modified = datetime.fromtimestamp(stat['mtime'], tz=timezone.utc)
+    resp = Response(mimetype=_mime_type(key, stat))
+    resp.set_etag(etag)
+    resp.last_modified = last_modified
+    resp.accept_ranges = 'bytes'
+    _cache_control(resp)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        resp.status_code = 304
+        return resp
+
+    start, stop = 0, size
+    rng = request.range
+    # If-Range: only honour the range while the client's copy is still current
+    if rng is not None and rng.units == 'bytes' and len(rng.ranges) == 1 and _if_range_matches(etag, last_modified):
+        bounds = rng.range_for_length(size)
+        if bounds is None:
+            resp.status_code = 416
+            resp.headers['Content-Range'] = f"bytes */{size}"
+            return resp
+        start, stop = bounds
+        resp.status_code = 206
+        resp.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+    # multiple ranges are answered with the whole file (allowed by RFC 9110)
+    resp.response = stream_with_context(storage.open(key, start, stop - 1) if stop > start else iter(()))
+    resp.content_length = stop - start
+    return resp
+
+
+def serve_upload(key):
+    storage = get_storage()
+    offloaded = _offload(storage, key)
+    if offloaded is not None:
+        return offloaded
+    try:
+        path = storage.local_path(key)
+    except ValueError:
+        return _not_found()
+    if path is not None:
+        try:
+            # werkzeug handles ETag / Last-Modified / Range / If-Range and sends the body via wsgi.file_wrapper
+            return send_file(path, mimetype=_mime_type(key), conditional=True,
+                             max_age=current_app.config.get('UPLOADS_CACHE_MAX_AGE', 3600))
+        except (FileNotFoundError, IsADirectoryError):
+            return _not_found()
+        except RequestedRangeNotSatisfiable as e:
+            # answered here: the app-wide JSON error handler would drop Content-Range
+            return Response(status=416, headers={'Content-Range': f"bytes */{e.length}"})
+    stat = storage.stat(key)
+    if stat is None:
+        return _not_found()
+    return _stream_range(storage, key, stat)
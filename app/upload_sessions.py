@@ -0,0 +1,183 @@
+"""Resumable (tus-style) upload sessions.
+
+A session is a staging file ``<id>.part`` plus a sidecar ``<id>.json`` holding
+the target filename, the declared total size and the committed offset. Clients
+PATCH chunks at the current offset; when a connection drops mid-chunk, the
+bytes that did arrive are kept and the offset (returned by HEAD) tells the
+client where to resume. Finalizing hashes the staged file and hands it to the
+storage backend (a rename into UPLOAD_PATH, or an S3 multipart upload).
+
+Sessions untouched for UPLOAD_SESSION_TTL seconds are treated as abandoned and
+removed by ``gc_sessions`` (``flask uploads-gc``).
+"""
+import json
+import os
+import re
+import time
+import uuid
+
+from flask import current_app
+
+try:
+    # advisory lock so two PATCHes for one session cannot interleave (not available on Windows)
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, expected):
+        super().__init__(f"expected offset {expected}")
+        self.expected = expected
+
+
+class SessionBusy(Exception):
+    pass
+
+
+def staging_dir():
+    path = current_app.config.get('UPLOAD_STAGING_PATH') or os.path.join(current_app.instance_path, 'upload_staging')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class UploadSession:
+    def __init__(self, id, data):
+        self.id = id
+        self.data = data
+
+    @property
+    def part_path(self):
+        return os.path.join(staging_dir(), f"{self.id}.part")
+
+    @property
+    def meta_path(self):
+        return os.path.join(staging_dir(), f"{self.id}.json")
+
+    @property
+    def offset(self):
+        return self.data['offset']
+
+    @property
+    def size(self):
+        return self.data['size']
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    def expires_at(self):
+        return self.data['updated_at'] + current_app.config.get('UPLOAD_SESSION_TTL', 24 * 3600)
+
+    def save(self):
+        self.data['updated_at'] = time.time()
+        tmp = f"{self.meta_path}.tmp"
+        with open(tmp, 'w', encoding='utf8') as fh:
+            json.dump(self.data, fh)
+        os.replace(tmp, self.meta_path)
+
+    def to_dict(self):
+        return {
+            "id": self.id, "filename": self.data['filename'], "size": self.size,
+            "offset": self.offset, "expires_at": self.expires_at(),
+        }
+
+
+def create_session(filename, size, mime_type=None, uploader_id=None):
+    session = UploadSession(uuid.uuid4().hex, {
+        "filename": filename, "size": size, "offset": 0, "mime_type": mime_type,
+        "uploader_id": uploader_id, "created_at": time.time(),
+    })
+    open(session.part_path, 'wb').close()
+    session.save()
+    return session
+
+
+def get_session(session_id):
+    """Return the session, or None when unknown or expired."""
+    if not _ID_RE.match(session_id or ''):
+        return None
+    try:
+        with open(os.path.join(staging_dir(), f"{session_id}.json"), encoding='utf8') as fh:
+            session = UploadSession(session_id, json.load(fh))
+    except (FileNotFoundError, ValueError):
+        return None
+    if session.expires_at() < time.time():
+        return None
+    return session
+
+
+def append_chunk(session, offset, stream, chunk_size=None):
+    """Append ``stream`` at ``offset``; returns the new offset.
+
+    Raises OffsetMismatch when ``offset`` is not the committed offset and
+    ValueError when the data would run past the declared size. Whatever arrived
+    before a dropped connection is committed, so the client can resume from there.
+    """
+    chunk_size = chunk_size or current_app.config.get('UPLOAD_CHUNK_SIZE', 1024 * 1024)
+    with open(session.part_path, 'r+b') as fh:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise SessionBusy()
+        # re-read under the lock: another request may have just committed
+        current = get_session(session.id)
+        if current is not None:
+            session.data = current.data
+        if offset != session.offset:
+            raise OffsetMismatch(session.offset)
+        # drop bytes of an earlier chunk that were written but never committed
+        fh.truncate(session.offset)
+        fh.seek(session.offset)
+        written = 0
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                if session.offset + written + len(chunk) > session.size:
+                    raise ValueError("chunk runs past the declared upload size")
+                fh.write(chunk)
+                written += len(chunk)
+        finally:
+            fh.flush()
+            os.fsync(fh.fileno())
+            session.data['offset'] = session.offset + written
+            session.save()
+    return session.offset
+
+
+def delete_session(session):
+    for path in (session.part_path, session.meta_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def gc_sessions(max_age=None):
+    """Remove sessions (and stray staging files) idle for more than ``max_age`` seconds. Returns the count."""
+    max_age = max_age if max_age is not None else current_app.config.get('UPLOAD_SESSION_TTL', 24 * 3600)
+    cutoff = time.time() - max_age
+    directory = staging_dir()
+    removed = set()
+    for name in os.listdir(directory):
+        session_id = name.split('.', 1)[0]
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed.add(session_id)
+        except FileNotFoundError:
+            continue
+    # a session is gone once either of its files is: drop the leftover half
+    for session_id in removed:
+        for suffix in ('.part', '.json'):
+            try:
+                os.remove(os.path.join(directory, session_id + suffix))
+            except FileNotFoundError:
+                pass
+    return len(removed)
@@ -0,0 +1,214 @@
+"""Chunked upload ingest: size limit, checksum and MIME sniffing while streaming.
+
+``ingest`` reads a file-like object ``chunk_size`` bytes at a time and feeds
+each chunk to a sink, so memory per upload stays bounded by the chunk size
+(plus one S3 part for the multipart sink). The size limit is enforced as the
+bytes arrive, the SHA-256 is updated per chunk, and the MIME type is sniffed
+from the first bytes instead of trusting the client's Content-Type.
+"""
+import hashlib
+import mimetypes
+import os
+import uuid
+
+from flask import current_app
+
+# (magic prefix, offset, mime type) for the file types accepted by /api/v1/uploads
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 0, 'image/png'),
+    (b'\xff\xd8\xff', 0, 'image/jpeg'),
+    (b'GIF87a', 0, 'image/gif'),
+    (b'GIF89a', 0, 'image/gif'),
+    (b'%PDF-', 0, 'application/pdf'),
+    (b'ftyp', 4, 'video/mp4'),
+)
+_EXTENSIONS = {
+    'image/png': {'png'}, 'image/jpeg': {'jpg', 'jpeg'}, 'image/gif': {'gif'},
+    'image/webp': {'webp'}, 'application/pdf': {'pdf'}, 'video/mp4': {'mp4'},
+}
+SNIFF_BYTES = 16
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadTypeMismatch(Exception):
+    pass
+
+
+def sniff_mime(head):
+    """MIME type from the first bytes of a file, or None when unrecognised."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for magic, offset, mime in _SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return mime
+    return None
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+class LocalSink:
+    """Writes to a hidden temp file next to the target and renames it into place on success."""
+
+    def __init__(self, directory, filename):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, filename)
+        self._tmp = os.path.join(directory, f".{filename}.{uuid.uuid4().hex}.part")
+        self._fh = None
+
+    def open(self, mime_type):
+        self._fh = open(self._tmp, 'wb')
+
+    def write(self, chunk):
+        self._fh.write(chunk)
+
+    def close(self):
+        self._fh.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        if self._fh is not None:
+            self._fh.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+class StagingSink:
+    """Writes to a temp file in ``directory``; close() leaves it at ``path`` for the caller to publish."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"upload-{uuid.uuid4().hex}.part")
+        self._fh = None
+
+    def open(self, mime_type):
+        self._fh = open(self.path, 'wb')
+
+    def write(self, chunk):
+        self._fh.write(chunk)
+
+    def close(self):
+        self._fh.close()
+
+    def abort(self):
+        if self._fh is not None:
+            self._fh.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class NullSink:
+    """Discards the bytes: used to checksum/sniff a file that is already in place."""
+
+    def open(self, mime_type):
+        pass
+
+    def write(self, chunk):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class S3MultipartSink:
+    """Pipes chunks into an S3 multipart upload, one part per ``part_size`` bytes (S3 minimum 5 MB)."""
+
+    def __init__(self, client, bucket, key, part_size, extra_args=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.extra_args = dict(extra_args or {})
+        self._upload_id = None
+        self._parts = []
+        self._buffer = bytearray()
+
+    def open(self, mime_type):
+        args = dict(self.extra_args, ContentType=mime_type)
+        self._upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **args)['UploadId']
+
+    def _flush_part(self):
+        number = len(self._parts) + 1
+        resp = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                       PartNumber=number, Body=bytes(self._buffer))
+        self._parts.append({'ETag': resp['ETag'], 'PartNumber': number})
+        self._buffer.clear()
+
+    def write(self, chunk):
+        self._buffer += chunk
+        if len(self._buffer) >= self.part_size:
+            self._flush_part()
+
+    def close(self):
+        # the last part may be smaller than the minimum (and is the only part for small files)
+        if self._buffer or not self._parts:
+            self._flush_part()
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                              MultipartUpload={'Parts': self._parts})
+
+    def abort(self):
+        if self._upload_id:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            except Exception:
+                current_app.logger.exception('failed to abort multipart upload %s', self.key)
+
+
+def ingest(stream, filename, sink, max_size=None, chunk_size=None, declared_type=None, keep=None):
+    """Copy ``stream`` into ``sink`` chunk by chunk.
+
+    Returns {"size", "sha256", "mime_type", "stored"}. Raises UploadTooLarge past
+    ``max_size`` bytes and UploadTypeMismatch when the content is recognisably
+    another allowed type than the extension says; the sink is aborted in both
+    cases. ``keep(info)`` is called once the hash is known, before anything is
+    published: when it returns False the sink is aborted (e.g. duplicate content)
+    and "stored" is False.
+    """
+    chunk_size = chunk_size or current_app.config.get('UPLOAD_CHUNK_SIZE', 1024 * 1024)
+    digest = hashlib.sha256()
+    size = 0
+    mime_type = None
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            if mime_type is None:
+                head = chunk
+                while len(head) < SNIFF_BYTES:
+                    more = stream.read(SNIFF_BYTES - len(head))
+                    if not more:
+                        break
+                    head += more
+                chunk = head
+                sniffed = sniff_mime(head)
+                if sniffed and _extension(filename) not in _EXTENSIONS[sniffed]:
+                    raise UploadTypeMismatch(f"file content is {sniffed}, which does not match .{_extension(filename)}")
+                mime_type = sniffed or declared_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                sink.open(mime_type)
+            size += len(chunk)
+            if max_size and size > max_size:
+                raise UploadTooLarge(f"file exceeds {max_size} bytes")
+            digest.update(chunk)
+            sink.write(chunk)
+        if mime_type is None:
+            # empty upload
+            mime_type = declared_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            sink.open(mime_type)
+        info = {"size": size, "sha256": digest.hexdigest(), "mime_type": mime_type, "stored": True}
+        if keep is not None and not keep(info):
+            sink.abort()
+            info["stored"] = False
+        else:
+            sink.close()
+    except BaseException:
+        sink.abort()
+        raise
+    return info
@@ -0,0 +1,30 @@
+"""Add FULLTEXT index for course search (MySQL only)
+
+Revision ID: 5e5c1762317b
+Revises: 62db0d44f094
+Create Date: 2026-10-18 09:20:02.541876
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5e5c1762317b'
+down_revision = '62db0d44f094'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = ['title', 'description', 'tags', 'category', 'class_name']
+
+
+def upgrade():
+    # FULLTEXT is MySQL-specific; other dialects use the in-process index in app/search.py
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    op.create_index('ft_courses_search', 'courses', SEARCH_COLUMNS, unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    op.drop_index('ft_courses_search', table_name='courses')
@@ -0,0 +1,24 @@
+"""merge heads 9192 and e4f5
+
+Revision ID: 62db0d44f094
+Revises: 919242a15c3b, e4f5g6h7i8j9
+Create Date: 2026-10-18 09:12:40.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '62db0d44f094'
+down_revision = ('919242a15c3b', 'e4f5g6h7i8j9')
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
@@ -0,0 +1,40 @@
+"""Composite unique key on progress (user_id, lesson_id, attempt_id)
+
+Revision ID: b7d41c2e9a03
+Revises: 5e5c1762317b
+Create Date: 2026-10-18 11:02:47.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41c2e9a03'
+down_revision = '5e5c1762317b'
+branch_labels = None
+depends_on = None
+
+
+def _has_attempt_id_unique_index():
+    # 8a2b3c4d5e6f / a1b2c3d4e5f6 created it, but the latter tolerated failures
+    indexes = sa.inspect(op.get_bind()).get_indexes('progress')
+    return any(ix['name'] == 'uq_progress_attempt_id' for ix in indexes)
+
+
+def upgrade():
+    # POST /api/v1/progress inserts with ON CONFLICT DO NOTHING / INSERT IGNORE against this key
+    # instead of checking for an existing row first. batch mode keeps SQLite (ALTER-less) working.
+    with op.batch_alter_table('progress') as batch_op:
+        batch_op.create_unique_constraint('uq_progress_user_lesson_attempt', ['user_id', 'lesson_id', 'attempt_id'])
+    # the old single-column key would still reject another user's or lesson's attempt_id, and the
+    # insert-or-ignore would then drop that row as a "duplicate" (ix_progress_attempt_id stays for lookups)
+    if _has_attempt_id_unique_index():
+        op.drop_index('uq_progress_attempt_id', table_name='progress')
+
+
+def downgrade():
+    # fails if an attempt_id is now stored for more than one (user_id, lesson_id)
+    if not _has_attempt_id_unique_index():
+        op.create_index('uq_progress_attempt_id', 'progress', ['attempt_id'], unique=True)
+    with op.batch_alter_table('progress') as batch_op:
+        batch_op.drop_constraint('uq_progress_user_lesson_attempt', type_='unique')
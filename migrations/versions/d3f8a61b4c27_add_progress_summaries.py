@@ -0,0 +1,43 @@
+"""Add progress_summaries aggregate table
+
+Revision ID: d3f8a61b4c27
+Revises: b7d41c2e9a03
+Create Date: 2026-10-18 13:40:11.402718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8a61b4c27'
+down_revision = 'b7d41c2e9a03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'progress_summaries',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('lesson_id', sa.Integer(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('best_score', sa.Float(), nullable=True),
+        sa.Column('total_time_spent', sa.Integer(), nullable=False),
+        sa.Column('first_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('last_attempt_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['lesson_id'], ['lessons.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'lesson_id'),
+    )
+    op.create_index(op.f('ix_progress_summaries_lesson_id'), 'progress_summaries', ['lesson_id'], unique=False)
+    # backfill from existing rows; afterwards the API keeps it current incrementally
+    op.execute(
+        "INSERT INTO progress_summaries (user_id, lesson_id, attempts, best_score, total_time_spent, first_attempt_at, last_attempt_at) "
+        "SELECT user_id, lesson_id, COUNT(*), MAX(score), COALESCE(SUM(time_spent), 0), MIN(created_at), MAX(created_at) "
+        "FROM progress GROUP BY user_id, lesson_id"
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_progress_summaries_lesson_id'), table_name='progress_summaries')
+    op.drop_table('progress_summaries')
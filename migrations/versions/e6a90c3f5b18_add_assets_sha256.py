@@ -0,0 +1,28 @@
+"""Add assets.sha256 content hash for upload deduplication
+
+Revision ID: e6a90c3f5b18
+Revises: d3f8a61b4c27
+Create Date: 2026-10-18 16:05:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e6a90c3f5b18'
+down_revision = 'd3f8a61b4c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows stay NULL until `scripts/backfill_assets.py --hash --commit` fills them in
+    with op.batch_alter_table('assets', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sha256', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_assets_sha256'), ['sha256'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('assets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_assets_sha256'))
+        batch_op.drop_column('sha256')
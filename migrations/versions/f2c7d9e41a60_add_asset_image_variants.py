@@ -0,0 +1,31 @@
+"""Add image dimensions and variants to assets
+
+Revision ID: f2c7d9e41a60
+Revises: e6a90c3f5b18
+Create Date: 2026-10-18 17:22:09.530416
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'f2c7d9e41a60'
+down_revision = 'e6a90c3f5b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing images get variants from `flask assets-derivatives --missing`
+    with op.batch_alter_table('assets', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('variants', mysql.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('assets', schema=None) as batch_op:
+        batch_op.drop_column('variants')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
@@ -3,11 +3,16 @@
 
 Usage:
   python scripts/backfill_assets.py [--dry-run] [--uploads PATH] [--commit]
+  python scripts/backfill_assets.py --hash [--commit]
 
 By default runs in dry-run mode and only lists missing assets. Use --commit to insert rows.
+With --hash, fills in assets.sha256 for existing rows whose file is under the uploads
+directory (needed for upload deduplication to recognise files stored before the column
+existed) and reports groups of assets with identical content.
 """
 import os
 import argparse
+import hashlib
 import mimetypes
 
 from app import create_app
@@ -19,12 +24,60 @@ def find_files(root):
             yield os.path.join(dirpath, fn)
 
 
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def backfill_hashes(UP, dry_run, batch_size=500):
+    """Hash the files of assets without a sha256 (keyset batches, one commit per batch)."""
+    from app.models import Asset
+    from app.extensions import db
+
+    hashed = missing = 0
+    last_id = 0
+    while True:
+        batch = (Asset.query.filter(Asset.sha256.is_(None), Asset.id > last_id, Asset.url.like('/uploads/%'))
+                 .order_by(Asset.id).limit(batch_size).all())
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for a in batch:
+            fp = os.path.join(UP, a.url[len('/uploads/'):])
+            if not os.path.isfile(fp):
+                missing += 1
+                continue
+            a.sha256 = file_sha256(fp)
+            hashed += 1
+            if dry_run:
+                print('-', a.url, a.sha256)
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    print(f'Hashed {hashed} assets ({missing} without a file on disk).')
+    if dry_run:
+        print('\nDry-run mode; no DB changes made. Re-run with --no-dry-run or --commit to store hashes.')
+        return
+
+    dupes = (db.session.query(Asset.sha256, db.func.count(Asset.id)).filter(Asset.sha256.isnot(None))
+             .group_by(Asset.sha256).having(db.func.count(Asset.id) > 1).all())
+    if dupes:
+        print(f'{len(dupes)} contents are stored more than once (new uploads of them will reuse the oldest asset):')
+        for sha, n in dupes:
+            print('-', sha, 'x', n)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--dry-run', action='store_true', default=True, dest='dry_run', help='Don\'t modify the DB; just print what would be done')
     parser.add_argument('--no-dry-run', action='store_false', dest='dry_run', help='Actually write to DB')
     parser.add_argument('--uploads', type=str, default=None, help='Path to uploads directory (overrides config)')
     parser.add_argument('--commit', action='store_true', help='Alias for --no-dry-run')
+    parser.add_argument('--hash', action='store_true', help='Compute sha256 for existing assets instead of adding missing rows')
     args = parser.parse_args()
     if args.commit:
         args.dry_run = False
@@ -39,6 +92,10 @@ def main():
             print('Uploads directory does not exist; nothing to do.')
             return
 
+        if args.hash:
+            backfill_hashes(UP, args.dry_run)
+            return
+
         from app.models import Asset
         from app.extensions import db
 
@@ -55,7 +112,7 @@ def main():
             except Exception:
                 pass
             mime_type, _ = mimetypes.guess_type(fp)
-            missing.append({'path': fp, 'url': url, 'size': size, 'mime_type': mime_type})
+            missing.append({'path': fp, 'url': url, 'size': size, 'mime_type': mime_type, 'sha256': file_sha256(fp)})
 
         if not missing:
             print('No missing assets found.')
@@ -73,7 +130,7 @@ def main():
         created = 0
         for m in missing:
             try:
-                a = Asset(url=m['url'], size=m['size'], mime_type=m['mime_type'])
+                a = Asset(url=m['url'], size=m['size'], mime_type=m['mime_type'], sha256=m['sha256'])
                 db.session.add(a)
                 db.session.flush()
                 created += 1
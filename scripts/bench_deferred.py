@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Bytes fetched by typical ORM reads with the large JSON columns loaded eagerly vs deferred.
+
+Usage:
+  python scripts/bench_deferred.py [--lessons N] [--topics-per-lesson N] [--progress N] [--blob-size BYTES]
+
+Seeds a throwaway SQLite database (or DATABASE_URL when --database-url is given; the tables
+must be empty) with lessons, topics and progress rows whose content_json / data_json / answers
+are about --blob-size bytes, then runs the same admin-style reads twice:
+
+* ``eager``    - every entity query undefers Lesson.content_json, Topic.data_json and
+                 Progress.answers (the behaviour before they were deferred);
+* ``deferred`` - the mappings as they are.
+
+For each read it reports the number of SELECTs, the size of the result sets the driver
+returned (every captured SELECT is replayed on a raw DBAPI cursor and its values measured)
+and the wall time.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def value_bytes(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return len(str(value).encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--lessons', type=int, default=2000)
+    parser.add_argument('--topics-per-lesson', type=int, default=5)
+    parser.add_argument('--progress', type=int, default=20000)
+    parser.add_argument('--blob-size', type=int, default=16 * 1024)
+    args = parser.parse_args()
+
+    tmp = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        tmp.close()
+        os.environ['DATABASE_URL'] = f"sqlite:///{tmp.name}"
+
+    # config is read at import time
+    from sqlalchemy import event
+    from sqlalchemy.orm import undefer
+    from app import create_app
+    from app.extensions import db
+    from app.models import Course, Lesson, Progress, Topic, User
+
+    app = create_app()
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(db, Course, Lesson, Progress, Topic, User, args)
+            blobs = {Lesson: Lesson.content_json, Topic: Topic.data_json, Progress: Progress.answers}
+            mode = {'eager': False}
+
+            def undefer_blobs(state):
+                # emulate the old mapping: undefer the blob of every root entity, lazy loads included
+                if not state.is_select or not mode['eager']:
+                    return
+                entities = {d.get('entity') for d in state.statement.column_descriptions}
+                options = [undefer(col) for model, col in blobs.items() if model in entities]
+                if options:
+                    state.statement = state.statement.options(*options)
+
+            captured = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if statement.lstrip().upper().startswith('SELECT'):
+                    captured.append((statement, parameters))
+
+            event.listen(db.session, 'do_orm_execute', undefer_blobs)
+            event.listen(db.engine, 'before_cursor_execute', capture)
+
+            lesson_ids = [r.id for r in Lesson.query.with_entities(Lesson.id).order_by(Lesson.id).limit(100)]
+            user_id = Progress.query.with_entities(Progress.user_id).limit(1).scalar()
+            reads = [
+                ('lesson list (create_topic dropdown)',
+                 lambda: [l.title for l in Lesson.query.order_by(Lesson.created_at.desc()).all()]),
+                ('Lesson.query.get x100',
+                 lambda: [db.session.get(Lesson, lid).title for lid in lesson_ids]),
+                ('topics of 100 lessons',
+                 lambda: [t.title for t in Topic.query.filter(Topic.lesson_id.in_(lesson_ids)).all()]),
+                ('progress of a user + .lesson/.user',
+                 lambda: [(p.score, p.lesson.title, p.user.email) for p in Progress.query.filter_by(user_id=user_id).all()]),
+            ]
+            print(f"lessons={args.lessons} topics={args.lessons * args.topics_per_lesson} "
+                  f"progress={args.progress} blob~{args.blob_size}B")
+            print(f"{'read':<38} {'mode':<9} {'selects':>7} {'bytes fetched':>14} {'ms':>9}")
+            for label, read in reads:
+                for eager in (True, False):
+                    mode['eager'] = eager
+                    db.session.remove()
+                    captured.clear()
+                    start = time.perf_counter()
+                    read()
+                    elapsed = time.perf_counter() - start
+                    statements = list(captured)
+                    fetched = replay_bytes(db.engine, statements)
+                    print(f"{label:<38} {'eager' if eager else 'deferred':<9} {len(statements):>7} "
+                          f"{fetched:>14,} {elapsed * 1000:>9.1f}")
+            db.session.remove()
+    finally:
+        if tmp is not None:
+            os.remove(tmp.name)
+
+
+def replay_bytes(engine, statements):
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        total = 0
+        for statement, parameters in statements:
+            cur.execute(statement, parameters)
+            total += sum(value_bytes(v) for row in cur.fetchall() for v in row)
+        cur.close()
+        return total
+    finally:
+        raw.close()
+
+
+def seed(db, Course, Lesson, Progress, Topic, User, args):
+    from sqlalchemy import insert
+    base = datetime(2024, 1, 1)
+    filler = 'x' * args.blob_size
+    db.session.execute(insert(User), [{'email': f'bench{i}@example.com', 'password_hash': '-', 'role': 'student'}
+                                      for i in range(50)])
+    course = Course(title='Bench course')
+    db.session.add(course)
+    db.session.flush()
+    db.session.execute(insert(Lesson), [{'course_id': course.id, 'title': f'Lesson {i}', 'created_at': base + timedelta(minutes=i),
+                                         'content_json': {'schema_version': 1, 'body': filler}}
+                                        for i in range(args.lessons)])
+    lesson_ids = [r.id for r in Lesson.query.with_entities(Lesson.id)]
+    user_ids = [r.id for r in User.query.with_entities(User.id)]
+    topics = [{'lesson_id': lid, 'title': f'Topic {n}', 'data_json': {'type': 'text', 'content': filler}}
+              for lid in lesson_ids for n in range(args.topics_per_lesson)]
+    for i in range(0, len(topics), 5000):
+        db.session.execute(insert(Topic), topics[i:i + 5000])
+    progress = [{'user_id': user_ids[i % len(user_ids)], 'lesson_id': lesson_ids[i % len(lesson_ids)], 'score': 0.5,
+                 'time_spent': 60, 'answers': {'raw': filler[:args.blob_size // 4]}} for i in range(args.progress)]
+    for i in range(0, len(progress), 5000):
+        db.session.execute(insert(Progress), progress[i:i + 5000])
+    db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
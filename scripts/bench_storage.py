@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Time the same put / get / range-read workload against a storage backend.
+
+Usage:
+  python scripts/bench_storage.py [--backend local|s3|memory] [--files N] [--size BYTES] [--chunk BYTES]
+
+The backend is configured like the app (UPLOAD_PATH, S3_BUCKET, S3_ENDPOINT_URL, ...);
+--backend overrides STORAGE_BACKEND. Objects are written under a bench-<pid>- prefix
+and deleted afterwards.
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+
+from app import create_app
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def report(label, samples, nbytes):
+    total = sum(samples)
+    mb_s = (nbytes / total / 1e6) if total else float('inf')
+    print(f"{label:<12} n={len(samples):<4} median={statistics.median(samples) * 1000:8.2f} ms  "
+          f"p95={sorted(samples)[int(len(samples) * 0.95) - 1] * 1000:8.2f} ms  {mb_s:8.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', default=None, help='Overrides STORAGE_BACKEND')
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--size', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--chunk', type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.backend:
+        app.config['STORAGE_BACKEND'] = args.backend
+    with app.app_context():
+        from app.storage import get_storage
+        storage = get_storage()
+        print(f"backend={storage.name} files={args.files} size={args.size} chunk={args.chunk}")
+        payload = os.urandom(args.size)
+        keys = [f"bench-{os.getpid()}-{i}.bin" for i in range(args.files)]
+        puts, gets, ranges = [], [], []
+        try:
+            for key in keys:
+                puts.append(timed(lambda: storage.put(io.BytesIO(payload), key, 'application/octet-stream', chunk_size=args.chunk)))
+            for key in keys:
+                gets.append(timed(lambda: sum(len(c) for c in storage.open(key, chunk_size=args.chunk))))
+            for key in keys:
+                # a video-seek style read from the middle of the object
+                ranges.append(timed(lambda: sum(len(c) for c in storage.open(key, args.size // 2, args.size // 2 + 65535))))
+        finally:
+            for key in keys:
+                storage.delete(key)
+        report('put', puts, args.size * len(puts))
+        report('get', gets, args.size * len(gets))
+        report('range 64k', ranges, 65536 * len(ranges))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+
+from app.extensions import db
+
+
+def _seed(client):
+    from app.models import Course, Lesson, Topic
+    base = datetime(2024, 1, 1)
+    with client.application.app_context():
+        maths = Course(title="Algebra", category="Maths")
+        optics = Course(title="Optics", category="Science")
+        db.session.add_all([maths, optics])
+        db.session.flush()
+        lessons = [Lesson(course_id=maths.id if i < 4 else optics.id, title=f"Lesson {i}", description=f"d{i}",
+                          created_at=base + timedelta(minutes=i)) for i in range(5)]
+        db.session.add_all(lessons)
+        db.session.flush()
+        db.session.add_all([Topic(lesson_id=lessons[0].id, title=f"T{i}", data_json={"type": "text", "content": f"c{i}"},
+                                  created_at=base + timedelta(minutes=i)) for i in range(3)])
+        db.session.commit()
+        return maths.id, [l.id for l in lessons]
+
+
+def test_admin_data_api_filters_pages_and_projects(client):
+    maths_id, lesson_ids = _seed(client)
+    assert client.get('/admin/api/lessons').status_code == 401
+    with client.session_transaction() as sess:
+        sess['admin_user_id'] = 'dev_admin'
+
+    # the page itself only carries the categories; rows are fetched lazily
+    html = client.get('/admin/lesson').get_data(as_text=True)
+    assert 'Maths' in html and 'Lesson 0' not in html
+
+    js = client.get(f'/admin/api/lessons?course_id={maths_id}&limit=3&fields=title,course_title,topic_count').get_json()
+    assert [l['title'] for l in js['data']] == ['Lesson 3', 'Lesson 2', 'Lesson 1']
+    assert set(js['data'][0]) == {'id', 'title', 'course_title', 'topic_count'}
+    assert js['data'][0]['course_title'] == 'Algebra'
+    assert js['meta']['has_more'] is True
+    js = client.get(f"/admin/api/lessons?course_id={maths_id}&limit=3&fields=title,topic_count&cursor={js['meta']['next_cursor']}").get_json()
+    assert js['data'] == [{'id': lesson_ids[0], 'title': 'Lesson 0', 'topic_count': 3}]
+    assert js['meta'] == {'limit': 3, 'has_more': False, 'next_cursor': None}
+
+    js = client.get(f'/admin/api/topics?lesson_id={lesson_ids[0]}&limit=2').get_json()
+    assert [t['title'] for t in js['data']] == ['T0', 'T1'] and 'content' not in js['data'][0]
+    js = client.get(f"/admin/api/topics?lesson_id={lesson_ids[0]}&fields=title,content&cursor={js['meta']['next_cursor']}").get_json()
+    assert [(t['title'], t['content']) for t in js['data']] == [('T2', 'c2')]
+
+    js = client.get('/admin/api/courses?category=Science').get_json()
+    assert [c['title'] for c in js['data']] == ['Optics']
+
+    assert client.get('/admin/api/lessons?fields=content_json').status_code == 400
+    assert client.get('/admin/api/topics?cursor=bogus').status_code == 400
+
+
+def test_large_json_columns_are_deferred(client):
+    from sqlalchemy import inspect
+    from app.models import Lesson, Progress, Topic
+    _, lesson_ids = _seed(client)
+    db.session.remove()
+    lesson = db.session.get(Lesson, lesson_ids[0])
+    topic = Topic.query.filter_by(lesson_id=lesson.id).first()
+    assert 'content_json' in inspect(lesson).unloaded and 'data_json' in inspect(topic).unloaded
+    assert 'answers' in inspect(Progress).column_attrs and inspect(Progress).column_attrs['answers'].deferred
+    # still loaded on access, or up front with undefer()
+    assert topic.data_json['type'] == 'text'
+    from sqlalchemy.orm import undefer
+    db.session.remove()
+    lesson = Lesson.query.options(undefer(Lesson.content_json)).filter_by(id=lesson_ids[0]).one()
+    assert 'content_json' not in inspect(lesson).unloaded
+
+
+def test_admin_principal_cached_and_invalidated(client):
+    from app.models import User
+    app = client.application
+    with app.app_context():
+        admin = User(email='boss@example.com', role='admin')
+        admin.set_password('pw')
+        db.session.add(admin)
+        db.session.commit()
+        uid = admin.id
+    rv = client.post('/admin/login', data={'email': 'boss@example.com', 'password': 'pw'})
+    assert rv.status_code == 302 and rv.headers['Location'].endswith('/admin/dashboard')
+
+    # the test cache is a per-process SimpleCache: other workers would never see an invalidation
+    app.config['QUERY_COUNT_HEADER'] = True
+    assert app.config['ADMIN_PRINCIPAL_CACHE_TIMEOUT'] is None
+    assert client.get('/admin/api/courses').headers['X-Query-Count'] == '2'
+    assert client.get('/admin/api/courses').headers['X-Query-Count'] == '2'
+
+    # opted in explicitly (e.g. a single worker)
+    app.config['ADMIN_PRINCIPAL_CACHE_TIMEOUT'] = 30
+    assert client.get('/admin/api/courses').headers['X-Query-Count'] == '2'  # principal lookup + page
+    assert client.get('/admin/api/courses').headers['X-Query-Count'] == '1'  # principal from the cache
+
+    # demoting the user takes effect on the next request, and the stale session is dropped
+    with app.app_context():
+        db.session.get(User, uid).role = 'teacher'
+        db.session.commit()
+    assert client.get('/admin/api/courses').status_code == 403
+    assert client.get('/admin/lesson').status_code == 302
+    with client.session_transaction() as sess:
+        assert 'admin_user_id' not in sess
+
+    # a bulk UPDATE fires no ORM event: the cached (non-admin) role lives until the entry expires
+    with app.app_context():
+        User.query.filter_by(id=uid).update({'role': 'admin'})
+        db.session.commit()
+    with client.session_transaction() as sess:
+        sess['admin_user_id'] = uid
+    assert client.get('/admin/api/courses').status_code == 403
+    from app.admin_auth import invalidate_admin_principal
+    with app.test_request_context():
+        invalidate_admin_principal(uid)
+    with client.session_transaction() as sess:
+        sess['admin_user_id'] = uid
+    assert client.get('/admin/api/courses').status_code == 200
+
+    # logout drops the cached principal; the dev_admin sentinel never queries for it
+    with client.session_transaction() as sess:
+        sess['admin_user_id'] = 'dev_admin'
+    assert client.get('/admin/api/courses').headers['X-Query-Count'] == '1'
+    client.get('/admin/logout')
+    assert client.get('/admin/api/courses').status_code == 401
+
+
+def test_admin_data_api_pages_across_null_created_at(client):
+    from app.models import Lesson
+    maths_id, lesson_ids = _seed(client)
+    with client.application.app_context():
+        undated = [Lesson(course_id=maths_id, title=f"Undated {i}") for i in range(2)]
+        db.session.add_all(undated)
+        db.session.commit()
+        undated_ids = [l.id for l in undated]
+        Lesson.query.filter(Lesson.id.in_(undated_ids)).update({'created_at': None}, synchronize_session=False)
+        db.session.commit()
+    with client.session_transaction() as sess:
+        sess['admin_user_id'] = 'dev_admin'
+
+    from sqlalchemy import event
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda conn, cur, stmt, *a: statements.append(stmt))
+
+    # lessons without created_at come last (newest first), and the cursor can point at one of them
+    js = client.get(f'/admin/api/lessons?course_id={maths_id}&limit=5&fields=title').get_json()
+    assert [l['title'] for l in js['data']] == ['Lesson 3', 'Lesson 2', 'Lesson 1', 'Lesson 0', 'Undated 1']
+    rv = client.get(f"/admin/api/lessons?course_id={maths_id}&limit=5&fields=title&cursor={js['meta']['next_cursor']}")
+    assert rv.status_code == 200
+    assert [l['id'] for l in rv.get_json()['data']] == [undated_ids[0]]
+
+    # a page that ends on the last dated row continues with the undated ones
+    js = client.get(f'/admin/api/lessons?course_id={maths_id}&limit=4&fields=title').get_json()
+    assert js['meta']['has_more'] is True
+    js = client.get(f"/admin/api/lessons?course_id={maths_id}&limit=4&fields=title&cursor={js['meta']['next_cursor']}").get_json()
+    assert [l['title'] for l in js['data']] == ['Undated 1', 'Undated 0'] and js['meta']['has_more'] is False
+    # filters and ordering stay on the raw column, so ix_lessons_created_at can serve them
+    assert not any('coalesce' in s.lower() for s in statements)
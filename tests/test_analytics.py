@@ -0,0 +1,56 @@
+import pytest
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models import User, Course, Lesson, Progress
+
+np = pytest.importorskip('numpy')
+
+
+def test_course_analytics(client):
+    from app.analytics import weekly_retention
+    rv = client.post('/api/v1/auth/register', json={"email": "t7@example.com", "password": "secret", "role": "teacher"})
+    headers = {"Authorization": f"Bearer {rv.get_json()['access_token']}"}
+    with client.application.app_context():
+        users = [User(email=f'a{i}@example.com', password_hash='x') for i in range(3)]
+        c = Course(title='Analytics')
+        db.session.add_all(users + [c])
+        db.session.commit()
+        base = datetime(2026, 1, 5)  # a Monday
+        lessons = [Lesson(course_id=c.id, title=f'Step {i}', created_at=base + timedelta(minutes=i)) for i in range(3)]
+        db.session.add_all(lessons)
+        db.session.commit()
+        u0, u1, u2 = [u.id for u in users]
+        l0, l1, l2 = [l.id for l in lessons]
+        rows = [
+            (u0, l0, 0.2, 20, 0), (u0, l0, 0.6, 50, 0), (u0, l1, 0.8, 100, 7), (u0, l2, 1.0, 4000, 14),
+            (u1, l0, 0.4, None, 0), (u1, l2, None, 90, 8),
+            (u2, l1, 0.5, 30, 7),
+        ]
+        db.session.add_all([Progress(user_id=u, lesson_id=l, score=s, time_spent=t, created_at=base + timedelta(days=d))
+                            for u, l, s, t, d in rows])
+        db.session.commit()
+        course_id = c.id
+
+    js = client.get(f'/api/v1/courses/{course_id}/analytics', headers=headers).get_json()['data']
+    assert (js['users'], js['attempts']) == (3, 7)
+    first = js['lessons'][0]
+    assert first['score_percentiles']['p50'] == 0.4
+    assert first['score_percentiles']['p25'] == 0.3
+    assert first['mean_score'] == 0.4
+    # u0 did every step in order, u1 skipped step 1, u2 never did step 0
+    assert [l['users_attempted'] for l in js['lessons']] == [2, 2, 2]
+    assert [l['users_reached'] for l in js['lessons']] == [2, 1, 1]
+    assert js['time_histogram']['counts'][0] == 1 and js['time_histogram']['counts'][-1] == 1
+    # cohorts: u0 and u1 start in week 0, u2 in week 1
+    assert js['retention'][0] == {"cohort_week": "2026-01-05", "size": 2, "active_by_week": [2, 2, 1]}
+    assert js['retention'][1]['size'] == 1
+
+    # cached until new progress arrives: course, lesson list and newest progress id lookups only
+    client.application.config['QUERY_COUNT_HEADER'] = True
+    assert client.get(f'/api/v1/courses/{course_id}/analytics', headers=headers).headers['X-Query-Count'] == '3'
+    with client.application.app_context():
+        db.session.add(Progress(user_id=u2, lesson_id=l0, score=0.9))
+        db.session.commit()
+    assert client.get(f'/api/v1/courses/{course_id}/analytics', headers=headers).get_json()['data']['attempts'] == 8
+    assert weekly_retention(np.array([], dtype=np.int64), np.array([], dtype=np.int64), 0) == []
@@ -26,3 +26,279 @@ def test_content_cache_flag(client):
     j2 = r2.get_json()
     assert j2['success'] is True
     assert j2['cached'] is True
+
+
+def test_content_etag_not_modified(client):
+    with client.application.app_context():
+        c = Course(title='EtagCourse')
+        db.session.add(c)
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='EtagLesson', content_json={"schema_version": 1}, content_version=3)
+        db.session.add(l)
+        db.session.commit()
+        lid = l.id
+
+    r1 = client.get(f'/api/v1/content/{lid}')
+    assert r1.status_code == 200
+    etag = r1.headers['ETag']
+    assert etag == f'"lesson-{lid}-v3"'
+    assert 'Cache-Control' in r1.headers
+
+    # client already holds this version
+    r2 = client.get(f'/api/v1/content/{lid}', headers={'If-None-Match': etag})
+    assert r2.status_code == 304
+    assert r2.data == b''
+    assert r2.headers['ETag'] == etag
+
+    # a stale validator gets the full body
+    r3 = client.get(f'/api/v1/content/{lid}', headers={'If-None-Match': f'"lesson-{lid}-v2"'})
+    assert r3.status_code == 200
+    assert r3.get_json()['data']['schema_version'] == 1
+
+
+def test_content_warm_read_skips_db(client):
+    client.application.config['QUERY_COUNT_HEADER'] = True
+    with client.application.app_context():
+        c = Course(title='IndexCourse')
+        db.session.add(c)
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='IndexLesson', content_json={"schema_version": 1})
+        db.session.add(l)
+        db.session.commit()
+        lid = l.id
+
+    r1 = client.get(f'/api/v1/content/{lid}')
+    assert r1.get_json()['cached'] is False
+    assert int(r1.headers['X-Query-Count']) > 0
+
+    r2 = client.get(f'/api/v1/content/{lid}')
+    assert r2.get_json()['cached'] is True
+    assert r2.headers['X-Query-Count'] == '0'
+
+
+def test_content_version_index_follows_update(client):
+    with client.application.app_context():
+        c = Course(title='VersionCourse')
+        db.session.add(c)
+        db.session.commit()
+        cid = c.id
+    rv = client.post('/api/v1/auth/register', json={"email": "t1@example.com", "password": "secret", "role": "teacher"})
+    headers = {"Authorization": f"Bearer {rv.get_json()['access_token']}"}
+    rv = client.post('/api/v1/lessons', json={"title": "L", "course_id": cid, "content_json": {"schema_version": 1, "payload": {}}}, headers=headers)
+    lid = rv.get_json()['id']
+
+    assert client.get(f'/api/v1/content/{lid}').get_json()['cached'] is False
+    assert client.get(f'/api/v1/content/{lid}').get_json()['cached'] is True
+
+    rv = client.put(f'/api/v1/lessons/{lid}', json={"content_json": {"schema_version": 2, "payload": {}}}, headers=headers)
+    assert rv.get_json()['content_version'] == 2
+
+    r = client.get(f'/api/v1/content/{lid}')
+    assert r.headers['ETag'] == f'"lesson-{lid}-v2"'
+    assert r.get_json()['cached'] is False
+    assert r.get_json()['data']['schema_version'] == 2
+
+
+def test_content_bytes_mode(client):
+    import gzip
+    import json
+    client.application.config.update({'CONTENT_CACHE_MODE': 'bytes', 'CONTENT_CACHE_ENCODINGS': 'gzip'})
+    with client.application.app_context():
+        c = Course(title='BytesCourse')
+        db.session.add(c)
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='BytesLesson', content_json={"schema_version": 1, "text": "नमस्ते 🚀"})
+        db.session.add(l)
+        db.session.commit()
+        lid = l.id
+
+    r1 = client.get(f'/api/v1/content/{lid}')
+    assert r1.status_code == 200
+    assert r1.get_json()['cached'] is False
+    # unicode is kept as UTF-8, not \u-escaped
+    assert 'नमस्ते 🚀'.encode('utf-8') in r1.data
+
+    r2 = client.get(f'/api/v1/content/{lid}')
+    j2 = r2.get_json()
+    assert j2['cached'] is True
+    assert j2['data']['content_json']['text'] == 'नमस्ते 🚀'
+
+    r3 = client.get(f'/api/v1/content/{lid}', headers={'Accept-Encoding': 'gzip'})
+    assert r3.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in r3.headers['Vary']
+    body = json.loads(gzip.decompress(r3.data))
+    assert body == j2
+
+    r4 = client.get(f'/api/v1/content/{lid}', headers={'If-None-Match': r3.headers['ETag']})
+    assert r4.status_code == 304
+
+
+def test_tiered_cache_local_tier_and_invalidation():
+    from cachelib import SimpleCache
+    from app.cache_backends import TieredCache
+
+    remote = SimpleCache()
+    tiered = TieredCache(remote, local_max_items=2, local_prefixes=('lesson_content:',))
+    tiered.set('lesson_content:1:v1', {'a': 1})
+    tiered.set('lesson_version:1', 1)
+
+    # versioned keys are answered from the local tier, everything else from the shared one
+    assert tiered.get('lesson_content:1:v1') == {'a': 1}
+    assert tiered.get('lesson_version:1') == 1
+    stats = tiered.get_stats()
+    assert stats['local_hits'] == 1
+    assert stats['remote_hits'] == 1
+    assert stats['local_items'] == 1
+
+    # another worker fills the shared tier; this worker promotes it locally on first read
+    remote.set('lesson_content:2:v1', {'b': 2})
+    assert tiered.get_many('lesson_content:2:v1', 'lesson_content:3:v1') == [{'b': 2}, None]
+    assert tiered.get_stats()['remote_misses'] >= 1
+
+    # size bound: a third local key evicts the least recently used one
+    tiered.set('lesson_content:4:v1', {'d': 4})
+    assert tiered.get_stats()['local_items'] == 2
+
+    # an invalidation published by another worker drops the local copy
+    remote.delete('lesson_content:4:v1')
+    tiered._handle_invalidation(b'other-node:lesson_content:4:v1')
+    assert tiered.get('lesson_content:4:v1') is None
+
+
+def test_singleflight_coalesces_concurrent_misses(client):
+    import threading
+    import time
+    from app.singleflight import get_or_build
+
+    app = client.application
+    builds = []
+    results = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.2)
+        return {'built': True}, None
+
+    def worker():
+        with app.app_context():
+            results.append(get_or_build('lesson_content:99:v1', build)[:2])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(builds) == 1
+    assert sorted(state for _, state in results) == ['hit'] * 7 + ['miss']
+    assert all(value == {'built': True} for value, _ in results)
+
+
+def test_content_serves_previous_version_while_rebuilding(client):
+    from app.api.content import cache_key, remember_content_version
+    from app.extensions import cache
+    from app.singleflight import _RebuildLock
+
+    with client.application.app_context():
+        c = Course(title='StaleCourse')
+        db.session.add(c)
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='StaleLesson', content_json={"schema_version": 1}, content_version=1)
+        db.session.add(l)
+        db.session.commit()
+        lid = l.id
+
+    assert client.get(f'/api/v1/content/{lid}').get_json()['cached'] is False
+
+    with client.application.app_context():
+        # version bumped and another caller is already rebuilding v2
+        remember_content_version(lid, 2)
+        lock = _RebuildLock(cache_key(lid, 2), 10)
+        assert lock.acquire()
+        try:
+            r = client.get(f'/api/v1/content/{lid}')
+            assert r.status_code == 200
+            assert r.get_json()['cached'] is True
+            assert r.headers['ETag'] == f'"lesson-{lid}-v1"'
+        finally:
+            lock.release()
+        assert cache.get(cache_key(lid, 2)) is None
+
+    r = client.get(f'/api/v1/content/{lid}')
+    assert r.headers['ETag'] == f'"lesson-{lid}-v2"'
+    assert r.get_json()['cached'] is False
+
+
+def _seed_course_lessons(app, n=3):
+    with app.app_context():
+        c = Course(title='BatchCourse')
+        db.session.add(c)
+        db.session.commit()
+        ids = []
+        for i in range(n):
+            l = Lesson(course_id=c.id, title=f'BatchLesson{i}', content_json={"schema_version": 1, "n": i})
+            db.session.add(l)
+            db.session.commit()
+            ids.append(l.id)
+        return c.id, ids
+
+
+def test_content_batch(client):
+    client.application.config['QUERY_COUNT_HEADER'] = True
+    cid, ids = _seed_course_lessons(client.application)
+    client.get(f'/api/v1/content/{ids[0]}')  # warm one entry
+
+    qs = ','.join(str(i) for i in ids + [999999])
+    r1 = client.get(f'/api/v1/content?ids={qs}')
+    assert r1.status_code == 200
+    j1 = r1.get_json()
+    assert [item['id'] for item in j1['data']] == ids
+    assert [item['cached'] for item in j1['data']] == [True, False, False]
+    assert j1['data'][2]['data']['content_json']['n'] == 2
+    assert j1['missing'] == [999999]
+    # cold versions and cold content are each loaded with a single IN (...) query
+    assert r1.headers['X-Query-Count'] == '2'
+
+    known = ','.join(str(i) for i in ids)
+    r2 = client.get(f'/api/v1/content?ids={known}')
+    assert all(item['cached'] for item in r2.get_json()['data'])
+    assert r2.headers['X-Query-Count'] == '0'
+    assert client.get(f'/api/v1/content?ids={known}', headers={'If-None-Match': r2.headers['ETag']}).status_code == 304
+
+    r3 = client.get(f'/api/v1/courses/{cid}/content')
+    assert [item['id'] for item in r3.get_json()['data']] == ids
+    assert r3.headers['X-Query-Count'] == '1'
+
+    assert client.get('/api/v1/content?ids=1,x').status_code == 400
+
+
+def test_content_batch_bytes_mode(client):
+    client.application.config['CONTENT_CACHE_MODE'] = 'bytes'
+    cid, ids = _seed_course_lessons(client.application, 2)
+    j1 = client.get(f'/api/v1/courses/{cid}/content').get_json()
+    j2 = client.get(f'/api/v1/courses/{cid}/content').get_json()
+    assert [item['cached'] for item in j1['data']] == [False, False]
+    assert [item['cached'] for item in j2['data']] == [True, True]
+    assert j2['data'][1]['data']['content_json']['n'] == 1
+    # entries written by the batch path are valid for the single-lesson endpoint
+    assert client.get(f'/api/v1/content/{ids[1]}').get_json()['cached'] is True
+
+
+def test_content_bytes_match_jsonify(client):
+    from flask import jsonify
+    client.application.config['CONTENT_CACHE_MODE'] = 'bytes'
+    with client.application.app_context():
+        c = Course(title='JsonCourse')
+        db.session.add(c)
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='JsonLesson', content_json={"schema_version": 1, "text": "café 🚀"})
+        db.session.add(l)
+        db.session.commit()
+        lid = l.id
+    client.get(f'/api/v1/content/{lid}')
+    body = client.get(f'/api/v1/content/{lid}').data
+    with client.application.test_request_context():
+        # the spliced cache bytes escape (or keep) non-ASCII exactly like jsonify
+        assert jsonify("café 🚀").data.strip() in body
+        client.application.json.ensure_ascii = True
+        from app.api.content import encode_payload
+        assert encode_payload({"text": "café"}) == b'{"text":"caf\\u00e9"}'
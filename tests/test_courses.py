@@ -29,3 +29,87 @@ def test_courses_list(client=None):
         assert any(item['title'] == 'Test Course' for item in data['data'])
         db.session.remove()
         db.drop_all()
+
+
+def test_courses_cursor_pagination(client):
+    from datetime import datetime, timedelta
+    from app.models import Course
+    with client.application.app_context():
+        base = datetime(2025, 1, 1)
+        for i in range(5):
+            # two courses share a timestamp to exercise the id tie-breaker
+            db.session.add(Course(title=f"Cursor {i}", created_at=base + timedelta(days=min(i, 3))))
+        db.session.commit()
+
+    seen = []
+    rv = client.get('/api/v1/courses?pagination=cursor&limit=2&with_total=1')
+    js = rv.get_json()
+    assert js['meta']['total'] == 5
+    while True:
+        seen.extend(item['title'] for item in js['data'])
+        if not js['meta']['has_more']:
+            break
+        js = client.get(f"/api/v1/courses?limit=2&cursor={js['meta']['next_cursor']}").get_json()
+    assert seen == ['Cursor 4', 'Cursor 3', 'Cursor 2', 'Cursor 1', 'Cursor 0']
+    assert 'total' not in js['meta']
+
+    assert client.get('/api/v1/courses?cursor=garbage').status_code == 400
+
+
+def test_courses_search(client):
+    from app.models import Course
+    with client.application.app_context():
+        db.session.add(Course(title="Algebra Basics", description="Linear equations", tags="maths,equations", category="Maths"))
+        db.session.add(Course(title="Physics", description="Motion and algebraic models", category="Science"))
+        db.session.add(Course(title="History", description="Ancient empires", class_name="Class 8"))
+        db.session.commit()
+
+    js = client.get('/api/v1/courses?q=alg').get_json()
+    # prefix matching, title hits rank above description hits
+    assert [item['title'] for item in js['data']] == ['Algebra Basics', 'Physics']
+    assert js['meta']['total'] == 2
+
+    js = client.get('/api/v1/courses?q=algebra%20equations').get_json()
+    assert [item['title'] for item in js['data']] == ['Algebra Basics']
+    assert client.get('/api/v1/courses?q=class%208').get_json()['data'][0]['title'] == 'History'
+
+    # courses created through the admin UI are indexed immediately
+    with client.session_transaction() as sess:
+        sess['admin_user_id'] = 'dev_admin'
+    rv = client.post('/admin/create_course', data={'title': 'Geometry', 'tags': 'algebraic shapes'},
+                     headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert rv.status_code == 201
+    titles = [item['title'] for item in client.get('/api/v1/courses?q=algebra').get_json()['data']]
+    assert titles[0] == 'Algebra Basics' and 'Geometry' in titles
+
+
+def test_courses_filters_and_facets(client):
+    from app.models import Course
+    with client.application.app_context():
+        db.session.add(Course(title="Algebra", category="Maths", difficulty="beginner", class_name="Class 8", price=0, published=True, tags="equations, numbers"))
+        db.session.add(Course(title="Calculus", category="Maths", difficulty="advanced", class_name="Class 12", price=500, published=True))
+        db.session.add(Course(title="Optics", category="Science", difficulty="beginner", class_name="Class 12", price=300, published=False))
+        db.session.commit()
+
+    js = client.get('/api/v1/courses?category=Maths&facets=1').get_json()
+    assert sorted(item['title'] for item in js['data']) == ['Algebra', 'Calculus']
+    facets = js['meta']['facets']
+    # a facet ignores its own filter, the others narrow it
+    assert facets['category'] == [{"value": "Maths", "count": 2}, {"value": "Science", "count": 1}]
+    assert facets['difficulty'] == [{"value": "advanced", "count": 1}, {"value": "beginner", "count": 1}]
+
+    assert [c['title'] for c in client.get('/api/v1/courses?class=Class%2012&max_price=400').get_json()['data']] == ['Optics']
+    assert [c['title'] for c in client.get('/api/v1/courses?tags=numbers&published=true').get_json()['data']] == ['Algebra']
+    assert client.get('/api/v1/courses?q=calc&difficulty=beginner').get_json()['data'] == []
+    assert client.get('/api/v1/courses?difficulty=expert').status_code == 400
+
+    # facet counts come from the cached aggregate until a course write retires it
+    client.application.config['QUERY_COUNT_HEADER'] = True
+    rv = client.get('/api/v1/courses?facets=1&pagination=cursor')
+    assert rv.headers['X-Query-Count'] == '1'
+    with client.session_transaction() as sess:
+        sess['admin_user_id'] = 'dev_admin'
+    client.post('/admin/create_course', data={'title': 'Biology', 'category': 'Science'},
+                headers={'X-Requested-With': 'XMLHttpRequest'})
+    facets = client.get('/api/v1/courses?facets=1').get_json()['meta']['facets']
+    assert {"value": "Science", "count": 2} in facets['category']
@@ -0,0 +1,74 @@
+import io
+
+import pytest
+
+PIL = pytest.importorskip('PIL')
+from PIL import Image
+
+
+def _jpeg(width, height, orientation=None):
+    img = Image.new('RGB', (width, height), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x010f] = 'PhoneMaker'
+    if orientation:
+        exif[0x0112] = orientation
+    out = io.BytesIO()
+    img.save(out, 'JPEG', exif=exif.tobytes())
+    return out.getvalue()
+
+
+def test_upload_gets_resized_variants_without_exif(client, tmp_path):
+    from app.models import Asset
+    from app.storage import get_storage
+    client.application.config.update({'UPLOAD_PATH': str(tmp_path), 'DERIVATIVES_MODE': 'sync'})
+    # stored 1000x600 but EXIF-rotated to portrait 600x1000
+    js = client.post('/api/v1/uploads', data={'file': (io.BytesIO(_jpeg(1000, 600, orientation=6)), 'phone.jpg')},
+                     content_type='multipart/form-data').get_json()
+    assert js['derivatives_scheduled'] is True
+    asset = Asset.query.get(js['asset_id'])
+    assert (asset.width, asset.height) == (600, 1000)
+    # never upscaled: 640 and 1280 are wider than the image
+    assert sorted((v['width'], v['format']) for v in asset.variants) == [(160, 'jpeg'), (160, 'webp'), (320, 'jpeg'), (320, 'webp')]
+    small = next(v for v in asset.variants if v['width'] == 320 and v['format'] == 'jpeg')
+    assert small['url'] == '/uploads/_phone.jpg.w320.jpg' and small['height'] == 533
+    variant = Image.open(io.BytesIO(b''.join(get_storage().open('_phone.jpg.w320.jpg'))))
+    assert variant.size == (320, 533)
+    assert not variant.getexif()
+
+
+def test_catalog_returns_sized_thumbnail(client, tmp_path):
+    client.application.config.update({'UPLOAD_PATH': str(tmp_path), 'DERIVATIVES_MODE': 'sync'})
+    with client.session_transaction() as s:
+        s['admin_user_id'] = 'dev_admin'
+    rv = client.post('/admin/create_course', data={'title': 'Optics', 'thumbnail': (io.BytesIO(_jpeg(2000, 1500)), 'cover.jpg')},
+                     content_type='multipart/form-data', headers={'Accept': 'application/json'})
+    assert rv.status_code == 201
+    item = client.get('/api/v1/courses').get_json()['data'][0]
+    assert item['thumbnail_url'].endswith('_cover.jpg.w320.webp')
+    assert item['thumbnail_srcset'].count('w,') == 3
+    item = client.get('/api/v1/courses?thumb_width=500&thumb_format=jpeg').get_json()['data'][0]
+    assert item['thumbnail_url'].endswith('_cover.jpg.w640.jpg')
+
+
+def test_variants_of_originals_sharing_a_stem_do_not_collide(client, tmp_path):
+    from app.models import Asset
+    from app.storage import get_storage
+    client.application.config.update({'UPLOAD_PATH': str(tmp_path), 'DERIVATIVES_MODE': 'sync', 'DERIVATIVE_WIDTHS': '160'})
+    png = io.BytesIO()
+    Image.new('RGB', (400, 400), (0, 0, 255)).save(png, 'PNG')
+    ids = [client.post('/api/v1/uploads', data={'file': (io.BytesIO(body), name)}, content_type='multipart/form-data').get_json()['asset_id']
+           for body, name in ((_jpeg(400, 200), 'logo.jpg'), (png.getvalue(), 'logo.png'))]
+    urls = [{v['url'] for v in Asset.query.get(i).variants} for i in ids]
+    assert not urls[0] & urls[1]
+    # an upload named like a variant is stored under its own key
+    client.post('/api/v1/uploads', data={'file': (io.BytesIO(_jpeg(10, 10)), '_logo.jpg.w160.jpg')}, content_type='multipart/form-data')
+    variant = Image.open(io.BytesIO(b''.join(get_storage().open('_logo.jpg.w160.jpg'))))
+    assert variant.size == (160, 80)
+
+
+def test_render_variants_runs_in_worker_process(client):
+    from app.derivatives import _process_pool, render_variants
+    pool, _ = _process_pool(client.application)
+    result = pool.submit(render_variants, _jpeg(800, 400), [160, 1280], ['webp']).result()
+    assert (result['width'], result['height']) == (800, 400)
+    assert [(w, h, fmt) for w, h, fmt, _ in result['variants']] == [(160, 80, 'webp')]
@@ -1,5 +1,7 @@
+import pytest
+
 from app.extensions import db
-from app.models import User, Course, Lesson
+from app.models import User, Course, Lesson, Progress
 
 
 def test_submit_progress(client):
@@ -23,3 +25,272 @@ def test_submit_progress(client):
     js = rv.get_json()
     assert js.get('success') is True
     assert 'id' in js
+
+
+def test_submit_progress_batch(client):
+    with client.application.app_context():
+        u = User(email='p2@example.com')
+        u.set_password('pass')
+        c = Course(title='C2')
+        db.session.add_all([u, c])
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='L2')
+        db.session.add(l)
+        db.session.commit()
+        db.session.add(Progress(user_id=u.id, lesson_id=l.id, attempt_id="a-1"))
+        db.session.commit()
+        user_id, lesson_id = u.id, l.id
+
+    items = [
+        {"user_id": user_id, "lesson_id": lesson_id, "score": 1, "attempt_id": "a-2"},
+        {"user_id": user_id, "lesson_id": lesson_id, "attempt_id": "a-1"},
+        {"user_id": user_id, "lesson_id": lesson_id, "attempt_id": "a-2"},
+        {"user_id": "x", "lesson_id": lesson_id},
+        {"user_id": user_id, "lesson_id": 9999},
+        {"user_id": user_id, "lesson_id": lesson_id},
+    ]
+    client.application.config['QUERY_COUNT_HEADER'] = True
+    rv = client.post('/api/v1/progress/batch', json=items)
+    assert rv.status_code == 200
+    js = rv.get_json()
+    assert [r['status'] for r in js['data']] == ['created', 'duplicate', 'duplicate', 'invalid', 'invalid', 'created']
+    assert js['summary'] == {'created': 2, 'duplicate': 2, 'invalid': 2}
+    # duplicate, lesson and user lookups, one multi-row insert, the id lookup and the summary upsert
+    assert int(rv.headers['X-Query-Count']) <= 6
+    created = [r for r in js['data'] if r['status'] == 'created']
+    assert created[0]['attempt_id'] == 'a-2' and created[1]['attempt_id'].startswith('b-')
+    with client.application.app_context():
+        assert sorted((p.id, p.attempt_id) for p in Progress.query.filter(Progress.attempt_id != 'a-1')) == \
+            sorted((r['id'], r['attempt_id']) for r in created)
+
+    assert client.post('/api/v1/progress/batch', json=[]).status_code == 400
+
+
+def test_progress_batch_duplicates_are_per_user_and_lesson(client, monkeypatch):
+    with client.application.app_context():
+        u1, u2 = User(email='b1@example.com'), User(email='b2@example.com')
+        u1.set_password('pass')
+        u2.set_password('pass')
+        c = Course(title='C3')
+        db.session.add_all([u1, u2, c])
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='L3')
+        db.session.add(l)
+        db.session.commit()
+        db.session.add(Progress(user_id=u1.id, lesson_id=l.id, attempt_id="shared"))
+        db.session.commit()
+        uid1, uid2, lesson_id = u1.id, u2.id, l.id
+
+    # another user reusing the attempt_id is not a duplicate
+    js = client.post('/api/v1/progress/batch', json=[{"user_id": uid2, "lesson_id": lesson_id, "attempt_id": "shared"}]).get_json()
+    assert [r['status'] for r in js['data']] == ['created']
+
+    # an attempt stored concurrently (after the duplicate check) only marks that item, the rest is still stored
+    from app.api import progress as progress_api
+    real_query = progress_api.Progress.query
+
+    class _MissesStoredAttempts:
+        def with_entities(self, *cols):
+            return real_query.with_entities(*cols).filter(progress_api.Progress.id < 0)
+    monkeypatch.setattr(progress_api.Progress, 'query', _MissesStoredAttempts())
+    items = [{"user_id": uid1, "lesson_id": lesson_id, "attempt_id": "shared"},
+             {"user_id": uid1, "lesson_id": lesson_id, "attempt_id": "new"}]
+    rv = client.post('/api/v1/progress/batch', json=items)
+    assert rv.status_code == 200
+    assert [r['status'] for r in rv.get_json()['data']] == ['duplicate', 'created']
+
+
+def test_insert_ignore_only_skips_duplicate_keys():
+    from app.api.progress import ignored_errors
+    warnings = [('Warning', 1062, "Duplicate entry '1-2-a' for key 'uq_progress_user_lesson_attempt'"),
+                ('Warning', 1452, 'Cannot add or update a child row: a foreign key constraint fails'),
+                ('Warning', 1265, "Data truncated for column 'attempt_id' at row 2"),
+                ('Note', 1051, 'informational')]
+    assert [w[1] for w in ignored_errors(warnings)] == [1452, 1265]
+    assert ignored_errors(warnings[:1]) == []
+
+
+def test_submit_progress_duplicate_attempt(client):
+    with client.application.app_context():
+        u = User(email='p3@example.com')
+        u.set_password('pass')
+        c = Course(title='C3')
+        db.session.add_all([u, c])
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='L3')
+        db.session.add(l)
+        db.session.commit()
+        user_id, lesson_id = u.id, l.id
+
+    client.application.config['QUERY_COUNT_HEADER'] = True
+    payload = {"user_id": user_id, "lesson_id": lesson_id, "score": 0.5, "attempt_id": "exam-1"}
+    rv = client.post('/api/v1/progress', json=payload)
+    assert rv.status_code == 200 and rv.get_json()['id']
+    # no read-before-write: the insert itself detects the retry (plus the summary upsert)
+    assert rv.headers['X-Query-Count'] == '2'
+    rv = client.post('/api/v1/progress', json=payload)
+    assert rv.status_code == 409
+    assert rv.headers['X-Query-Count'] == '1'
+    # submissions without an attempt_id are never treated as retries
+    assert client.post('/api/v1/progress', json={"user_id": user_id, "lesson_id": lesson_id, "attempt_id": None}).status_code == 200
+    assert client.post('/api/v1/progress', json={"user_id": user_id, "lesson_id": lesson_id}).status_code == 200
+
+
+def test_progress_write_behind_queue(client, tmp_path):
+    from app.progress_queue import flush_once
+    app = client.application
+    app.config.update({"PROGRESS_WRITE_MODE": "queue", "PROGRESS_QUEUE_URL": None,
+                       "PROGRESS_QUEUE_PATH": str(tmp_path / "queue.sqlite"), "QUERY_COUNT_HEADER": True})
+    with app.app_context():
+        u = User(email='p4@example.com')
+        u.set_password('pass')
+        c = Course(title='C4')
+        db.session.add_all([u, c])
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='L4')
+        db.session.add(l)
+        db.session.commit()
+        user_id, lesson_id = u.id, l.id
+
+    payload = {"user_id": user_id, "lesson_id": lesson_id, "score": 1.0, "attempt_id": "quiz-1"}
+    rv = client.post('/api/v1/progress', json=payload)
+    assert rv.status_code == 202
+    assert rv.get_json()['attempt_id'] == 'quiz-1'
+    assert rv.headers['X-Query-Count'] == '0'
+    client.post('/api/v1/progress', json=payload)
+    anonymous = client.post('/api/v1/progress', json={"user_id": user_id, "lesson_id": lesson_id}).get_json()['attempt_id']
+
+    rv = client.post('/api/v1/auth/register', json={"email": "admin4@example.com", "password": "secret", "role": "admin"})
+    headers = {"Authorization": f"Bearer {rv.get_json()['access_token']}"}
+    assert client.get('/api/v1/progress/queue', headers=headers).get_json()['data']['depth'] == 3
+
+    assert flush_once() == {"flushed": 2, "duplicates": 1, "failed": 0}
+    assert flush_once() == {"flushed": 0, "duplicates": 0, "failed": 0}
+    assert sorted(p.attempt_id for p in Progress.query.all()) == sorted([anonymous, 'quiz-1'])
+    from app.models import ProgressSummary
+    assert db.session.get(ProgressSummary, (user_id, lesson_id)).attempts == 2
+    metrics = client.get('/api/v1/progress/queue', headers=headers).get_json()['data']
+    assert metrics['depth'] == 0 and metrics['total_flushed'] == 2
+
+
+def test_progress_flusher_lock_and_backoff(client, tmp_path, monkeypatch):
+    from app import progress_queue
+    app = client.application
+    app.config.update({"PROGRESS_WRITE_MODE": "queue", "PROGRESS_QUEUE_URL": None,
+                       "PROGRESS_QUEUE_PATH": str(tmp_path / "queue.sqlite"), "PROGRESS_FLUSH_INTERVAL": 0.5})
+    with app.app_context():
+        queue = progress_queue.get_progress_queue()
+        progress_queue.enqueue_progress({"user_id": 1, "lesson_id": 1, "score": 1.0})
+        # a second flusher holds the lock: nothing is peeked or trimmed
+        assert queue.acquire_lock('other', 60)
+        assert progress_queue.flush_once() is None and queue.depth() == 1
+        queue.release_lock('not-mine')
+        assert progress_queue.flush_once() is None
+        queue.release_lock('other')
+        assert queue.acquire_lock('mine', 60)
+        queue.release_lock('mine')
+
+        # a failing flush is retried with backoff instead of killing the worker
+        results = iter([RuntimeError('db down'), RuntimeError('db down'), None, {"flushed": 0, "duplicates": 0, "failed": 0}])
+        sleeps = []
+
+        def fake_flush(batch_size):
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        class Stop(Exception):
+            pass
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 4:
+                raise Stop
+
+        monkeypatch.setattr(progress_queue, 'flush_once', fake_flush)
+        monkeypatch.setattr(progress_queue.time, 'sleep', fake_sleep)
+        with pytest.raises(Stop):
+            progress_queue.run_flusher()
+        assert sleeps == [1.0, 2.0, 0.5, 0.5]
+        monkeypatch.setattr(progress_queue, 'flush_once', lambda batch_size: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            progress_queue.run_flusher(once=True)
+
+
+def test_user_progress_summary(client):
+    from app.progress_summary import rebuild_summaries
+    from app.models import ProgressSummary
+    rv = client.post('/api/v1/auth/register', json={"email": "s5@example.com", "password": "secret"})
+    student = {"Authorization": f"Bearer {rv.get_json()['access_token']}"}
+    with client.application.app_context():
+        user_id = User.query.filter_by(email='s5@example.com').first().id
+        c = Course(title='C5')
+        db.session.add(c)
+        db.session.commit()
+        lessons = [Lesson(course_id=c.id, title=f'L5-{i}') for i in range(4)]
+        db.session.add_all(lessons)
+        db.session.commit()
+        l1, l2 = lessons[0].id, lessons[1].id
+
+    client.post('/api/v1/progress', json={"user_id": user_id, "lesson_id": l1, "score": 0.4, "time_spent": 30, "attempt_id": "x1"})
+    client.post('/api/v1/progress', json={"user_id": user_id, "lesson_id": l1, "score": 0.4, "time_spent": 30, "attempt_id": "x1"})
+    client.post('/api/v1/progress/batch', json=[
+        {"user_id": user_id, "lesson_id": l1, "score": 0.9, "time_spent": 60},
+        {"user_id": user_id, "lesson_id": l2, "time_spent": 10},
+    ])
+
+    client.application.config['QUERY_COUNT_HEADER'] = True
+    rv = client.get(f'/api/v1/users/{user_id}/progress', headers=student)
+    assert rv.status_code == 200
+    assert int(rv.headers['X-Query-Count']) <= 2
+    course = rv.get_json()['data']['courses'][0]
+    assert (course['lessons_attempted'], course['lessons_total'], course['completion']) == (2, 4, 0.5)
+    first = course['lessons'][0]
+    assert (first['attempts'], first['best_score'], first['total_time_spent']) == (2, 0.9, 90)
+    assert course['lessons'][1]['best_score'] is None
+
+    # the incremental rollup matches a full rebuild
+    with client.application.app_context():
+        before = sorted((s.lesson_id, s.attempts, s.best_score, s.total_time_spent) for s in ProgressSummary.query.all())
+        assert rebuild_summaries() == 2
+        after = sorted((s.lesson_id, s.attempts, s.best_score, s.total_time_spent) for s in ProgressSummary.query.all())
+    assert before == after
+
+    assert client.get(f'/api/v1/users/{user_id + 1}/progress', headers=student).status_code == 403
+    assert client.get(f'/api/v1/users/{user_id}/progress').status_code == 401
+
+
+def test_progress_export_incremental(client, tmp_path):
+    import csv
+    import gzip
+    import json
+    app = client.application
+    with app.app_context():
+        u = User(email='p6@example.com')
+        u.set_password('pass')
+        c = Course(title='C6')
+        db.session.add_all([u, c])
+        db.session.commit()
+        l = Lesson(course_id=c.id, title='L6')
+        db.session.add(l)
+        db.session.commit()
+        db.session.add_all([Progress(user_id=u.id, lesson_id=l.id, score=i / 10, answers={"q": i}) for i in range(5)])
+        db.session.commit()
+        user_id, lesson_id = u.id, l.id
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['progress-export', '--output', str(tmp_path), '--format', 'csv', '--chunk-size', '2'])
+    assert result.exit_code == 0, result.output
+    files = sorted(tmp_path.glob('progress_*.csv.gz'))
+    with gzip.open(files[0], 'rt') as fh:
+        rows = list(csv.DictReader(fh))
+    assert [json.loads(r['answers'])['q'] for r in rows] == [0, 1, 2, 3, 4]
+
+    # second run only exports rows added since the checkpoint
+    with app.app_context():
+        db.session.add(Progress(user_id=user_id, lesson_id=lesson_id, score=1.0))
+        db.session.commit()
+    result = runner.invoke(args=['progress-export', '--output', str(tmp_path), '--format', 'csv'])
+    assert 'exported 1 rows' in result.output
+    assert 'nothing to export' in runner.invoke(args=['progress-export', '--output', str(tmp_path), '--format', 'csv']).output
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+moto = pytest.importorskip('moto')
+
+
+@pytest.fixture
+def s3_app(client, tmp_path):
+    app = client.application
+    app.config.update({
+        'S3_BUCKET': 'test-bucket', 'AWS_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing', 'UPLOAD_STAGING_PATH': str(tmp_path / 'staging'),
+        'S3_MULTIPART_THRESHOLD': 5 * 1024 * 1024,
+    })
+    with moto.mock_aws():
+        from app.s3 import get_s3
+        get_s3().client.create_bucket(Bucket='test-bucket')
+        yield client
+
+
+def test_s3_client_is_shared_and_uploads_land_in_bucket(s3_app):
+    from app.s3 import get_s3
+    s3 = get_s3()
+    assert get_s3() is s3
+    assert s3.client.meta.config.max_pool_connections == 50
+
+    body = b'\x89PNG\r\n\x1a\n' + os.urandom(2000)
+    js = s3_app.post('/api/v1/uploads/stream?filename=logo.png', data=body).get_json()
+    assert js['url'] == 'https://test-bucket.s3.amazonaws.com/uploads/logo.png'
+    assert s3.client.get_object(Bucket='test-bucket', Key='uploads/logo.png')['Body'].read() == body
+
+    rv = s3_app.post('/api/v1/uploads/presign', json={'filename': 'clip.mp4', 'content_type': 'video/mp4'})
+    assert rv.get_json()['data']['fields']['key'] == 'uploads/clip.mp4'
+
+
+def test_s3_finalized_session_uses_transfer_manager(s3_app):
+    from app.s3 import get_s3
+    # above S3_MULTIPART_THRESHOLD, so the transfer manager sends parallel parts
+    body = b'%PDF-1.7\n' + os.urandom(6 * 1024 * 1024)
+    sid = s3_app.post('/api/v1/uploads/sessions', json={'filename': 'book.pdf', 'size': len(body)}).get_json()['data']['id']
+    url = f'/api/v1/uploads/sessions/{sid}'
+    assert s3_app.patch(url, data=body, headers={'Upload-Offset': '0'}).status_code == 200
+    js = s3_app.post(url + '/finalize').get_json()
+    assert js['url'] == 'https://test-bucket.s3.amazonaws.com/uploads/book.pdf'
+    obj = get_s3().client.head_object(Bucket='test-bucket', Key='uploads/book.pdf')
+    assert obj['ContentLength'] == len(body) and obj['ContentType'] == 'application/pdf'
+    assert '-' in obj['ETag']  # multipart ETag
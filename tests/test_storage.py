@@ -0,0 +1,138 @@
+import io
+import os
+
+import pytest
+
+BACKENDS = ['local', 'memory', 's3']
+
+
+@pytest.fixture(params=BACKENDS)
+def storage(request, client, tmp_path):
+    from app.storage import get_storage
+    app = client.application
+    app.config.update({'STORAGE_BACKEND': request.param, 'UPLOAD_PATH': str(tmp_path)})
+    if request.param != 's3':
+        yield get_storage()
+        return
+    moto = pytest.importorskip('moto')
+    app.config.update({'S3_BUCKET': 'test-bucket', 'AWS_REGION': 'us-east-1',
+                       'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing'})
+    with moto.mock_aws():
+        backend = get_storage()
+        backend.s3.client.create_bucket(Bucket='test-bucket')
+        yield backend
+
+
+def test_storage_backend_contract(storage, tmp_path):
+    body = os.urandom(3000)
+    storage.put(io.BytesIO(body), 'blob.bin', 'application/octet-stream', chunk_size=1024)
+    assert storage.stat('blob.bin')['size'] == len(body)
+    assert b''.join(storage.open('blob.bin', chunk_size=1000)) == body
+    assert b''.join(storage.open('blob.bin', 100, 1099)) == body[100:1100]
+    assert b''.join(storage.open('blob.bin', 2990)) == body[2990:]
+    assert storage.key_for_url(storage.url('blob.bin')) == 'blob.bin'
+
+    staged = tmp_path / 'staged.part'
+    staged.write_bytes(b'%PDF-1.7')
+    storage.put_file(str(staged), 'doc.pdf', 'application/pdf')
+    assert not staged.exists()
+    assert b''.join(storage.open('doc.pdf')) == b'%PDF-1.7'
+
+    # an aborted writer publishes nothing
+    sink = storage.sink('partial.bin')
+    sink.open('application/octet-stream')
+    sink.write(b'x' * 10)
+    sink.abort()
+    assert not storage.exists('partial.bin')
+
+    storage.delete('blob.bin')
+    assert storage.stat('blob.bin') is None
+
+
+def test_local_put_file_across_filesystems(client, tmp_path, monkeypatch):
+    import errno
+    from app.storage import get_storage
+    client.application.config.update({'STORAGE_BACKEND': 'local', 'UPLOAD_PATH': str(tmp_path / 'uploads')})
+    storage = get_storage()
+    real_replace = os.replace
+
+    def replace(src, dst):
+        # only renames inside UPLOAD_PATH work, as with a separate volume
+        if os.path.dirname(src) != os.path.dirname(dst):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', replace)
+    staged = tmp_path / 'staged.part'
+    staged.write_bytes(b'%PDF-1.7')
+    storage.put_file(str(staged), 'doc.pdf', 'application/pdf')
+    assert not staged.exists()
+    assert b''.join(storage.open('doc.pdf')) == b'%PDF-1.7'
+    assert os.listdir(tmp_path / 'uploads') == ['doc.pdf']
+
+
+def test_uploads_go_through_memory_backend(client, tmp_path):
+    from app.storage import get_storage
+    client.application.config.update({'STORAGE_BACKEND': 'memory', 'UPLOAD_PATH': str(tmp_path)})
+    body = b'\x89PNG\r\n\x1a\n' + os.urandom(500)
+    js = client.post('/api/v1/uploads', data={'file': (io.BytesIO(body), 'm.png')}, content_type='multipart/form-data').get_json()
+    assert js['url'] == '/uploads/m.png'
+    assert get_storage().stat('m.png')['size'] == len(body)
+    assert os.listdir(tmp_path) == []
+    rv = client.get('/uploads/m.png')
+    assert (rv.status_code, rv.mimetype, rv.data) == (200, 'image/png', body)
+    assert client.get('/uploads/missing.png').status_code == 404
+    assert client.post('/api/v1/uploads/presign', json={'filename': 'a.png'}).status_code == 400
+
+
+@pytest.mark.parametrize('backend', ['local', 'memory'])
+def test_uploads_route_ranges_and_conditionals(client, tmp_path, backend):
+    from app.storage import get_storage
+    client.application.config.update({'STORAGE_BACKEND': backend, 'UPLOAD_PATH': str(tmp_path)})
+    body = os.urandom(10000)
+    get_storage().put(io.BytesIO(body), 'clip.mp4', 'video/mp4')
+
+    rv = client.get('/uploads/clip.mp4')
+    assert (rv.status_code, rv.data, rv.headers['Accept-Ranges']) == (200, body, 'bytes')
+    etag, last_modified = rv.headers['ETag'], rv.headers['Last-Modified']
+    assert 'max-age=3600' in rv.headers['Cache-Control']
+
+    assert client.get('/uploads/clip.mp4', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/uploads/clip.mp4', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    rv = client.get('/uploads/clip.mp4', headers={'Range': 'bytes=100-199'})
+    assert (rv.status_code, rv.headers['Content-Range'], rv.data) == (206, 'bytes 100-199/10000', body[100:200])
+    rv = client.get('/uploads/clip.mp4', headers={'Range': 'bytes=-500'})
+    assert (rv.status_code, rv.data) == (206, body[-500:])
+    # a stale If-Range gets the whole (changed) file instead of a mismatched slice
+    rv = client.get('/uploads/clip.mp4', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert (rv.status_code, rv.data) == (200, body)
+    rv = client.get('/uploads/clip.mp4', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert rv.status_code == 206
+    rv = client.get('/uploads/clip.mp4', headers={'Range': 'bytes=20000-'})
+    assert (rv.status_code, rv.headers['Content-Range']) == (416, 'bytes */10000')
+
+
+def test_uploads_route_offloads_to_front_end_server(client, tmp_path):
+    app = client.application
+    app.config.update({'UPLOAD_PATH': str(tmp_path), 'UPLOADS_SENDFILE': 'x-accel'})
+    rv = client.get('/uploads/talk%20notes.pdf')
+    assert rv.headers['X-Accel-Redirect'] == '/protected-uploads/talk%20notes.pdf'
+    assert (rv.data, rv.mimetype) == (b'', 'application/pdf')
+
+    app.config['UPLOADS_SENDFILE'] = 'x-sendfile'
+    rv = client.get('/uploads/a.png')
+    assert rv.headers['X-Sendfile'] == os.path.join(str(tmp_path), 'a.png') and rv.data == b''
+    assert client.get('/uploads/..%2Fsecret.txt').status_code == 404
+
+
+def test_uploads_route_never_offloads_non_local_keys(client, tmp_path):
+    from app.storage import get_storage
+    app = client.application
+    app.config.update({'STORAGE_BACKEND': 'memory', 'UPLOAD_PATH': str(tmp_path), 'UPLOADS_SENDFILE': 'x-accel'})
+    get_storage().put(io.BytesIO(b'0123456789'), 'clip.mp4', 'video/mp4')
+    # nginx has no file to send for this key: Flask streams it
+    rv = client.get('/uploads/clip.mp4', headers={'Range': 'bytes=2-4'})
+    assert 'X-Accel-Redirect' not in rv.headers
+    assert (rv.status_code, rv.data) == (206, b'234')
+    assert client.get('/uploads/missing.mp4').status_code == 404
@@ -1,3 +1,4 @@
+import hashlib
 import io
 import os
 import tempfile
@@ -17,3 +18,119 @@ def test_upload_local_file(client, tmp_path):
     # check file saved
     saved = os.path.join(client.application.config['UPLOAD_PATH'], 'test.png')
     assert os.path.exists(saved)
+
+
+def test_upload_stream_raw_body(client, tmp_path):
+    import hashlib
+    app = client.application
+    app.config.update({'UPLOAD_PATH': str(tmp_path), 'UPLOAD_CHUNK_SIZE': 64, 'UPLOAD_STREAM_MAX_SIZE': 4096})
+    body = b'\x89PNG\r\n\x1a\n' + os.urandom(1000)
+    rv = client.post('/api/v1/uploads/stream?filename=diagram.png', data=body, content_type='application/octet-stream')
+    assert rv.status_code == 200
+    js = rv.get_json()
+    assert (js['size'], js['mime_type'], js['url']) == (len(body), 'image/png', '/uploads/diagram.png')
+    assert js['sha256'] == hashlib.sha256(body).hexdigest()
+    with open(tmp_path / 'diagram.png', 'rb') as fh:
+        assert fh.read() == body
+
+    # the limit is enforced while streaming (no Content-Length to check up front); nothing is left behind
+    from app.upload_stream import LocalSink, UploadTooLarge, ingest
+    import pytest
+    with pytest.raises(UploadTooLarge):
+        ingest(io.BytesIO(body * 5), 'big.png', LocalSink(str(tmp_path), 'big.png'), max_size=4096)
+    assert client.post('/api/v1/uploads/stream?filename=big.png', data=body * 5).status_code == 413
+    assert sorted(os.listdir(tmp_path)) == ['diagram.png']
+
+    # content that is recognisably another type is rejected
+    rv = client.post('/api/v1/uploads/stream?filename=notes.png', data=b'%PDF-1.7 ...')
+    assert rv.status_code == 400
+    assert client.post('/api/v1/uploads/stream?filename=run.exe', data=b'MZ').status_code == 400
+
+
+def test_resumable_upload_session(client, tmp_path):
+    import hashlib
+    import time
+    app = client.application
+    app.config.update({'UPLOAD_PATH': str(tmp_path / 'uploads'), 'UPLOAD_STAGING_PATH': str(tmp_path / 'staging')})
+    body = b'%PDF-1.7\n' + os.urandom(3000)
+
+    rv = client.post('/api/v1/uploads/sessions', json={'filename': 'handout.pdf', 'size': len(body)})
+    assert rv.status_code == 201
+    sid = rv.get_json()['data']['id']
+    url = f'/api/v1/uploads/sessions/{sid}'
+    assert rv.headers['Location'] == url and rv.headers['Upload-Offset'] == '0'
+
+    rv = client.patch(url, data=body[:1000], headers={'Upload-Offset': '0'})
+    assert rv.status_code == 200 and rv.headers['Upload-Offset'] == '1000'
+    # a retried / out-of-order chunk is refused with the committed offset
+    rv = client.patch(url, data=body[:1000], headers={'Upload-Offset': '0'})
+    assert rv.status_code == 409 and rv.get_json()['offset'] == 1000
+    assert client.post(url + '/finalize').status_code == 409
+
+    rv = client.head(url)
+    assert (rv.status_code, rv.headers['Upload-Offset'], rv.headers['Upload-Length']) == (200, '1000', str(len(body)))
+    rv = client.patch(url, data=body[1000:], headers={'Upload-Offset': '1000'})
+    assert rv.get_json()['data']['offset'] == len(body)
+
+    rv = client.post(url + '/finalize')
+    assert rv.status_code == 200
+    js = rv.get_json()
+    assert (js['url'], js['mime_type'], js['size']) == ('/uploads/handout.pdf', 'application/pdf', len(body))
+    assert js['sha256'] == hashlib.sha256(body).hexdigest()
+    with open(tmp_path / 'uploads' / 'handout.pdf', 'rb') as fh:
+        assert fh.read() == body
+    from app.models import Asset
+    assert Asset.query.filter_by(url='/uploads/handout.pdf').count() == 1
+    assert client.head(url).status_code == 404
+    assert os.listdir(tmp_path / 'staging') == []
+
+    # abandoned sessions are garbage collected
+    rv = client.post('/api/v1/uploads/sessions', json={'filename': 'late.pdf', 'size': 10})
+    stale = time.time() - 10
+    for name in os.listdir(tmp_path / 'staging'):
+        os.utime(tmp_path / 'staging' / name, (stale, stale))
+    result = app.test_cli_runner().invoke(args=['uploads-gc', '--max-age', '5'])
+    assert 'removed 1' in result.output
+    assert os.listdir(tmp_path / 'staging') == []
+
+
+def test_duplicate_upload_reuses_asset(client, tmp_path):
+    from app.models import Asset
+    client.application.config.update({'UPLOAD_PATH': str(tmp_path), 'UPLOAD_STAGING_PATH': str(tmp_path / 'staging')})
+    body = b'GIF89a' + os.urandom(500)
+    first = client.post('/api/v1/uploads', data={'file': (io.BytesIO(body), 'a.gif')}, content_type='multipart/form-data').get_json()
+    assert first['asset_created'] is True
+    second = client.post('/api/v1/uploads/stream?filename=b.gif', data=body).get_json()
+    assert second['deduplicated'] is True
+    assert (second['asset_id'], second['url'], second['sha256']) == (first['asset_id'], '/uploads/a.gif', first['sha256'])
+    # nothing was written for the duplicate, and its staged copy is gone
+    assert sorted(os.listdir(tmp_path)) == ['a.gif', 'staging']
+    assert os.listdir(tmp_path / 'staging') == []
+    assert Asset.query.filter_by(sha256=first['sha256']).count() == 1
+
+    # other content under a.gif must not change what b.gif's uploader was given
+    other_body = b'GIF89a other'
+    other = client.post('/api/v1/uploads', data={'file': (io.BytesIO(other_body), 'a.gif')}, content_type='multipart/form-data').get_json()
+    assert other['asset_created'] is True
+    assert other['url'] == f"/uploads/{hashlib.sha256(other_body).hexdigest()[:16]}_a.gif"
+    assert client.get(second['url']).data == body
+    assert client.get(other['url']).data == other_body
+    third = client.post('/api/v1/uploads/stream?filename=c.gif', data=body).get_json()
+    assert third['deduplicated'] is True and third['url'] == '/uploads/a.gif'
+
+
+def test_duplicate_upload_never_reaches_the_backend(client, tmp_path, monkeypatch):
+    from app.storage import get_storage
+    client.application.config.update({'STORAGE_BACKEND': 'memory', 'UPLOAD_PATH': str(tmp_path),
+                                      'UPLOAD_STAGING_PATH': str(tmp_path / 'staging')})
+    storage = get_storage()
+    body = b'%PDF-1.7' + os.urandom(2000)
+    assert client.post('/api/v1/uploads/stream?filename=a.pdf', data=body).get_json()['asset_created'] is True
+
+    def no_writes(*args, **kwargs):
+        raise AssertionError('duplicate content was sent to the storage backend')
+    monkeypatch.setattr(storage, 'put_file', no_writes)
+    monkeypatch.setattr(storage, 'sink', no_writes)
+    js = client.post('/api/v1/uploads/stream?filename=b.pdf', data=body).get_json()
+    assert js['deduplicated'] is True and js['url'] == '/uploads/a.pdf'
+    assert os.listdir(tmp_path / 'staging') == []